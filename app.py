@@ -4,13 +4,18 @@ Flask Application - Yeshiva Management System
 מערכת Flask - מערכת ניהול ישיבה
 """
 
-from flask import Flask, render_template, request, jsonify, send_file, make_response, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_file, make_response, session, redirect, url_for, Response, stream_with_context
 from datetime import datetime, timedelta
 from pyluach import dates
-from services.database import YeshivaDatabase, ExamDatabase
+from services.database import YeshivaDatabase, ExamDatabase, options_json
+from services import job_queue
+from services import scan_diagnostics
+# נטען כאן, ב-main thread - הסריקה רצה בתהליכון של תור המשימות, ו-tesserocr לא נטען שם
+from services import tesseract_backend  # noqa: F401
 from functools import wraps
 import json
 import os
+import time
 import hashlib
 from werkzeug.utils import secure_filename
 
@@ -20,6 +25,8 @@ app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
 app.config['TESSERACT_PATH'] = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'yeshiva-secret-key-2024-change-in-production')
+# מאחורי nginx/Apache - השרת שולח את קבצי ה-PDF מהדיסק במקום Python
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
 
 # Default admin password (change this!)
 ADMIN_PASSWORD_HASH = hashlib.sha256(os.environ.get('ADMIN_PASSWORD', 'yeshiva123').encode()).hexdigest()
@@ -847,7 +854,7 @@ def api_add_students_bulk():
 @app.route('/api/students/import', methods=['POST'])
 @login_required
 def api_import_students():
-    """API: ייבוא תלמידים מקובץ Excel"""
+    """API: ייבוא תלמידים מקובץ Excel - הייבוא רץ ברקע ומוחזר מזהה משימה"""
     try:
         if 'file' not in request.files:
             return jsonify({'success': False, 'error': 'לא נבחר קובץ'}), 400
@@ -859,93 +866,105 @@ def api_import_students():
         if not file.filename.endswith(('.xlsx', '.xls')):
             return jsonify({'success': False, 'error': 'פורמט קובץ לא נתמך. יש להעלות קובץ Excel'}), 400
         
-        import openpyxl
-        from io import BytesIO
-        
-        # Read Excel file
-        wb = openpyxl.load_workbook(BytesIO(file.read()))
-        ws = wb.active
-        
-        # Get headers from first row
-        headers = []
-        for cell in ws[1]:
-            headers.append(str(cell.value).strip() if cell.value else '')
-        
-        # Map Hebrew headers to field names
-        header_map = {
-            'שם פרטי': 'first_name',
-            'שם משפחה': 'last_name',
-            'תעודת זהות': 'id_number',
-            'תאריך לידה': 'birth_date_hebrew',
-            'כתובת': 'address',
-            'עיר': 'city',
-            'שם האב': 'father_name',
-            'ת.ז. אב': 'father_id_number',
-            'שם האם': 'mother_name',
-            'ת.ז. אם': 'mother_id_number',
-            'טלפון אב': 'father_phone',
-            'טלפון אם': 'mother_phone',
-            'טלפון בית': 'home_phone',
-            'שיעור': 'current_grade',
-            'מסגרת': 'framework_type',
-            'הערות': 'notes'
-        }
-        
-        # Create column index map
-        col_map = {}
-        for i, header in enumerate(headers):
-            if header in header_map:
-                col_map[header_map[header]] = i
-        
-        # Check required columns
-        if 'first_name' not in col_map or 'last_name' not in col_map:
-            return jsonify({
-                'success': False, 
-                'error': 'חסרות עמודות חובה: שם פרטי, שם משפחה'
-            }), 400
-        
-        # Import students
-        added_count = 0
-        errors = []
-        
-        for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                student_data = {}
-                for field, col_idx in col_map.items():
-                    value = row[col_idx] if col_idx < len(row) else None
-                    student_data[field] = str(value).strip() if value else ''
-                
-                # Skip empty rows
-                if not student_data.get('first_name') and not student_data.get('last_name'):
-                    continue
-                
-                # Set defaults
-                if not student_data.get('current_grade'):
-                    student_data['current_grade'] = "א'"
-                if not student_data.get('framework_type'):
-                    student_data['framework_type'] = 'ישיבה קטנה'
-                
-                db.add_student(student_data)
-                added_count += 1
-                
-            except Exception as e:
-                errors.append(f"שורה {row_num}: {str(e)}")
-        
-        result = {
-            'success': True,
-            'added': added_count,
-            'message': f'נוספו {added_count} תלמידים בהצלחה'
-        }
-        
-        if errors:
-            result['errors'] = errors[:10]  # Limit errors shown
-            result['total_errors'] = len(errors)
-        
-        return jsonify(result), 201
+        filepath = save_job_upload(file)
+        job_id = job_queue.submit_job('students_import', {
+            'path': filepath,
+            'cleanup_paths': [filepath]
+        })
+        return jsonify({'success': True, 'job_id': job_id}), 202
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
+@job_queue.job_handler('students_import', max_attempts=1)
+def run_students_import(job):
+    """משימת רקע: ייבוא תלמידים מקובץ Excel (ניסיון יחיד - ייבוא חוזר היה מכפיל תלמידים)"""
+    import openpyxl
+    
+    # Read Excel file
+    wb = openpyxl.load_workbook(job.payload['path'])
+    ws = wb.active
+    
+    # Get headers from first row
+    headers = []
+    for cell in ws[1]:
+        headers.append(str(cell.value).strip() if cell.value else '')
+    
+    # Map Hebrew headers to field names
+    header_map = {
+        'שם פרטי': 'first_name',
+        'שם משפחה': 'last_name',
+        'תעודת זהות': 'id_number',
+        'תאריך לידה': 'birth_date_hebrew',
+        'כתובת': 'address',
+        'עיר': 'city',
+        'שם האב': 'father_name',
+        'ת.ז. אב': 'father_id_number',
+        'שם האם': 'mother_name',
+        'ת.ז. אם': 'mother_id_number',
+        'טלפון אב': 'father_phone',
+        'טלפון אם': 'mother_phone',
+        'טלפון בית': 'home_phone',
+        'שיעור': 'current_grade',
+        'מסגרת': 'framework_type',
+        'הערות': 'notes'
+    }
+    
+    # Create column index map
+    col_map = {}
+    for i, header in enumerate(headers):
+        if header in header_map:
+            col_map[header_map[header]] = i
+    
+    # Check required columns
+    if 'first_name' not in col_map or 'last_name' not in col_map:
+        return {
+            'success': False,
+            'error': 'חסרות עמודות חובה: שם פרטי, שם משפחה'
+        }
+    
+    # Import students
+    added_count = 0
+    errors = []
+    
+    total_rows = max(ws.max_row - 1, 0)
+    for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+        if (row_num - 2) % 20 == 0:
+            job.progress(row_num - 2, total_rows, 'מייבא תלמידים...')
+        try:
+            student_data = {}
+            for field, col_idx in col_map.items():
+                value = row[col_idx] if col_idx < len(row) else None
+                student_data[field] = str(value).strip() if value else ''
+            
+            # Skip empty rows
+            if not student_data.get('first_name') and not student_data.get('last_name'):
+                continue
+            
+            # Set defaults
+            if not student_data.get('current_grade'):
+                student_data['current_grade'] = "א'"
+            if not student_data.get('framework_type'):
+                student_data['framework_type'] = 'ישיבה קטנה'
+            
+            db.add_student(student_data)
+            added_count += 1
+            
+        except Exception as e:
+            errors.append(f"שורה {row_num}: {str(e)}")
+    
+    result = {
+        'success': True,
+        'added': added_count,
+        'message': f'נוספו {added_count} תלמידים בהצלחה'
+    }
+    
+    if errors:
+        result['errors'] = errors[:10]  # Limit errors shown
+        result['total_errors'] = len(errors)
+    
+    return result
+
 @app.route('/api/students/template')
 @login_required
 def api_download_template():
@@ -1193,7 +1212,8 @@ def api_exam_detail(exam_id):
             'question_text': q[3],
             'points': q[4],
             'question_type': q[5],
-            'correct_answer': q[6]
+            'correct_answer': q[6],
+            'options': q[8]
         } for q in questions]
     })
 
@@ -1208,6 +1228,11 @@ def api_assign_exam(exam_id):
             scheduled_date=data.get('scheduled_date'),
             version_code=data.get('version', 'A')
         )
+
+        # יצירת ה-PDFs ברקע - ההורדה אחר כך תוגש ישר מהדיסק
+        if data.get('student_ids'):
+            job_queue.submit_job('exam_pdf_pregenerate', {'exam_id': exam_id, 'student_ids': data['student_ids']})
+
         return jsonify({'success': True, 'count': len(assigned_ids)})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1328,9 +1353,10 @@ def api_update_exam(exam_id):
         questions = data.get('questions', [])
         for q in questions:
             cursor.execute('''
-                INSERT INTO exam_questions (exam_id, question_number, question_text, points, question_type, correct_answer)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (exam_id, q['question_number'], q['question_text'], q['points'], q['question_type'], q.get('correct_answer')))
+                INSERT INTO exam_questions (exam_id, question_number, question_text, points, question_type, correct_answer, options)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (exam_id, q['question_number'], q['question_text'], q['points'], q['question_type'], q.get('correct_answer'),
+                  options_json(q.get('options'))))
 
         conn.commit()
         conn.close()
@@ -1347,11 +1373,18 @@ def api_delete_exam(exam_id):
         cursor = conn.cursor()
 
         # מחיקת כל הנתונים הקשורים למבחן
-        cursor.execute('DELETE FROM question_grades WHERE student_exam_id IN (SELECT id FROM student_exams WHERE exam_id = ?)', (exam_id,))
+        cursor.execute('''
+            DELETE FROM question_grades WHERE grade_id IN (
+                SELECT eg.id FROM exam_grades eg
+                JOIN student_exams se ON eg.student_exam_id = se.id
+                WHERE se.exam_id = ?
+            )
+        ''', (exam_id,))
         cursor.execute('DELETE FROM exam_grades WHERE student_exam_id IN (SELECT id FROM student_exams WHERE exam_id = ?)', (exam_id,))
         cursor.execute('DELETE FROM student_exams WHERE exam_id = ?', (exam_id,))
         cursor.execute('DELETE FROM exam_questions WHERE exam_id = ?', (exam_id,))
         cursor.execute('DELETE FROM exam_versions WHERE exam_id = ?', (exam_id,))
+        cursor.execute('DELETE FROM exam_layouts WHERE exam_id = ?', (exam_id,))
         cursor.execute('DELETE FROM exams WHERE id = ?', (exam_id,))
 
         conn.commit()
@@ -1407,15 +1440,13 @@ def api_exam_pdf(exam_id):
         return jsonify({'error': 'student_id is required'}), 400
 
     try:
-        from services.pdf_generator import generate_exam_pdf_for_student
-        from io import BytesIO
+        from services.pdf_store import get_student_pdf_path
 
-        # יצירת ה-PDF
-        pdf_bytes = generate_exam_pdf_for_student(exam_id, int(student_id), exam_db)
+        # מהמאגר אם המבחן ופרטי התלמיד לא השתנו, אחרת נוצר עכשיו ונשמר
+        pdf_path = get_student_pdf_path(exam_id, int(student_id), exam_db)
 
-        # החזרת הקובץ
         return send_file(
-            BytesIO(pdf_bytes),
+            pdf_path,
             mimetype='application/pdf',
             as_attachment=True,
             download_name=f'exam_{exam_id}_student_{student_id}.pdf'
@@ -1425,7 +1456,7 @@ def api_exam_pdf(exam_id):
 
 @app.route('/api/exams/<int:exam_id>/pdf/batch', methods=['POST'])
 def api_exam_pdf_batch(exam_id):
-    """יצירת PDFs לכל התלמידים"""
+    """יצירת PDFs לכל התלמידים - ZIP שנבנה ברקע, מוחזר מזהה משימה"""
     data = request.json
     student_ids = data.get('student_ids', [])
 
@@ -1433,125 +1464,178 @@ def api_exam_pdf_batch(exam_id):
         return jsonify({'error': 'student_ids are required'}), 400
 
     try:
-        from services.pdf_generator import generate_batch_pdfs
-        import tempfile
-        import zipfile
-        from io import BytesIO
-        import os
-
-        # יצירת תיקייה זמנית
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # יצירת PDFs
-            pdf_files = generate_batch_pdfs(exam_id, student_ids, temp_dir, exam_db)
-
-            # יצירת ZIP
-            zip_buffer = BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                for pdf_path in pdf_files:
-                    zip_file.write(pdf_path, os.path.basename(pdf_path))
-
-            zip_buffer.seek(0)
-
-            # החזרת הקובץ
-            return send_file(
-                zip_buffer,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name=f'exam_{exam_id}_all_students.zip'
-            )
+        job_id = job_queue.submit_job('exam_pdf_batch', {'exam_id': exam_id, 'student_ids': student_ids})
+        return jsonify({'success': True, 'job_id': job_id}), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@job_queue.job_handler('exam_pdf_batch', public=True)
+def run_exam_pdf_batch(job):
+    """משימת רקע: ZIP עם PDF לכל תלמיד - נכתב לדיסק תוך כדי יצירה"""
+    from services.pdf_generator import iter_batch_pdfs
+    from services.zip_stream import stream_zip, with_error_report
+
+    exam_id = job.payload['exam_id']
+    student_ids = job.payload['student_ids']
+    pdf_entries = iter_batch_pdfs(exam_id, student_ids, exam_db)
+
+    def progress(done, filename):
+        job.progress(done, len(student_ids), filename)
+
+    zip_path = job.result_path('all_students.zip')
+    with open(zip_path, 'wb') as f:
+        for chunk in stream_zip(with_error_report(pdf_entries, progress)):
+            f.write(chunk)
+
+    return job.file_result(zip_path, f'exam_{exam_id}_all_students.zip', 'application/zip')
+
+@app.route('/api/exams/<int:exam_id>/pdf/merged', methods=['POST'])
+def api_exam_pdf_merged(exam_id):
+    """PDF אחד להדפסה עם המבחנים של כל התלמידים שהוקצו - נבנה ברקע, מוחזר מזהה משימה"""
+    try:
+        job_id = job_queue.submit_job('exam_pdf_merged', {'exam_id': exam_id})
+        return jsonify({'success': True, 'job_id': job_id}), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@job_queue.job_handler('exam_pdf_pregenerate')
+def run_exam_pdf_pregenerate(job):
+    """משימת רקע: PDFs לכל התלמידים שהוקצו, למאגר - ההורדה אחר כך מוגשת ישר מהדיסק"""
+    from services.pdf_store import pregenerate_exam_pdfs
+
+    created = pregenerate_exam_pdfs(job.payload['exam_id'], job.payload['student_ids'], exam_db,
+                                    progress=job.progress)
+    return {'created': created}
+
+@job_queue.job_handler('exam_pdf_merged', public=True)
+def run_exam_pdf_merged(job):
+    """משימת רקע: PDF כיתתי מאוחד לפי סדר הרשימה"""
+    from services.pdf_generator import generate_merged_pdf
+
+    exam_id = job.payload['exam_id']
+    job.progress(0, 1, 'יוצר PDF כיתתי...')
+    pdf_bytes = generate_merged_pdf(exam_id, exam_db)
+
+    pdf_path = job.result_path('class.pdf')
+    with open(pdf_path, 'wb') as f:
+        f.write(pdf_bytes)
+    job.progress(1, 1)
+
+    return job.file_result(pdf_path, f'exam_{exam_id}_class.pdf', 'application/pdf')
+
 # ==================== SCANNING API ====================
 
+scan_logger = scan_diagnostics.get_logger('scan_upload')
+
 @app.route('/api/exams/scan/upload', methods=['POST'])
 def api_scan_upload():
-    """העלאת קבצים לסריקה"""
-    print("\n" + "="*60)
-    print("DEBUG: API scan upload endpoint called")
-
+    """העלאת קבצים לסריקה - הקבצים נשמרים והסריקה רצה ברקע, מוחזר מזהה משימה"""
     if 'files' not in request.files:
-        print("DEBUG: No files in request")
         return jsonify({'error': 'No files provided'}), 400
 
-    files = request.files.getlist('files')
-    print(f"DEBUG: Got {len(files)} files")
+    files = [f for f in request.files.getlist('files') if f.filename != '']
 
     if not files:
-        print("DEBUG: Files list is empty")
         return jsonify({'error': 'No files provided'}), 400
 
     try:
-        from services.ocr_service import ExamOCRService
-
-        print("DEBUG: Creating OCR service...")
-        ocr = ExamOCRService(tesseract_path=app.config.get('TESSERACT_PATH'))
-        all_results = []
-
+        uploaded = []
         for file in files:
-            print(f"\nDEBUG: Processing file: {file.filename}")
-            if file.filename == '':
-                print("DEBUG: Empty filename, skipping")
-                continue
-
-            # שמירה זמנית
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            print(f"DEBUG: Saving file to: {filepath}")
-            file.save(filepath)
-            print(f"DEBUG: File saved successfully, size: {os.path.getsize(filepath)} bytes")
+            uploaded.append({
+                'path': save_job_upload(file),
+                'filename': secure_filename(file.filename)
+            })
 
-            try:
-                # עיבוד לפי סוג הקובץ
-                if filename.lower().endswith('.pdf'):
-                    print(f"DEBUG: Processing as PDF...")
-                    results = ocr.process_pdf(filepath)
-                    print(f"DEBUG: PDF processing returned {len(results)} results")
-                else:
-                    # תמונה בודדת
-                    from PIL import Image
-                    img = Image.open(filepath)
-                    result = ocr.process_single_page(img)
-                    result['file_name'] = filename
-                    results = [result]
-
-                # הוספה לתוצאות
-                for r in results:
-                    r['file_name'] = filename
-
-                    # אם יש qr_data עם student_id, שלוף את שם התלמיד מבסיס הנתונים
-                    if r.get('qr_data') and 'student_id' in r['qr_data']:
-                        student_id = r['qr_data']['student_id']
-                        exam_id = r['qr_data'].get('exam_id')
-
-                        # שליפת שם התלמיד (שם משפחה + שם פרטי)
-                        student = db.get_student(student_id)
-                        if student:
-                            r['qr_data']['student_name'] = f"{student['last_name']} {student['first_name']}"
-                        else:
-                            r['qr_data']['student_name'] = f"תלמיד #{student_id} (לא נמצא)"
-
-                        # שליפת שם המבחן
-                        if exam_id:
-                            exam = exam_db.get_exam(exam_id)
-                            if exam:
-                                r['qr_data']['exam_title'] = exam['title']
-
-                    all_results.append(r)
-
-            finally:
-                # מחיקת הקובץ הזמני
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-
-        return jsonify({'results': all_results})
+        job_id = job_queue.submit_job('scan_upload', {
+            'files': uploaded,
+            'cleanup_paths': [f['path'] for f in uploaded]
+        })
+        return jsonify({'success': True, 'job_id': job_id}), 202
 
     except Exception as e:
-        print(f"ERROR in scan upload: {e}")
-        import traceback
-        traceback.print_exc()
+        scan_logger.exception("scan_upload_failed error=%s", e)
         return jsonify({'error': str(e)}), 500
 
+def describe_scan_result(r, filename):
+    """השלמת תוצאת סריקה לתצוגה - שם הקובץ, שם התלמיד ושם המבחן מבסיס הנתונים"""
+    r['file_name'] = filename
+
+    # אם יש qr_data עם student_id, שלוף את שם התלמיד מבסיס הנתונים
+    if r.get('qr_data') and 'student_id' in r['qr_data']:
+        student_id = r['qr_data']['student_id']
+        exam_id = r['qr_data'].get('exam_id')
+
+        # שליפת שם התלמיד (שם משפחה + שם פרטי)
+        student = db.get_student(student_id)
+        if student:
+            r['qr_data']['student_name'] = f"{student['last_name']} {student['first_name']}"
+        else:
+            r['qr_data']['student_name'] = f"תלמיד #{student_id} (לא נמצא)"
+
+        # שליפת שם המבחן
+        if exam_id:
+            exam = exam_db.get_exam(exam_id)
+            if exam:
+                r['qr_data']['exam_title'] = exam['title']
+
+        # גיליון תשובות - ציון לכל שאלה כבר בתצוגה, כך שמבחן רב ברירה לא מופיע כחסר ציון
+        if exam_id and r.get('answers'):
+            from services.ocr_service import apply_answer_key
+            apply_answer_key(r, exam_db.get_answer_keys([int(exam_id)]).get(int(exam_id)))
+
+    return r
+
+@job_queue.job_handler('scan_upload', max_attempts=2)
+def run_scan_upload(job):
+    """משימת רקע: זיהוי QR וציונים בקבצים סרוקים"""
+    from services.ocr_service import ExamOCRService, qr_strategy_stats
+    from services import ocr_engine
+
+    # מוני שיטות ה-QR נשמרים במסד הנתונים של האפליקציה - ומשם הסדר משותף לכל התהליכים
+    qr_strategy_stats.set_store(ExamDatabase)
+    tesseract_path = app.config.get('TESSERACT_PATH')
+    ocr = ExamOCRService(
+        tesseract_path=tesseract_path,
+        layout_lookup=exam_db.get_exam_layout,
+        engine=ocr_engine.get_engine(tesseract_path, exam_db.get_exam_layout, exam_db.get_student_exam_identity,
+                                     ExamDatabase),
+        result_cache=exam_db,
+        qr_lookup=exam_db.get_student_exam_identity
+    )
+    files = job.payload['files']
+    all_results = []
+
+    for index, file_info in enumerate(files):
+        filepath = file_info['path']
+        filename = file_info['filename']
+        job.progress(index, len(files), filename)
+        started = time.perf_counter()
+
+        def publish(result, filename=filename):
+            # תוצאה של עמוד נשלחת ללקוח מיד, בזמן ששאר הקובץ עוד נסרק
+            describe_scan_result(result, filename)
+            job.emit('page_result', result)
+
+        # עיבוד לפי סוג הקובץ
+        if filename.lower().endswith('.pdf'):
+            results = ocr.process_pdf(filepath, on_result=publish)
+        else:
+            # תמונה בודדת
+            results = [ocr.process_image_file(filepath)]
+            publish(results[0])
+
+        scan_logger.info(
+            "scan_file_done job=%s file=%s pages=%d qr_found=%d cached=%d ms=%.0f",
+            job.id, filename, len(results), sum(1 for r in results if r.get('qr_data')),
+            sum(1 for r in results if r.get('cached')),
+            (time.perf_counter() - started) * 1000
+        )
+
+        all_results.extend(results)
+
+    job.progress(len(files), len(files))
+    return {'results': all_results}
+
 @app.route('/api/exams/scan/save', methods=['POST'])
 def api_scan_save():
     """שמירת ציונים מסריקה"""
@@ -1571,6 +1655,117 @@ def api_scan_save():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/exams/scan/stats', methods=['GET'])
+def api_scan_stats():
+    """מוני שיטות זיהוי ה-QR - פגיעות, זמן ממוצע והסדר שבו הן מנוסות"""
+    try:
+        from services.ocr_service import qr_strategy_stats
+
+        # כולל מה שתהליכי ה-OCR האחרים כבר כתבו למסד הנתונים
+        qr_strategy_stats.set_store(ExamDatabase)
+        qr_strategy_stats.flush()
+        return jsonify(qr_strategy_stats.summary())
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== BACKGROUND JOBS API ====================
+
+def save_job_upload(file):
+    """שמירת קובץ שהועלה עבור משימת רקע - שם ייחודי כדי שהעלאות במקביל לא ידרסו זו את זו"""
+    filename = secure_filename(file.filename)
+    unique_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.urandom(4).hex()}_{filename}"
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_name)
+    file.save(filepath)
+    return filepath
+
+@app.route('/api/jobs', methods=['POST'])
+@login_required
+def api_submit_job():
+    """הגשת משימת רקע שכל הנתונים שלה הם JSON (למשל exam_pdf_batch)"""
+    data = request.json or {}
+    job_type = data.get('type')
+
+    handler = job_queue.JOB_HANDLERS.get(job_type)
+    if not handler or not handler['public']:
+        return jsonify({'error': f'סוג משימה לא מוכר: {job_type}'}), 400
+
+    try:
+        job_id = job_queue.submit_job(job_type, data.get('payload', {}))
+        return jsonify({'success': True, 'job_id': job_id}), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def api_job_status(job_id):
+    """סטטוס משימת רקע"""
+    job = job_queue.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'משימה לא נמצאה'}), 404
+    return jsonify(job_queue.job_status(job))
+
+@app.route('/api/jobs/<int:job_id>/progress')
+@login_required
+def api_job_progress(job_id):
+    """התקדמות משימת רקע בלבד - לתשאול תכוף"""
+    job = job_queue.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'משימה לא נמצאה'}), 404
+    status = job_queue.job_status(job)
+    return jsonify({'id': job_id, 'status': status['status'], **status['progress']})
+
+@app.route('/api/jobs/<int:job_id>/events')
+@login_required
+def api_job_events(job_id):
+    """זרם Server-Sent Events של משימת רקע - תוצאות חלקיות והתקדמות בזמן אמת"""
+    if not job_queue.get_job(job_id):
+        return jsonify({'error': 'משימה לא נמצאה'}), 404
+
+    # בחיבור מחדש הדפדפן שולח את האירוע האחרון שקיבל
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id', '0'))
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+
+    return Response(
+        stream_with_context(job_queue.stream_events(job_id, last_event_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def api_job_cancel(job_id):
+    """ביטול משימת רקע"""
+    status = job_queue.cancel_job(job_id)
+    if status is None:
+        return jsonify({'error': 'משימה לא נמצאה'}), 404
+    return jsonify({'success': True, 'status': status})
+
+@app.route('/api/jobs/<int:job_id>/result')
+@login_required
+def api_job_result(job_id):
+    """תוצאת משימה שהסתיימה - קובץ להורדה או JSON"""
+    job = job_queue.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'משימה לא נמצאה'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': 'המשימה עדיין לא הסתיימה', 'status': job['status']}), 409
+
+    result = job['result']
+    if isinstance(result, dict) and result.get('file'):
+        if not os.path.exists(result['file']):
+            return jsonify({'error': 'קובץ התוצאה כבר נמחק'}), 410
+        return send_file(
+            result['file'],
+            mimetype=result['mimetype'],
+            as_attachment=True,
+            download_name=result['download_name']
+        )
+    return jsonify(result)
+
 # ==================== DEVELOPER FEEDBACK ====================
 
 @app.route('/feedback')
@@ -1639,5 +1834,8 @@ def not_found(error):
 def server_error(error):
     return jsonify({'error': 'שגיאה בשרת'}), 500
 
+# תהליכוני משימות הרקע - אחרי שכל סוגי המשימות נרשמו
+job_queue.start_workers()
+
 if __name__ == '__main__':
     app.run(debug=True, host='127.0.0.1', port=5000)
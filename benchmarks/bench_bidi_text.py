@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+מדידת החיסכון של מטמון ה-bidi באצוות מבחנים
+מריץ את אותן מחרוזות שנוצרות לכיתה שלמה, פעם בשיטה הישנה (בלי מטמון) ופעם דרך services.bidi_text
+
+הרצה: python benchmarks/bench_bidi_text.py [מספר תלמידים]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import bidi_text
+
+
+def legacy_prepare_hebrew_text(text):
+    """המימוש הקודם - import ו-regex בכל קריאה, בלי מטמון"""
+    if not text:
+        return text
+
+    from bidi.algorithm import get_display
+    import re
+
+    match = re.match(r'<b>(.*?):</b>\s*(.*?)$', text)
+    if match:
+        label = match.group(1).strip()
+        value = match.group(2).strip()
+        value_display = get_display(value) if value else ''
+        return f"<b>{value_display} :{get_display(label)}</b>"
+
+    text_no_tags = re.sub(r'<[^>]+>', '', text)
+    if ':' in text_no_tags:
+        parts = text_no_tags.split(':', 1)
+        label = parts[0].strip()
+        value = parts[1].strip() if len(parts) > 1 else ''
+        value_display = get_display(value) if value else ''
+        if '<b>' in text:
+            return f"<b>{value_display} :{get_display(label)}</b>"
+        return f"{value_display} :{get_display(label)}"
+
+    result = get_display(text_no_tags)
+    if '<b>' in text and '</b>' in text:
+        return f"<b>{result}</b>"
+    return result
+
+
+def batch_strings(students=40, questions=12):
+    """המחרוזות שעוברות הכנה בזמן יצירת PDF לכיתה שלמה"""
+    texts = []
+    for student in range(students):
+        texts += [
+            "מבחן",
+            "<b>שם המבחן:</b> מבחן חורף בגמרא",
+            "<b>מקצוע:</b> גמרא",
+            "<b>שיעור:</b> א'",
+            f"<b>שם התלמיד:</b> כהן משה {student}",
+            f"<b>תעודת זהות:</b> {300000000 + student}",
+            "<b>הוראות:</b>",
+            "ענו על כל השאלות בכתב ברור",
+        ]
+        for q in range(1, questions + 1):
+            texts += [
+                f"<b>שאלה {q}</b> (10 נקודות)",
+                f"מה דעת רש\"י בסוגיה מספר {q}, והאם התוספות חולקים עליו?",
+                "    1. כן",
+                "    2. לא",
+                "    3. תלוי במחלוקת",
+                "    4. אף תשובה",
+                "תשובה: _______",
+            ]
+        texts += [
+            "<b>סה\"כ נקודות במבחן: 120</b>",
+            "<b>ציון שהתקבל: ______ / 120</b>",
+        ]
+    return texts
+
+
+def measure(func, texts, rounds=3):
+    """הזמן הטוב ביותר מתוך כמה סבבים"""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    texts = batch_strings(students)
+
+    legacy = measure(legacy_prepare_hebrew_text, texts)
+
+    # מטמון קר בכל סבב - כמו אצווה ראשונה אחרי הפעלת השרת
+    bidi_text.clear_cache()
+    cached = measure(bidi_text.prepare_hebrew_text, texts, rounds=1)
+
+    print("=" * 60)
+    print(f"אצווה של {students} תלמידים - {len(texts)} מחרוזות")
+    print("=" * 60)
+    print(f"  ללא מטמון:  {legacy * 1000:8.1f} ms")
+    print(f"  עם מטמון:   {cached * 1000:8.1f} ms")
+    print(f"  חיסכון:     {(legacy - cached) * 1000:8.1f} ms ({legacy / cached:.1f}x)")
+    print(f"  מטמון: {bidi_text.cache_info()['texts']}")
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+מדידת מהירות ודיוק של צינור הסריקה על קורפוס מבחנים שנוצר מ-ExamPDFGenerator
+כל מבחן מומר לתמונה, הציון נכתב בריבועי הציון, עיגול מסומן בגיליון התשובות, ועל העמודים מופעלים פגמים מבוקרים של סורק:
+
+  clean    - בלי פגם
+  rotate   - הטיה של 1.5-3 מעלות
+  blur     - טשטוש גאוסי
+  noise    - רעש
+  jpeg     - דחיסת JPEG חזקה
+  low_dpi  - סריקה ב-150 DPI
+
+לכל שלב נבנה PDF סרוק, והצינור המלא (ExamOCRService.process_pdf) רץ עליו בתהליך נפרד - כך שהזיכרון
+המקסימלי נמדד לכל שלב לחוד. מדווחים עמודים לשנייה, זיכרון מקסימלי, אחוז זיהוי QR, אחוז ציונים נכונים,
+אחוז תשובות רב ברירה שנקראו נכון, אחוז העמודים שסומנו לבדיקה (needs_review) ואחוז הציונים השגויים שלא סומנו.
+התוצאות נשמרות ב-benchmarks/results, ומושוות לקובץ baseline.json אם קיים.
+
+הרצה: python benchmarks/bench_ocr_pipeline.py [--students 10] [--stages clean,rotate] [--processes 0]
+                                              [--seed 1] [--save-baseline]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import platform
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+BASELINE_PATH = os.path.join(RESULTS_DIR, 'baseline.json')
+
+SCAN_DPI = 300
+
+EXAM = {'id': 1, 'title': 'מבחן מדידה', 'subject': 'גמרא', 'grade': "ט'"}
+# שאלה קצרה אחת - כל המבחן בעמוד אחד, כך שה-QR ושורת הציון באותו עמוד סרוק
+QUESTIONS = [
+    {'question_number': 1, 'question_text': 'מי אמר את הדין במשנה', 'points': 100,
+     'question_type': 'multiple_choice', 'options': ['רבי מאיר', 'רבי יהודה', 'חכמים', 'רבי שמעון']},
+]
+
+# פחות מזה בדיוק או בקצב מול ה-baseline - מסומן כנסיגה
+ACCURACY_TOLERANCE = 0.02
+SPEED_TOLERANCE = 0.10
+
+
+def degrade_clean(image, rng):
+    return image, SCAN_DPI, 'png'
+
+
+def degrade_rotate(image, rng):
+    angle = rng.uniform(1.5, 3.0) * rng.choice([-1, 1])
+    h, w = image.shape
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_LINEAR, borderValue=255), SCAN_DPI, 'png'
+
+
+def degrade_blur(image, rng):
+    return cv2.GaussianBlur(image, (0, 0), 1.6), SCAN_DPI, 'png'
+
+
+def degrade_noise(image, rng):
+    noisy = image.astype(np.float32) + rng.normal(0, 25, image.shape)
+    return np.clip(noisy, 0, 255).astype(np.uint8), SCAN_DPI, 'png'
+
+
+def degrade_jpeg(image, rng):
+    return image, SCAN_DPI, 'jpeg'
+
+
+def degrade_low_dpi(image, rng):
+    h, w = image.shape
+    return cv2.resize(image, (w // 2, h // 2), interpolation=cv2.INTER_AREA), SCAN_DPI // 2, 'png'
+
+
+STAGES = {
+    'clean': degrade_clean,
+    'rotate': degrade_rotate,
+    'blur': degrade_blur,
+    'noise': degrade_noise,
+    'jpeg': degrade_jpeg,
+    'low_dpi': degrade_low_dpi,
+}
+
+
+def build_corpus(students, seed):
+    """
+    מבחנים לכל התלמידים, מומרים ל-SCAN_DPI עם ציון כתוב בריבועי הציון ועיגול מסומן בגיליון התשובות
+
+    Returns:
+        (מפת האזורים של התבנית, list של (student_id, score, answer, תמונה באפור) - עמוד לכל תלמיד)
+    """
+    from services.pdf_generator import ExamPDFGenerator
+
+    generator = ExamPDFGenerator()
+    template = generator.get_exam_template(EXAM, QUESTIONS)
+    layout = generator.layout_manifest(template)
+    boxes = layout['regions']['grade_boxes']
+    if boxes['page'] != layout['regions']['qr']['page']:
+        raise RuntimeError("המבחן של הקורפוס חייב להיות בעמוד אחד")
+    rng = random.Random(seed)
+
+    pages = []
+    for student_id in range(1, students + 1):
+        student = {'id': student_id, 'name': f'תלמיד {student_id}', 'id_number': str(100000 + student_id)}
+        pdf_bytes = generator.stamp_student_pdf(template, EXAM, student)
+
+        with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+            pix = doc[boxes['page']].get_pixmap(dpi=SCAN_DPI, colorspace=fitz.csGRAY)
+            page = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width).copy()
+
+        score = rng.randint(40, boxes['max_score'])
+        write_digits(page, boxes, score, rng)
+        grid = layout['regions']['answer_grid']
+        answer = rng.randrange(len(grid['questions'][0]['bubbles']))
+        fill_bubble(page, grid, answer, rng)
+        pages.append((student_id, score, answer, page))
+
+    return layout, pages
+
+
+def write_digits(page, boxes, score, rng):
+    """
+    כתיבת הציון בריבועים, מיושר לימין - ספרה בכל ריבוע, בגופן נטוי שלא נמצא בתבניות של המסווג,
+    בעובי, גודל ומיקום שמשתנים מספרה לספרה
+    """
+    h, w = page.shape
+    x0, y0 = boxes['x0'] * w, boxes['y0'] * h
+    box = (boxes['y1'] - boxes['y0']) * h
+    gap = ((boxes['x1'] - boxes['x0']) * w - boxes['digits'] * box) / (boxes['digits'] - 1)
+
+    digits = str(score)
+    first = boxes['digits'] - len(digits)
+    for i, digit in enumerate(digits, first):
+        scale = box / 26 * rng.uniform(0.8, 1.0)
+        left = int(x0 + i * (box + gap) + box * rng.uniform(0.2, 0.35))
+        bottom = int(y0 + box * rng.uniform(0.78, 0.85))
+        cv2.putText(page, digit, (left, bottom), cv2.FONT_HERSHEY_PLAIN | cv2.FONT_ITALIC,
+                    scale, 0, rng.randint(3, 6), cv2.LINE_AA)
+
+
+def fill_bubble(page, grid, answer, rng):
+    """מילוי העיגול של התשובה בשאלה הראשונה - בעיפרון, לא בדיוק במרכז ולא עד הקצה"""
+    h, w = page.shape
+    grid_w = (grid['x1'] - grid['x0']) * w
+    grid_h = (grid['y1'] - grid['y0']) * h
+    radius = grid['radius'] * grid_w
+    fx, fy = grid['questions'][0]['bubbles'][answer]
+    center = (int(grid['x0'] * w + fx * grid_w + rng.uniform(-0.15, 0.15) * radius),
+              int(grid['y0'] * h + fy * grid_h + rng.uniform(-0.15, 0.15) * radius))
+    cv2.circle(page, center, int(radius * rng.uniform(0.7, 0.95)), rng.randint(20, 80), -1, cv2.LINE_AA)
+
+
+def write_scanned_pdf(pages, stage, path, seed):
+    """PDF סרוק: כל עמוד הוא תמונה אחרי הפגם של השלב"""
+    rng = np.random.default_rng(seed)
+    degrade = STAGES[stage]
+
+    doc = fitz.open()
+    for _, _, _, image in pages:
+        degraded, dpi, fmt = degrade(image, rng)
+        if fmt == 'jpeg':
+            ok, encoded = cv2.imencode('.jpg', degraded, [cv2.IMWRITE_JPEG_QUALITY, 20])
+        else:
+            ok, encoded = cv2.imencode('.png', degraded)
+
+        page = doc.new_page(width=595.2756, height=841.8898)
+        page.insert_image(page.rect, stream=encoded.tobytes())
+    doc.save(path, deflate=True)
+    doc.close()
+
+
+def _layout_for(layout, exam_id, version):
+    """layout_lookup שניתן להעביר לתהליך אחר"""
+    return layout
+
+
+def run_stage(pdf_path, layout, processes):
+    """
+    הרצת הצינור המלא על PDF אחד - רץ בתהליך נפרד לכל שלב
+
+    Returns:
+        (תוצאות הסריקה, שניות, זיכרון מקסימלי ב-MB)
+    """
+    from services import ocr_engine
+    from services.ocr_service import ExamOCRService
+
+    lookup = partial(_layout_for, layout)
+    engine = ocr_engine.OCRProcessEngine(processes, layout_lookup=lookup) if processes > 1 else None
+    ocr = ExamOCRService(layout_lookup=lookup, engine=engine)
+
+    start = time.perf_counter()
+    results = ocr.process_pdf(pdf_path)
+    seconds = time.perf_counter() - start
+
+    if engine:
+        engine.shutdown()
+
+    # ru_maxrss ב-KB בלינוקס; כולל את תהליכי ה-OCR אם היו
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_kb += resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return results, seconds, peak_kb / 1024
+
+
+def score_stage(pages, results, seconds, peak_mb):
+    """השוואת התוצאות לאמת של הקורפוס"""
+    expected = {student_id: score for student_id, score, _, _ in pages}
+    expected_answers = {student_id: answer for student_id, _, answer, _ in pages}
+    qr_found = grade_correct = layout_crops = review = silent_errors = answers_correct = 0
+
+    for result in results:
+        qr_data = result.get('qr_data') or {}
+        student_id = qr_data.get('student_id')
+        if student_id in expected:
+            qr_found += 1
+            grade = result.get('grade') or {}
+            if grade.get('score') == expected[student_id]:
+                grade_correct += 1
+            elif not result.get('needs_review'):
+                # ציון שגוי שלא סומן לבדיקה - נשמר בלי שאף אחד יסתכל עליו
+                silent_errors += 1
+            answers = result.get('answers') or [{}]
+            if answers[0].get('answer') == expected_answers[student_id]:
+                answers_correct += 1
+        if result.get('needs_review'):
+            review += 1
+        if result.get('grade_region_source') in ('layout', 'digit_boxes'):
+            layout_crops += 1
+
+    total = len(pages)
+    return {
+        'pages': total,
+        'seconds': round(seconds, 2),
+        'pages_per_sec': round(total / seconds, 3) if seconds else None,
+        'peak_rss_mb': round(peak_mb, 1),
+        'qr_rate': round(qr_found / total, 3),
+        'layout_crop_rate': round(layout_crops / total, 3),
+        'grade_accuracy': round(grade_correct / total, 3),
+        'grade_accuracy_given_qr': round(grade_correct / qr_found, 3) if qr_found else 0.0,
+        'answer_accuracy': round(answers_correct / total, 3),
+        'review_rate': round(review / total, 3),
+        'silent_error_rate': round(silent_errors / total, 3)
+    }
+
+
+def environment():
+    """פרטי הסביבה לקובץ התוצאות - כדי שההשוואה תהיה בין ריצות דומות"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'cpus': os.cpu_count()}
+
+
+def compare(report, baseline):
+    """הדפסת השינויים מול ה-baseline - נסיגה בדיוק או בקצב מסומנת"""
+    print()
+    print(f"מול baseline ({baseline.get('environment', {}).get('commit')}):")
+    for stage, metrics in report['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if not before:
+            continue
+        notes = []
+        for key in ('qr_rate', 'grade_accuracy'):
+            delta = metrics[key] - before[key]
+            flag = ' !' if delta < -ACCURACY_TOLERANCE else ''
+            notes.append(f"{key} {delta:+.3f}{flag}")
+        if 'silent_error_rate' in before:
+            delta = metrics['silent_error_rate'] - before['silent_error_rate']
+            flag = ' !' if delta > ACCURACY_TOLERANCE else ''
+            notes.append(f"silent_error_rate {delta:+.3f}{flag}")
+        if before.get('pages_per_sec') and metrics.get('pages_per_sec'):
+            change = metrics['pages_per_sec'] / before['pages_per_sec'] - 1
+            flag = ' !' if change < -SPEED_TOLERANCE else ''
+            notes.append(f"pages/s {change:+.0%}{flag}")
+        notes.append(f"rss {metrics['peak_rss_mb'] - before['peak_rss_mb']:+.0f}MB")
+        print(f"  {stage:<8} " + '   '.join(notes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='מדידת מהירות ודיוק של צינור הסריקה')
+    parser.add_argument('--students', type=int, default=10)
+    parser.add_argument('--stages', default=','.join(STAGES))
+    parser.add_argument('--processes', type=int, default=0, help='תהליכי OCR (0/1 - threads)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    stages = [stage for stage in args.stages.split(',') if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"שלבים לא מוכרים: {', '.join(sorted(unknown))}")
+
+    print("=" * 60)
+    print(f"{args.students} תלמידים, שלבים: {', '.join(stages)}")
+    print("=" * 60)
+
+    layout, pages = build_corpus(args.students, args.seed)
+    workdir = tempfile.mkdtemp(prefix='bench_ocr_')
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(),
+        'config': {'students': args.students, 'seed': args.seed, 'processes': args.processes},
+        'stages': {}
+    }
+
+    print(f"  {'stage':<8} {'pages/s':>8} {'rss MB':>8} {'QR':>6} {'layout':>7} {'grade':>6} {'grade|QR':>9} {'answers':>8} {'review':>7} {'silent':>7}")
+    for stage in stages:
+        pdf_path = os.path.join(workdir, f'{stage}.pdf')
+        write_scanned_pdf(pages, stage, pdf_path, args.seed)
+
+        # תהליך חדש לכל שלב - הזיכרון המקסימלי לא נגרר משלב קודם
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            results, seconds, peak_mb = executor.submit(run_stage, pdf_path, layout, args.processes).result()
+
+        metrics = score_stage(pages, results, seconds, peak_mb)
+        report['stages'][stage] = metrics
+        print(f"  {stage:<8} {metrics['pages_per_sec']:>8.2f} {metrics['peak_rss_mb']:>8.0f} "
+              f"{metrics['qr_rate']:>6.0%} {metrics['layout_crop_rate']:>7.0%} "
+              f"{metrics['grade_accuracy']:>6.0%} {metrics['grade_accuracy_given_qr']:>9.0%} "
+              f"{metrics['answer_accuracy']:>8.0%} {metrics['review_rate']:>7.0%} {metrics['silent_error_rate']:>7.0%}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"ocr_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nנשמר: {path}")
+
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"baseline עודכן: {BASELINE_PATH}")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+מדידת זמן ה-OCR לעמוד: מנוע Tesseract שנשאר טעון מול מנוע חדש בכל קריאה
+לכל עמוד שתי קריאות כמו בסריקה - image_to_data על רצועת הציון ו-image_to_string על אזור הציון
+
+  subprocess - pytesseract, תהליך tesseract לכל קריאה (רק אם tesseract מותקן)
+  fresh      - tesserocr עם מנוע חדש לכל קריאה: טעינת traineddata בכל פעם, בלי עלות התהליך
+  resident   - services.tesseract_backend, מנוע אחד לכל thread
+
+הרצה: python benchmarks/bench_tesseract_backend.py [מספר עמודים] [שפה]
+"""
+
+import os
+import sys
+import time
+import shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFont
+
+from services import tesseract_backend
+from services.ocr_service import ExamOCRService
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts', 'ARISBL.TTF')
+GRADE_CONFIG = ExamOCRService().tesseract_config
+
+
+def grade_images(page):
+    """רצועת הציון ואזור הציון של עמוד סרוק (ב-300 DPI)"""
+    font = ImageFont.truetype(FONT_PATH, 60)
+
+    strip = Image.new('L', (2400, 300), 255)
+    draw = ImageDraw.Draw(strip)
+    draw.text((200, 40), "Total points: 100", font=font, fill=0)
+    draw.text((200, 160), f"Grade: {60 + page % 40} / 100", font=font, fill=0)
+
+    crop = Image.new('L', (900, 180), 255)
+    ImageDraw.Draw(crop).text((40, 50), f"{60 + page % 40} / 100", font=font, fill=0)
+    return strip, crop
+
+
+def run_pytesseract(strip, crop, lang):
+    """המימוש הקודם - pytesseract, תהליך לכל קריאה"""
+    import pytesseract
+    pytesseract.image_to_data(strip, output_type=pytesseract.Output.DICT, lang=lang)
+    return pytesseract.image_to_string(crop, config=GRADE_CONFIG, lang=lang)
+
+
+def run_fresh(strip, crop, lang):
+    """מנוע חדש לכל קריאה - מה ש-tesseract עושה בכל הרצה, בלי עלות יצירת התהליך"""
+    import tesserocr
+    with tesserocr.PyTessBaseAPI(lang=lang, **tessdata_kwargs()) as api:
+        api.SetImage(strip)
+        api.Recognize()
+    with tesserocr.PyTessBaseAPI(lang=lang, psm=tesserocr.PSM.SINGLE_BLOCK, **tessdata_kwargs()) as api:
+        api.SetVariable('tessedit_char_whitelist', '0123456789./')
+        api.SetImage(crop)
+        return api.GetUTF8Text()
+
+
+def run_resident(strip, crop, lang):
+    """המנוע שנשאר טעון"""
+    tesseract_backend.image_to_data(strip, lang=lang)
+    return tesseract_backend.image_to_string(crop, lang=lang, config=GRADE_CONFIG)
+
+
+def tessdata_kwargs():
+    """תיקיית tessdata מ-TESSDATA_PREFIX, אם הוגדרה"""
+    path = os.environ.get('TESSDATA_PREFIX')
+    return {'path': path} if path else {}
+
+
+def measure(func, pages, lang):
+    """זמן ממוצע לעמוד (ms) והטקסט שזוהה בעמוד האחרון"""
+    images = [grade_images(page) for page in range(pages)]
+    start = time.perf_counter()
+    text = None
+    for strip, crop in images:
+        text = func(strip, crop, lang)
+    return (time.perf_counter() - start) / pages * 1000, (text or '').strip()
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    lang = sys.argv[2] if len(sys.argv) > 2 else 'eng'
+
+    modes = []
+    if shutil.which('tesseract'):
+        modes.append(('subprocess', run_pytesseract))
+    if tesseract_backend.is_resident():
+        modes += [('fresh', run_fresh), ('resident', run_resident)]
+
+    if not modes:
+        print("לא נמצא tesseract וגם לא tesserocr - אין מה למדוד")
+        sys.exit(1)
+
+    print("=" * 60)
+    print(f"{pages} עמודים, שפה: {lang}")
+    print("=" * 60)
+
+    timings = {}
+    for name, func in modes:
+        per_page, text = measure(func, pages, lang)
+        timings[name] = per_page
+        print(f"  {name:<11} {per_page:8.1f} ms/page   ({text!r})")
+
+    if 'resident' in timings:
+        for name in ('subprocess', 'fresh'):
+            if name in timings:
+                saving = timings[name] - timings['resident']
+                print(f"  חיסכון מול {name}: {saving:.1f} ms/page ({timings[name] / timings['resident']:.1f}x)")
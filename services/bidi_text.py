@@ -0,0 +1,97 @@
+"""
+Bidi Text Preparation
+Converts logical-order Hebrew text to visual order for ReportLab, with memoization
+"""
+
+import re
+from functools import lru_cache
+
+try:
+    from bidi.algorithm import get_display
+except ImportError:
+    get_display = None
+
+# טיפול מיוחד בתבנית: <b>label:</b> value - זה הפורמט הנפוץ שלנו
+BOLD_LABEL_PATTERN = re.compile(r'<b>(.*?):</b>\s*(.*?)$')
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+# אותן תוויות ("שאלה", "מקצוע", "תשובה: _______") חוזרות אלפי פעמים באצווה
+CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def display_fragment(fragment):
+    """היפוך קטע טקסט בודד לסדר תצוגה (עם מטמון)"""
+    return get_display(fragment)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def prepare_hebrew_text(text):
+    """
+    הכנת טקסט עברי להצגה ב-PDF
+    מטפל בטקסט עם נקודתיים (label: value) וגם עם תגיות HTML
+
+    Args:
+        text: טקסט לעיבוד
+
+    Returns:
+        טקסט מעובד
+    """
+    if not text:
+        return text
+
+    if get_display is None:
+        # אם אין bidi, נחזיר כמו שהוא (לא יהיה נכון)
+        print("Warning: python-bidi not found. Hebrew text may not display correctly.")
+        return text
+
+    match = BOLD_LABEL_PATTERN.match(text)
+    if match:
+        # יש תבנית של <b>label:</b> value - הפוך כל חלק בנפרד
+        label = match.group(1).strip()
+        value = match.group(2).strip()
+
+        label_display = display_fragment(label)
+        value_display = display_fragment(value) if value else ''
+
+        # החזר בפורמט הנכון עם תגיות במקום הנכון
+        return f"<b>{value_display} :{label_display}</b>"
+
+    # אם זה לא התבנית הזו, טפל בצורה רגילה - קודם הוצא תגיות
+    text_no_tags = TAG_PATTERN.sub('', text)
+
+    # אם יש נקודתיים, טפל בתווית וערך בנפרד
+    if ':' in text_no_tags:
+        label, value = text_no_tags.split(':', 1)
+        label = label.strip()
+        value = value.strip()
+
+        label_display = display_fragment(label)
+        value_display = display_fragment(value) if value else ''
+
+        # אם יש תגיות <b> בטקסט המקורי, החזר אותן
+        if '<b>' in text:
+            return f"<b>{value_display} :{label_display}</b>"
+        return f"{value_display} :{label_display}"
+
+    # טקסט רגיל ללא נקודתיים
+    result = display_fragment(text_no_tags)
+
+    # אם יש תגיות במקור, החזר אותן
+    if '<b>' in text and '</b>' in text:
+        return f"<b>{result}</b>"
+    return result
+
+
+def cache_info():
+    """סטטיסטיקות המטמון - לבדיקות ולמדידות"""
+    return {
+        'texts': prepare_hebrew_text.cache_info()._asdict(),
+        'fragments': display_fragment.cache_info()._asdict()
+    }
+
+
+def clear_cache():
+    """ניקוי המטמון"""
+    prepare_hebrew_text.cache_clear()
+    display_fragment.cache_clear()
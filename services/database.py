@@ -4,6 +4,7 @@
 """
 
 import sqlite3
+import json
 from datetime import timedelta
 from datetime import datetime
 import os
@@ -58,6 +59,13 @@ def create_backup(db_path):
         return False
 
 
+def options_json(options):
+    """אפשרויות של שאלת רב ברירה לשמירה - ה-UI שולח JSON, קוד אחר עשוי לשלוח list"""
+    if options is None or isinstance(options, str):
+        return options
+    return json.dumps(options, ensure_ascii=False)
+
+
 class YeshivaDatabase:
     """מחלקה לניהול מסד הנתונים"""
 
@@ -306,6 +314,12 @@ class YeshivaDatabase:
             )
         ''')
 
+        # אפשרויות של שאלת רב ברירה (JSON) - correct_answer הוא האינדקס (מ-0) של התשובה הנכונה
+        try:
+            cursor.execute('ALTER TABLE exam_questions ADD COLUMN options TEXT')
+        except sqlite3.OperationalError:
+            pass  # העמודה כבר קיימת
+
         # טבלת גרסאות מבחן
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS exam_versions (
@@ -397,8 +411,42 @@ class YeshivaDatabase:
             )
         ''')
 
+        # מפת אזורים של תבנית מבחן (QR, ציון) - הסורק חותך את האזורים ישירות
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS exam_layouts (
+                exam_id INTEGER,
+                version_code TEXT DEFAULT 'A',
+                template_key TEXT,
+                manifest TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (exam_id, version_code),
+                FOREIGN KEY (exam_id) REFERENCES exams(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # מונים של שיטות זיהוי QR - הסורק מנסה קודם את השיטות שמצליחות בסורק של ההתקנה הזו
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS qr_strategy_stats (
+                strategy TEXT PRIMARY KEY,
+                attempts INTEGER DEFAULT 0,
+                hits INTEGER DEFAULT 0,
+                total_ms REAL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # מטמון תוצאות סריקה לפי SHA-256 של קובץ או עמוד - העלאה חוזרת לא סורקת שוב את מה שלא השתנה
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_cache (
+                content_hash TEXT PRIMARY KEY,
+                result TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
         # אינדקסים לביצועים
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_student_exams_student ON student_exams(student_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_scan_cache_created ON scan_cache(created_at)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_student_exams_exam ON student_exams(exam_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_student_exams_date ON student_exams(scheduled_date)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_exam_grades_student_exam ON exam_grades(student_exam_id)')
@@ -420,6 +468,42 @@ class YeshivaDatabase:
             )
         ''')
 
+        # טבלת משימות רקע - סריקות, אצוות PDF וייבוא שלא רצים בתוך הבקשה
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_type TEXT NOT NULL,
+                payload TEXT,
+                status TEXT DEFAULT 'queued',
+                progress_done INTEGER DEFAULT 0,
+                progress_total INTEGER DEFAULT 0,
+                progress_message TEXT,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER DEFAULT 0,
+                max_attempts INTEGER DEFAULT 3,
+                cancel_requested INTEGER DEFAULT 0,
+                worker_id TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                heartbeat_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)')
+
+        # אירועים של משימה (למשל תוצאה לכל עמוד סרוק) - נשלחים ללקוח בזמן שהמשימה עוד רצה
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                data TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events(job_id, id)')
+
         conn.commit()
         conn.close()
 
@@ -1265,6 +1349,298 @@ class YeshivaDatabase:
         conn.commit()
         conn.close()
 
+    # ===== משימות רקע =====
+
+    def create_job(self, job_type, payload, max_attempts=3):
+        """הוספת משימה לתור"""
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT INTO jobs (job_type, payload, max_attempts)
+            VALUES (?, ?, ?)
+        ''', (job_type, json.dumps(payload, ensure_ascii=False), max_attempts))
+
+        job_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return job_id
+
+    def get_job(self, job_id):
+        """קבלת משימה - payload ו-result מפוענחים מ-JSON"""
+        conn = sqlite3.connect(self.db_name)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        conn.close()
+
+        return self._job_from_row(row) if row else None
+
+    def claim_next_job(self, worker_id):
+        """לקיחת המשימה הבאה בתור - נעילה כדי ששני תהליכים לא ייקחו אותה משימה"""
+        conn = sqlite3.connect(self.db_name, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT id FROM jobs
+                WHERE status = 'queued' AND cancel_requested = 0
+                ORDER BY id LIMIT 1
+            ''')
+            row = cursor.fetchone()
+            if not row:
+                cursor.execute('COMMIT')
+                return None
+
+            cursor.execute('''
+                UPDATE jobs
+                SET status = 'running', worker_id = ?, attempts = attempts + 1,
+                    started_at = datetime('now'), heartbeat_at = datetime('now')
+                WHERE id = ?
+            ''', (worker_id, row['id']))
+            cursor.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],))
+            job = self._job_from_row(cursor.fetchone())
+            cursor.execute('COMMIT')
+            return job
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def update_job_progress(self, job_id, done, total, message=None):
+        """עדכון התקדמות (ודופק) - מחזיר True אם התבקש ביטול"""
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE jobs
+            SET progress_done = ?, progress_total = ?, progress_message = ?,
+                heartbeat_at = datetime('now')
+            WHERE id = ?
+        ''', (done, total, message, job_id))
+        cursor.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+
+        conn.commit()
+        conn.close()
+        return bool(row and row[0])
+
+    def heartbeat_job(self, job_id):
+        """עדכון הדופק של משימה שרצה - בלי לגעת בהתקדמות"""
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE jobs SET heartbeat_at = datetime('now')
+            WHERE id = ? AND status = 'running'
+        ''', (job_id,))
+
+        conn.commit()
+        conn.close()
+
+    def complete_job(self, job_id, result):
+        """סימון משימה שהסתיימה בהצלחה"""
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE jobs
+            SET status = 'done', result = ?, error = NULL, finished_at = datetime('now')
+            WHERE id = ?
+        ''', (json.dumps(result, ensure_ascii=False), job_id))
+
+        conn.commit()
+        conn.close()
+
+    def fail_job(self, job_id, error, retry=True):
+        """כשלון משימה - חוזרת לתור אם נשארו ניסיונות (ו-retry). מחזיר את הסטטוס החדש"""
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        retry_condition = 'attempts < max_attempts AND cancel_requested = 0' if retry else '0'
+        cursor.execute(f'''
+            UPDATE jobs
+            SET status = CASE WHEN {retry_condition} THEN 'queued' ELSE 'failed' END,
+                error = ?,
+                finished_at = CASE WHEN {retry_condition} THEN NULL ELSE datetime('now') END
+            WHERE id = ?
+        ''', (error, job_id))
+        cursor.execute('SELECT status FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+
+        conn.commit()
+        conn.close()
+        return row[0] if row else None
+
+    def cancel_job(self, job_id):
+        """ביטול משימה - משימה בתור מתבטלת מיד, משימה שרצה עוצרת בעדכון ההתקדמות הבא"""
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE jobs
+            SET status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                finished_at = CASE WHEN status = 'queued' THEN datetime('now') ELSE finished_at END,
+                cancel_requested = 1
+            WHERE id = ? AND status IN ('queued', 'running')
+        ''', (job_id,))
+        cursor.execute('SELECT status FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+
+        conn.commit()
+        conn.close()
+        return row[0] if row else None
+
+    def mark_job_cancelled(self, job_id):
+        """סימון משימה שעצרה בעקבות בקשת ביטול"""
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE jobs SET status = 'cancelled', finished_at = datetime('now')
+            WHERE id = ?
+        ''', (job_id,))
+
+        conn.commit()
+        conn.close()
+
+    def requeue_stale_jobs(self, stale_seconds):
+        """
+        שחזור אחרי קריסה - משימות 'running' שהדופק שלהן ישן מדי חוזרות לתור
+        (או נכשלות אם נגמרו הניסיונות)
+
+        Returns:
+            list של מזהי משימות שטופלו
+        """
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT id FROM jobs
+            WHERE status = 'running' AND heartbeat_at < datetime('now', ?)
+        ''', (f'-{int(stale_seconds)} seconds',))
+        job_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+
+        return self.requeue_jobs(job_ids)
+
+    def get_running_jobs(self):
+        """
+        המשימות שמסומנות כרצות ומי מריץ אותן
+
+        Returns:
+            list של (job_id, worker_id)
+        """
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT id, worker_id FROM jobs WHERE status = 'running'")
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def requeue_jobs(self, job_ids):
+        """
+        החזרת משימות שנקטעו לתור - או ביטול/כשלון אם התבקש ביטול או נגמרו הניסיונות
+
+        Returns:
+            list של מזהי המשימות שעדיין רצו וטופלו
+        """
+        if not job_ids:
+            return []
+
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        requeued = []
+        for job_id in job_ids:
+            cursor.execute('''
+                UPDATE jobs
+                SET status = CASE WHEN cancel_requested = 1 THEN 'cancelled'
+                                  WHEN attempts < max_attempts THEN 'queued'
+                                  ELSE 'failed' END,
+                    error = COALESCE(error, 'העבודה נקטעה (השרת הופעל מחדש)'),
+                    finished_at = CASE WHEN cancel_requested = 1 OR attempts >= max_attempts
+                                       THEN datetime('now') ELSE NULL END,
+                    worker_id = NULL
+                WHERE id = ? AND status = 'running'
+            ''', (job_id,))
+            if cursor.rowcount:
+                requeued.append(job_id)
+
+        conn.commit()
+        conn.close()
+        return requeued
+
+    def delete_finished_jobs(self, days):
+        """
+        מחיקת משימות שהסתיימו לפני יותר מ-days ימים
+
+        Returns:
+            list של המשימות שנמחקו (כדי לנקות קבצי תוצאה)
+        """
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT * FROM jobs
+            WHERE status IN ('done', 'failed', 'cancelled')
+              AND finished_at < datetime('now', ?)
+        ''', (f'-{int(days)} days',))
+        jobs = [self._job_from_row(row) for row in cursor.fetchall()]
+
+        cursor.executemany('DELETE FROM jobs WHERE id = ?', [(job['id'],) for job in jobs])
+        cursor.executemany('DELETE FROM job_events WHERE job_id = ?', [(job['id'],) for job in jobs])
+
+        conn.commit()
+        conn.close()
+        return jobs
+
+    def add_job_event(self, job_id, event, data):
+        """הוספת אירוע למשימה - מחזיר את מזהה האירוע"""
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT INTO job_events (job_id, event, data) VALUES (?, ?, ?)
+        ''', (job_id, event, json.dumps(data, ensure_ascii=False)))
+
+        event_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return event_id
+
+    def get_job_events(self, job_id, after_id=0):
+        """
+        אירועי משימה שנוספו אחרי after_id, לפי הסדר
+
+        Returns:
+            list של dicts עם id, event, data
+        """
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT id, event, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id
+        ''', (job_id, after_id))
+        rows = cursor.fetchall()
+        conn.close()
+
+        return [{'id': row[0], 'event': row[1], 'data': json.loads(row[2]) if row[2] else None} for row in rows]
+
+    def _job_from_row(self, row):
+        """המרת שורת משימה ל-dictionary"""
+        job = dict(row)
+        job['payload'] = json.loads(job['payload']) if job.get('payload') else {}
+        job['result'] = json.loads(job['result']) if job.get('result') else None
+        return job
+
 # ===== Exam Management Database Operations =====
 
 class ExamDatabase(YeshivaDatabase):
@@ -1347,12 +1723,12 @@ class ExamDatabase(YeshivaDatabase):
         for q in questions:
             cursor.execute('''
                 INSERT INTO exam_questions (exam_id, question_number, question_text,
-                                          points, question_type, correct_answer)
-                VALUES (?, ?, ?, ?, ?, ?)
+                                          points, question_type, correct_answer, options)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (
                 exam_id, q.get('question_number'), q.get('question_text'),
                 q.get('points', 10), q.get('question_type', 'essay'),
-                q.get('correct_answer')
+                q.get('correct_answer'), options_json(q.get('options'))
             ))
 
         conn.commit()
@@ -1446,13 +1822,21 @@ class ExamDatabase(YeshivaDatabase):
                 'date': scheduled_date
             })
 
+            # הקצאה חוזרת מעדכנת את אותה שורה - המזהה מודפס ב-QR ולכן לא משתנה
             cursor.execute('''
-                INSERT OR REPLACE INTO student_exams
+                INSERT INTO student_exams
                 (student_id, exam_id, version_id, scheduled_date, qr_code_data, status)
                 VALUES (?, ?, ?, ?, ?, 'scheduled')
+                ON CONFLICT(student_id, exam_id) DO UPDATE SET
+                    version_id = excluded.version_id,
+                    scheduled_date = excluded.scheduled_date,
+                    qr_code_data = excluded.qr_code_data,
+                    status = 'scheduled'
             ''', (student_id, exam_id, version_id, scheduled_date, qr_data))
 
-            assigned_ids.append(cursor.lastrowid)
+            cursor.execute('SELECT id FROM student_exams WHERE student_id = ? AND exam_id = ?',
+                           (student_id, exam_id))
+            assigned_ids.append(cursor.fetchone()[0])
 
         conn.commit()
         conn.close()
@@ -1488,6 +1872,283 @@ class ExamDatabase(YeshivaDatabase):
 
         return results
 
+    def get_exam_roster(self, exam_id):
+        """קבלת מזהי התלמידים שהוקצו למבחן, לפי סדר הרשימה (שם משפחה, שם פרטי)"""
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT s.id
+            FROM student_exams se
+            JOIN students s ON se.student_id = s.id
+            WHERE se.exam_id = ?
+            ORDER BY s.last_name, s.first_name
+        ''', (exam_id,))
+
+        student_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        return student_ids
+
+    def get_student_exam_ids(self, exam_id, student_ids):
+        """
+        מזהי ההקצאות (student_exams) של מבחן לכמה תלמידים
+
+        Returns:
+            dict של student_id -> student_exam_id (רק לתלמידים שהמבחן הוקצה להם)
+        """
+        if not student_ids:
+            return {}
+
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        placeholders = ','.join('?' * len(student_ids))
+        cursor.execute(f'''
+            SELECT student_id, id FROM student_exams
+            WHERE exam_id = ? AND student_id IN ({placeholders})
+        ''', [exam_id, *student_ids])
+
+        ids = dict(cursor.fetchall())
+        conn.close()
+        return ids
+
+    def get_student_exam_versions(self, exam_id, student_ids):
+        """
+        גרסת המבחן שהוקצתה לכל תלמיד - לפיה נבנית התבנית שלו ומתפרסמת מפת האזורים
+
+        Returns:
+            dict של student_id -> קוד הגרסה (רק לתלמידים שהמבחן הוקצה להם)
+        """
+        if not student_ids:
+            return {}
+
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        placeholders = ','.join('?' * len(student_ids))
+        cursor.execute(f'''
+            SELECT se.student_id, COALESCE(ev.version_code, 'A')
+            FROM student_exams se
+            LEFT JOIN exam_versions ev ON se.version_id = ev.id
+            WHERE se.exam_id = ? AND se.student_id IN ({placeholders})
+        ''', [exam_id, *student_ids])
+
+        versions = dict(cursor.fetchall())
+        conn.close()
+        return versions
+
+    def get_student_exam_identity(self, student_exam_id):
+        """
+        פרטי הקצאה לפי המזהה שב-QR - מה שהסורק צריך כדי לשייך את העמוד
+
+        Returns:
+            dict עם student_exam_id, student_id, exam_id, version ו-date, או None אם ההקצאה לא קיימת
+        """
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT se.id, se.student_id, se.exam_id, COALESCE(ev.version_code, 'A'), se.scheduled_date
+            FROM student_exams se
+            LEFT JOIN exam_versions ev ON se.version_id = ev.id
+            WHERE se.id = ?
+        ''', (student_exam_id,))
+        row = cursor.fetchone()
+        conn.close()
+
+        if not row:
+            return None
+        return {
+            'student_exam_id': row[0],
+            'student_id': row[1],
+            'exam_id': row[2],
+            'version': row[3],
+            'date': row[4]
+        }
+
+    def set_student_exam_pdf_path(self, exam_id, student_id, pdf_path):
+        """עדכון נתיב ה-PDF שנוצר מראש להקצאה - מחזיר את הנתיב הקודם"""
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT pdf_generated_path FROM student_exams
+            WHERE exam_id = ? AND student_id = ?
+        ''', (exam_id, student_id))
+        row = cursor.fetchone()
+
+        if row is None:
+            conn.close()
+            return None
+
+        if row[0] != pdf_path:
+            cursor.execute('''
+                UPDATE student_exams SET pdf_generated_path = ?
+                WHERE exam_id = ? AND student_id = ?
+            ''', (pdf_path, exam_id, student_id))
+            conn.commit()
+
+        conn.close()
+        return row[0]
+
+    def save_exam_layout(self, exam_id, version_code, template_key, manifest):
+        """שמירת מפת האזורים של תבנית מבחן - נכתבת רק כשהתבנית השתנתה"""
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT template_key FROM exam_layouts WHERE exam_id = ? AND version_code = ?
+        ''', (exam_id, version_code))
+        row = cursor.fetchone()
+
+        if not row or row[0] != template_key:
+            cursor.execute('''
+                INSERT OR REPLACE INTO exam_layouts (exam_id, version_code, template_key, manifest, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (exam_id, version_code, template_key, json.dumps(manifest), datetime.now()))
+            conn.commit()
+
+        conn.close()
+
+    def get_answer_keys(self, exam_ids):
+        """
+        מפתח התשובות של שאלות רב הברירה - לבדיקת גיליון התשובות שנסרק
+
+        Returns:
+            dict של exam_id -> {'questions': {question_number: {'id', 'correct_answer', 'points'}},
+                                'all_multiple_choice': האם כל שאלות המבחן הן רב ברירה}
+            correct_answer הוא אינדקס מ-0, או None אם לא הוגדרה תשובה נכונה
+        """
+        exam_ids = sorted(set(exam_ids))
+        if not exam_ids:
+            return {}
+
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        placeholders = ','.join('?' * len(exam_ids))
+        cursor.execute(f'''
+            SELECT exam_id, id, question_number, question_type, correct_answer, points
+            FROM exam_questions
+            WHERE exam_id IN ({placeholders})
+        ''', exam_ids)
+        rows = cursor.fetchall()
+        conn.close()
+
+        keys = {}
+        for exam_id, question_id, number, question_type, correct_answer, points in rows:
+            key = keys.setdefault(exam_id, {'questions': {}, 'all_multiple_choice': True})
+            if question_type != 'multiple_choice':
+                key['all_multiple_choice'] = False
+                continue
+            try:
+                correct_answer = int(correct_answer)
+            except (TypeError, ValueError):
+                correct_answer = None
+            key['questions'][number] = {'id': question_id, 'correct_answer': correct_answer, 'points': points or 0}
+
+        return keys
+
+    def get_exam_layout(self, exam_id, version_code='A'):
+        """קבלת מפת האזורים של תבנית מבחן, או None אם לא נוצר PDF לגרסה הזו"""
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT manifest FROM exam_layouts WHERE exam_id = ? AND version_code = ?
+        ''', (exam_id, version_code))
+        row = cursor.fetchone()
+        conn.close()
+
+        return json.loads(row[0]) if row else None
+
+    def add_qr_strategy_stats(self, deltas):
+        """
+        הוספת מונים של שיטות זיהוי QR - ההגדלה נעשית בתוך SQLite, כך שכמה תהליכים יכולים לכתוב במקביל
+
+        Args:
+            deltas: dict של strategy -> {'attempts', 'hits', 'total_ms'}
+        """
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        now = datetime.now()
+        cursor.executemany('''
+            INSERT INTO qr_strategy_stats (strategy, attempts, hits, total_ms, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(strategy) DO UPDATE SET
+                attempts = attempts + excluded.attempts,
+                hits = hits + excluded.hits,
+                total_ms = total_ms + excluded.total_ms,
+                updated_at = excluded.updated_at
+        ''', [(strategy, d['attempts'], d['hits'], d['total_ms'], now) for strategy, d in deltas.items()])
+
+        conn.commit()
+        conn.close()
+
+    def get_qr_strategy_stats(self):
+        """
+        קבלת המונים של שיטות זיהוי QR
+
+        Returns:
+            dict של strategy -> {'attempts', 'hits', 'total_ms'}
+        """
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT strategy, attempts, hits, total_ms FROM qr_strategy_stats')
+        rows = cursor.fetchall()
+        conn.close()
+
+        return {row[0]: {'attempts': row[1], 'hits': row[2], 'total_ms': row[3]} for row in rows}
+
+    def get_scan_cache(self, keys, max_age_hours):
+        """
+        קבלת תוצאות סריקה מהמטמון - רק כאלה שנשמרו בתוך max_age_hours
+
+        Args:
+            keys: מפתחות (hash של קובץ או עמוד)
+            max_age_hours: תוקף בשעות
+
+        Returns:
+            dict של key -> התוצאה השמורה
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        cursor.execute(f'''
+            SELECT content_hash, result FROM scan_cache
+            WHERE content_hash IN ({','.join('?' * len(keys))}) AND created_at >= ?
+        ''', keys + [datetime.now() - timedelta(hours=max_age_hours)])
+        rows = cursor.fetchall()
+        conn.close()
+
+        return {row[0]: json.loads(row[1]) for row in rows}
+
+    def put_scan_cache(self, entries, max_age_hours):
+        """
+        שמירת תוצאות סריקה במטמון, ומחיקת רשומות שפג תוקפן
+
+        Args:
+            entries: dict של key -> תוצאה (dict או list)
+            max_age_hours: תוקף בשעות
+        """
+        conn = sqlite3.connect(self.db_name)
+        cursor = conn.cursor()
+
+        now = datetime.now()
+        cursor.executemany('''
+            INSERT OR REPLACE INTO scan_cache (content_hash, result, created_at) VALUES (?, ?, ?)
+        ''', [(key, json.dumps(result, ensure_ascii=False), now) for key, result in entries.items()])
+        cursor.execute('DELETE FROM scan_cache WHERE created_at < ?', (now - timedelta(hours=max_age_hours),))
+
+        conn.commit()
+        conn.close()
+
     def postpone_exam(self, student_exam_id, new_date, reason):
         """דחיית מבחן"""
         conn = sqlite3.connect(self.db_name)
@@ -1551,6 +2212,126 @@ class ExamDatabase(YeshivaDatabase):
         conn.close()
         return grade_id
 
+    def save_exam_grades_bulk(self, grades, graded_by, grading_method='ocr'):
+        """
+        שמירת ציונים של הרבה תלמידים בטרנזקציה אחת
+        מבחן שכבר יש לו ציון - הציון מתעדכן ולא נוסף שני, כך ששמירה חוזרת של אותה סריקה לא משכפלת
+
+        Args:
+            grades: list של dicts עם student_id, exam_id, total_score, ocr_confidence, needs_review, notes,
+                    ו-question_grades (אופציונלי) - list של {question_id, points_earned, points_possible, feedback}
+            graded_by: שם המדרג
+            grading_method: שיטת הבדיקה
+
+        Returns:
+            dict עם saved (ציונים חדשים), updated (ציונים שעודכנו), question_grades (ציוני שאלות שנשמרו)
+            ו-missing - (student_id, exam_id) בלי שיבוץ למבחן
+        """
+        stats = {'saved': 0, 'updated': 0, 'question_grades': 0, 'missing': []}
+        if not grades:
+            return stats
+
+        exam_ids = sorted({grade['exam_id'] for grade in grades})
+        placeholders = ','.join('?' * len(exam_ids))
+
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        cursor = conn.cursor()
+
+        try:
+            # כל השיבוצים של המבחנים האלה, עם הניקוד המלא - שאילתה אחת
+            cursor.execute(f'''
+                SELECT se.student_id, se.exam_id, se.id, e.total_points
+                FROM student_exams se
+                JOIN exams e ON se.exam_id = e.id
+                WHERE se.exam_id IN ({placeholders})
+            ''', exam_ids)
+            assignments = {(row[0], row[1]): (row[2], row[3]) for row in cursor.fetchall()}
+
+            # הציון האחרון של כל שיבוץ שכבר נבדק
+            cursor.execute(f'''
+                SELECT eg.student_exam_id, MAX(eg.id)
+                FROM exam_grades eg
+                JOIN student_exams se ON eg.student_exam_id = se.id
+                WHERE se.exam_id IN ({placeholders})
+                GROUP BY eg.student_exam_id
+            ''', exam_ids)
+            existing = dict(cursor.fetchall())
+
+            now = datetime.now()
+            inserts, updates, graded = [], [], []
+            question_grades = {}
+            for grade in grades:
+                assignment = assignments.get((grade['student_id'], grade['exam_id']))
+                if not assignment:
+                    stats['missing'].append((grade['student_id'], grade['exam_id']))
+                    continue
+
+                student_exam_id, total_points = assignment
+                grade_percent = (grade['total_score'] / total_points * 100) if total_points else 0
+                values = (grade['total_score'], grade_percent, graded_by, grading_method,
+                          grade.get('ocr_confidence'), bool(grade.get('needs_review')), now, grade.get('notes'))
+
+                if student_exam_id in existing:
+                    updates.append(values + (existing[student_exam_id],))
+                else:
+                    inserts.append((student_exam_id,) + values)
+                graded.append((now.date(), student_exam_id))
+                if grade.get('question_grades') is not None:
+                    question_grades[student_exam_id] = grade['question_grades']
+
+            cursor.executemany('''
+                INSERT INTO exam_grades
+                (student_exam_id, total_score, grade_percent, graded_by,
+                 grading_method, ocr_confidence, needs_review, graded_at, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', inserts)
+            cursor.executemany('''
+                UPDATE exam_grades
+                SET total_score = ?, grade_percent = ?, graded_by = ?,
+                    grading_method = ?, ocr_confidence = ?, needs_review = ?, graded_at = ?, notes = ?
+                WHERE id = ?
+            ''', updates)
+
+            # עדכון סטטוס המבחנים
+            cursor.executemany('''
+                UPDATE student_exams
+                SET status = 'graded', actual_date = ?
+                WHERE id = ?
+            ''', graded)
+
+            # ציוני השאלות מחליפים את אלה של הבדיקה הקודמת של אותו ציון
+            if question_grades:
+                placeholders = ','.join('?' * len(question_grades))
+                cursor.execute(f'''
+                    SELECT student_exam_id, MAX(id) FROM exam_grades
+                    WHERE student_exam_id IN ({placeholders})
+                    GROUP BY student_exam_id
+                ''', list(question_grades))
+                grade_ids = dict(cursor.fetchall())
+
+                cursor.execute(f'''
+                    DELETE FROM question_grades WHERE grade_id IN ({','.join('?' * len(grade_ids))})
+                ''', list(grade_ids.values()))
+                rows = [(grade_ids[student_exam_id], q['question_id'], q['points_earned'],
+                         q['points_possible'], q.get('feedback'))
+                        for student_exam_id, questions in question_grades.items() for q in questions]
+                cursor.executemany('''
+                    INSERT INTO question_grades (grade_id, question_id, points_earned, points_possible, feedback)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows)
+                stats['question_grades'] = len(rows)
+
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        stats['saved'] = len(inserts)
+        stats['updated'] = len(updates)
+        return stats
+
     def get_student_grades(self, student_id):
         """קבלת כל הציונים של תלמיד"""
         conn = sqlite3.connect(self.db_name)
@@ -0,0 +1,179 @@
+"""
+Digit Box Classifier
+Template-matching classifier for single handwritten digits in the grade boxes - NumPy and OpenCV only
+"""
+
+import os
+import glob
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts')
+
+# ספרה מנורמלת: הדיו מוקטן ל-20 פיקסלים בצד הארוך וממורכז לפי מרכז המסה בריבוע 28x28 (כמו MNIST)
+GRID_SIZE = 28
+DIGIT_SIZE = 20
+
+# ריבוע שפחות מחלק כזה ממנו דיו נחשב ריק
+BLANK_INK_RATIO = 0.015
+
+# "טמפרטורה" להמרת דמיון (קוסינוס) לאמינות - הפרש של 0.05 בין שתי ספרות נותן בערך פי 12
+CONFIDENCE_TEMPERATURE = 0.02
+
+# גופני Hershey של OpenCV - ה-SCRIPT קרובים לכתב יד; גופני הפרויקט מוסיפים ספרות מודפסות
+HERSHEY_FONTS = (
+    cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_COMPLEX,
+    cv2.FONT_HERSHEY_TRIPLEX, cv2.FONT_HERSHEY_SCRIPT_SIMPLEX, cv2.FONT_HERSHEY_SCRIPT_COMPLEX
+)
+TEMPLATE_ANGLES = (-10, 0, 10)
+TEMPLATE_THICKNESS = (3, 6)
+
+
+def _ink_mask(cell):
+    """מסכת דיו (True = דיו) של ריבוע באפור - Otsu, עם סף שלא מסמן נייר נקי ורועש כדיו"""
+    blurred = cv2.GaussianBlur(cell, (3, 3), 0)
+    threshold, _ = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # ריבוע ריק: Otsu מפצל את הרעש של הנייר - הדיו חייב להיות כהה בבירור מהרקע
+    threshold = min(threshold, int(np.median(blurred)) - 40)
+    mask = blurred < threshold
+
+    # כתמים קטנים (רעש, אבק) לא שייכים לספרה
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+    min_area = max(4, cell.size // 400)
+    keep = np.zeros(count, dtype=bool)
+    keep[1:] = stats[1:, cv2.CC_STAT_AREA] >= min_area
+    return keep[labels]
+
+
+def normalize_digit(cell):
+    """
+    נרמול ריבוע לספרה אחת - חיתוך לדיו, הקטנה ומירכוז
+
+    Args:
+        cell: תמונת הפנים של הריבוע (numpy array באפור, בלי המסגרת)
+
+    Returns:
+        וקטור באורך GRID_SIZE² עם נורמה 1, או None אם הריבוע ריק
+    """
+    mask = _ink_mask(cell)
+    if mask.mean() < BLANK_INK_RATIO:
+        return None
+
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    digit = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1].astype(np.float32)
+
+    h, w = digit.shape
+    scale = DIGIT_SIZE / max(h, w)
+    digit = cv2.resize(digit, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+    # מירכוז לפי מרכז המסה
+    h, w = digit.shape
+    total = digit.sum()
+    cy = (digit.sum(axis=1) @ np.arange(h)) / total
+    cx = (digit.sum(axis=0) @ np.arange(w)) / total
+    top = int(round(GRID_SIZE / 2 - cy - 0.5))
+    left = int(round(GRID_SIZE / 2 - cx - 0.5))
+    top = min(max(top, 0), GRID_SIZE - h)
+    left = min(max(left, 0), GRID_SIZE - w)
+
+    grid = np.zeros((GRID_SIZE, GRID_SIZE), dtype=np.float32)
+    grid[top:top + h, left:left + w] = digit
+
+    # טשטוש - עובי הקו ותזוזה של פיקסל לא משנים את ההתאמה
+    grid = cv2.GaussianBlur(grid, (0, 0), 1.2).ravel()
+    grid -= grid.mean()
+    norm = np.linalg.norm(grid)
+    return grid / norm if norm else None
+
+
+def _rotate(image, angle):
+    h, w = image.shape
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(image, M, (w, h), borderValue=255)
+
+
+def _template_images():
+    """ספרות מצוירות בכל הגופנים, העוביים והזוויות - (ספרה, תמונה באפור)"""
+    for font in HERSHEY_FONTS:
+        for thickness in TEMPLATE_THICKNESS:
+            for digit in range(10):
+                image = np.full((96, 96), 255, dtype=np.uint8)
+                cv2.putText(image, str(digit), (22, 76), font, 2.4, 0, thickness, cv2.LINE_AA)
+                for angle in TEMPLATE_ANGLES:
+                    yield digit, _rotate(image, angle)
+
+    for path in sorted(glob.glob(os.path.join(FONTS_DIR, '*.[tT][tT][fF]'))):
+        try:
+            font = ImageFont.truetype(path, 72)
+        except OSError:
+            continue
+        for digit in range(10):
+            canvas = Image.new('L', (96, 96), 255)
+            ImageDraw.Draw(canvas).text((24, 6), str(digit), font=font, fill=0)
+            for angle in TEMPLATE_ANGLES:
+                yield digit, _rotate(np.array(canvas), angle)
+
+
+class DigitClassifier:
+    """סיווג ספרות לפי הדמיון הגבוה ביותר לכל אחת מתבניות הספרות - מכפלת מטריצות אחת לכל אצווה"""
+
+    def __init__(self):
+        vectors, labels = [], []
+        for digit, image in _template_images():
+            vector = normalize_digit(image)
+            if vector is not None:
+                vectors.append(vector)
+                labels.append(digit)
+
+        self.templates = np.stack(vectors)
+        self.labels = np.array(labels)
+
+    def classify(self, cells):
+        """
+        סיווג אצווה של ריבועים
+
+        Args:
+            cells: list של תמונות ריבוע באפור (בלי המסגרת) - מכמה ריבועים ומכמה עמודים יחד
+
+        Returns:
+            list של (ספרה או None לריבוע ריק, אמינות 0-1)
+        """
+        vectors = [normalize_digit(cell) for cell in cells]
+        filled = [i for i, vector in enumerate(vectors) if vector is not None]
+
+        # ריבוע ריק - ודאי (הדיו מתחת לסף)
+        results = [(None, 1.0)] * len(cells)
+        if not filled:
+            return results
+
+        # דמיון קוסינוס לכל התבניות, והטוב ביותר לכל ספרה
+        similarity = np.stack([vectors[i] for i in filled]) @ self.templates.T
+        scores = np.full((len(filled), 10), -1.0, dtype=np.float32)
+        for digit in range(10):
+            scores[:, digit] = similarity[:, self.labels == digit].max(axis=1)
+
+        logits = (scores - scores.max(axis=1, keepdims=True)) / CONFIDENCE_TEMPERATURE
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        for row, i in enumerate(filled):
+            digit = int(scores[row].argmax())
+            results[i] = (digit, float(probabilities[row, digit]))
+        return results
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """המסווג של התהליך - התבניות נבנות פעם אחת, בשימוש הראשון"""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = DigitClassifier()
+        return _classifier
@@ -0,0 +1,379 @@
+"""
+Background Job Queue
+Durable SQLite-backed jobs run by worker threads, so long work does not hold a request open
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+import traceback
+
+from services.database import YeshivaDatabase, get_data_path
+
+RESULTS_DIR = get_data_path('job_results')
+
+# משימה 'running' בלי דופק זמן כזה נחשבת כזו שהתהליך שלה קרס
+STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '600'))
+# כל כמה זמן משימה שרצה מעדכנת את הדופק - גם כשהיא באמצע קריאה ארוכה אחת, בלי דיווח התקדמות
+HEARTBEAT_SECONDS = max(1.0, STALE_SECONDS / 4)
+POLL_INTERVAL = 1.0
+RESULT_RETENTION_DAYS = 7
+
+# זרם אירועים (SSE): כל כמה זמן בודקים אירועים חדשים, וכל כמה זמן שולחים שורת keepalive
+STREAM_POLL_INTERVAL = 0.5
+STREAM_KEEPALIVE_SECONDS = 15
+
+JOB_HANDLERS = {}
+
+_db = None
+_workers = []
+_workers_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+class JobCancelled(Exception):
+    """נזרקת מתוך המשימה כשהמשתמש ביקש לבטל אותה"""
+
+
+def job_handler(job_type, max_attempts=3, public=False):
+    """
+    רישום פונקציה שמבצעת משימות מסוג מסוים
+
+    Args:
+        job_type: שם סוג המשימה
+        max_attempts: מספר ניסיונות לפני שהמשימה נכשלת סופית
+        public: האם מותר להגיש את המשימה דרך POST /api/jobs (payload של JSON בלבד)
+    """
+    def decorator(func):
+        JOB_HANDLERS[job_type] = {'func': func, 'max_attempts': max_attempts, 'public': public}
+        return func
+    return decorator
+
+
+class JobContext:
+    """מה שפונקציית המשימה מקבלת - פרטי המשימה, דיווח התקדמות וקבצי תוצאה"""
+
+    def __init__(self, db, job):
+        self.db = db
+        self.id = job['id']
+        self.payload = job['payload']
+        self.attempt = job['attempts']
+
+    def progress(self, done, total, message=None):
+        """דיווח התקדמות - זורק JobCancelled אם המשימה בוטלה בינתיים"""
+        if self.db.update_job_progress(self.id, done, total, message):
+            raise JobCancelled()
+
+    def emit(self, event, data):
+        """
+        פרסום אירוע ללקוחות שמאזינים למשימה (stream_events) - למשל תוצאה של עמוד אחד
+
+        Args:
+            event: שם האירוע
+            data: נתוני האירוע (JSON)
+        """
+        self.db.add_job_event(self.id, event, data)
+
+    def result_path(self, filename):
+        """נתיב לקובץ תוצאה של המשימה"""
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        return os.path.join(RESULTS_DIR, f"job_{self.id}_{filename}")
+
+    def file_result(self, path, download_name, mimetype):
+        """תוצאה שהיא קובץ להורדה דרך /api/jobs/<id>/result"""
+        return {'file': path, 'download_name': download_name, 'mimetype': mimetype}
+
+
+def _get_db():
+    global _db
+    if _db is None:
+        _db = YeshivaDatabase()
+    return _db
+
+
+def submit_job(job_type, payload):
+    """
+    הגשת משימה לתור - חוזר מיד עם מזהה המשימה
+
+    Args:
+        job_type: סוג המשימה (חייב להיות רשום ב-job_handler)
+        payload: נתוני המשימה (JSON). 'cleanup_paths' - קבצים למחיקה כשהמשימה מסתיימת
+
+    Returns:
+        מזהה המשימה
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"סוג משימה לא מוכר: {job_type}")
+
+    job_id = _get_db().create_job(job_type, payload, JOB_HANDLERS[job_type]['max_attempts'])
+    start_workers()
+    _wakeup.set()
+    return job_id
+
+
+def get_job(job_id):
+    """קבלת משימה לפי מזהה"""
+    return _get_db().get_job(job_id)
+
+
+def cancel_job(job_id):
+    """
+    ביטול משימה
+
+    Returns:
+        הסטטוס אחרי הביטול, או None אם המשימה לא קיימת
+    """
+    job = _get_db().get_job(job_id)
+    if not job:
+        return None
+
+    status = _get_db().cancel_job(job_id)
+    if status == 'cancelled':
+        _cleanup_payload(job)
+    return status
+
+
+def job_status(job):
+    """תצוגת המשימה ל-API - בלי נתיבי קבצים פנימיים"""
+    result = job.get('result')
+    has_file = bool(result and isinstance(result, dict) and result.get('file'))
+
+    return {
+        'id': job['id'],
+        'type': job['job_type'],
+        'status': job['status'],
+        'progress': {
+            'done': job['progress_done'],
+            'total': job['progress_total'],
+            'message': job['progress_message']
+        },
+        'attempts': job['attempts'],
+        'max_attempts': job['max_attempts'],
+        'error': job['error'],
+        'has_file': has_file,
+        'result': None if has_file else result,
+        'created_at': job['created_at'],
+        'finished_at': job['finished_at']
+    }
+
+
+def _sse(event, data, event_id=None):
+    """הודעת Server-Sent Events אחת"""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, ensure_ascii=False)}"]
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream_events(job_id, last_event_id=0):
+    """
+    זרם Server-Sent Events של משימה: האירועים שלה, שינויי התקדמות, ובסוף 'end' עם הסטטוס הסופי
+    האירועים נקראים ממסד הנתונים, כך שהזרם עובד גם כשהמשימה רצה בתהליך אחר
+
+    Args:
+        job_id: מזהה המשימה
+        last_event_id: האירוע האחרון שהלקוח כבר קיבל (Last-Event-ID בחיבור מחדש)
+
+    Yields:
+        מחרוזות בפורמט text/event-stream
+    """
+    db = _get_db()
+    last_progress = None
+    last_sent = time.monotonic()
+
+    # הלקוח מתחבר מחדש אוטומטית אחרי 3 שניות אם החיבור נפל
+    yield 'retry: 3000\n\n'
+
+    while True:
+        # קודם המשימה ואחר כך האירועים - כך אף אירוע שנכתב לפני הסיום לא מתפספס
+        job = db.get_job(job_id)
+        if job is None:
+            yield _sse('end', {'error': 'משימה לא נמצאה'})
+            return
+
+        for event in db.get_job_events(job_id, last_event_id):
+            last_event_id = event['id']
+            last_sent = time.monotonic()
+            yield _sse(event['event'], event['data'], event['id'])
+
+        status = job_status(job)
+        progress = (status['status'], status['progress'])
+        if progress != last_progress:
+            last_progress = progress
+            last_sent = time.monotonic()
+            yield _sse('progress', {'status': status['status'], **status['progress']})
+
+        if status['status'] in ('done', 'failed', 'cancelled'):
+            yield _sse('end', status)
+            return
+
+        if time.monotonic() - last_sent > STREAM_KEEPALIVE_SECONDS:
+            # הערה בפורמט SSE - שומרת את החיבור פתוח ומגלה לקוח שהתנתק
+            last_sent = time.monotonic()
+            yield ': keepalive\n\n'
+
+        time.sleep(STREAM_POLL_INTERVAL)
+
+
+def start_workers(count=None):
+    """
+    הפעלת תהליכוני העבודה (פעם אחת לתהליך) ושחזור משימות שנקטעו בקריסה
+
+    Args:
+        count: מספר תהליכונים (ברירת מחדל לפי JOB_WORKERS)
+    """
+    if count is None:
+        count = max(1, int(os.environ.get('JOB_WORKERS', '1')))
+
+    with _workers_lock:
+        if any(worker.is_alive() for worker in _workers):
+            return
+
+        # אין תהליכון חי בתהליך הזה - גם משימות שרשומות על ה-pid הזה (pid שחזר אחרי הפעלה מחדש) נקטעו
+        _recover(include_own_pid=True)
+
+        _workers.clear()
+        for i in range(count):
+            worker_id = f"{socket.gethostname()}:{os.getpid()}:{i}"
+            worker = threading.Thread(target=_worker_loop, args=(worker_id,), name=f'job-worker-{i}', daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def _worker_process_alive(worker_id, include_own_pid=False):
+    """
+    האם התהליך שרשום על משימה עדיין חי
+
+    Args:
+        worker_id: 'host:pid:index' מ-start_workers
+        include_own_pid: האם משימה של התהליך הנוכחי נחשבת כזו שנקטעה
+
+    Returns:
+        False רק אם בטוח שהתהליך מת (אותו מחשב ו-pid שלא קיים); משימה של מחשב אחר - לפי הדופק בלבד
+    """
+    try:
+        host, pid, _ = worker_id.rsplit(':', 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return True
+
+    if host != socket.gethostname():
+        return True
+    if pid == os.getpid():
+        return not include_own_pid
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # קיים, של משתמש אחר
+    return True
+
+
+def _recover(include_own_pid=False):
+    """החזרת משימות שנקטעו לתור וניקוי משימות ישנות"""
+    db = _get_db()
+    try:
+        # תהליך שמת במחשב הזה - לא מחכים שהדופק שלו יתיישן
+        dead = [job_id for job_id, worker_id in db.get_running_jobs()
+                if not _worker_process_alive(worker_id, include_own_pid)]
+        requeued = db.requeue_jobs(dead) + db.requeue_stale_jobs(STALE_SECONDS)
+        if requeued:
+            print(f"משימות שנקטעו הוחזרו לתור: {requeued}")
+
+        for job in db.delete_finished_jobs(RESULT_RETENTION_DAYS):
+            _remove_result_file(job)
+    except Exception as e:
+        print(f"אזהרה: שחזור משימות נכשל: {e}")
+
+
+def _worker_loop(worker_id):
+    """לולאת תהליכון עבודה - לוקח משימה מהתור, מריץ, וחוזר"""
+    db = _get_db()
+    last_recovery = time.monotonic()
+
+    while True:
+        try:
+            job = db.claim_next_job(worker_id)
+        except Exception as e:
+            print(f"אזהרה: שגיאה בקריאת תור המשימות: {e}")
+            job = None
+
+        if job is None:
+            # בזמן שקט - בודקים מדי פעם משימות של תהליכים אחרים שקרסו
+            if time.monotonic() - last_recovery > STALE_SECONDS:
+                _recover()
+                last_recovery = time.monotonic()
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+
+        _run_job(db, job)
+
+
+def _run_job(db, job):
+    """הרצת משימה אחת ועדכון הסטטוס שלה"""
+    handler = JOB_HANDLERS.get(job['job_type'])
+    if handler is None:
+        # תהליך שלא מכיר את סוג המשימה - נכשלת בלי לנסות שוב
+        db.fail_job(job['id'], f"סוג משימה לא מוכר: {job['job_type']}", retry=False)
+        return
+
+    context = JobContext(db, job)
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat_loop, args=(db, job['id'], stop_heartbeat),
+                                 name=f"job-heartbeat-{job['id']}", daemon=True)
+    heartbeat.start()
+    try:
+        # ניסיון חדש מתחיל מההתחלה - הלקוח מוחק את מה שקיבל מהניסיון הקודם
+        context.emit('started', {'attempt': job['attempts']})
+        result = handler['func'](context)
+        db.complete_job(job['id'], result)
+        _cleanup_payload(job)
+    except JobCancelled:
+        db.mark_job_cancelled(job['id'])
+        _cleanup_payload(job)
+    except ValueError as e:
+        # נתונים לא תקינים (מבחן לא קיים וכו') - ניסיון נוסף לא ישנה את התוצאה
+        db.fail_job(job['id'], str(e), retry=False)
+        _cleanup_payload(job)
+    except Exception as e:
+        traceback.print_exc()
+        status = db.fail_job(job['id'], str(e))
+        print(f"משימה {job['id']} ({job['job_type']}) נכשלה בניסיון {job['attempts']}: {e}")
+        if status != 'queued':
+            _cleanup_payload(job)
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+
+
+def _heartbeat_loop(db, job_id, stop):
+    """דופק למשימה כל עוד הפונקציה שלה רצה - כדי ש-_recover לא יחזיר אותה לתור באמצע"""
+    while not stop.wait(HEARTBEAT_SECONDS):
+        try:
+            db.heartbeat_job(job_id)
+        except Exception as e:
+            print(f"אזהרה: עדכון דופק למשימה {job_id} נכשל: {e}")
+
+
+def _cleanup_payload(job):
+    """מחיקת קבצי הקלט של משימה שהסתיימה סופית"""
+    for path in job['payload'].get('cleanup_paths', []):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            print(f"אזהרה: לא ניתן למחוק {path}: {e}")
+
+
+def _remove_result_file(job):
+    """מחיקת קובץ התוצאה של משימה שנמחקה"""
+    result = job.get('result')
+    if isinstance(result, dict) and result.get('file') and os.path.exists(result['file']):
+        try:
+            os.remove(result['file'])
+        except OSError as e:
+            print(f"אזהרה: לא ניתן למחוק {result['file']}: {e}")
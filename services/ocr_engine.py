@@ -0,0 +1,301 @@
+"""
+Process-Pool OCR Engine
+Scanned pages are processed in worker processes that each keep one ExamOCRService;
+rendered pages reach the workers through shared memory instead of being pickled
+"""
+
+import itertools
+import os
+import threading
+from functools import partial
+from multiprocessing import get_context, shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from services import ocr_service, scan_diagnostics
+from services.ocr_service import ExamOCRService, PAGE_DPI
+
+logger = scan_diagnostics.get_logger(__name__)
+
+# מספר תהליכי OCR (0 - לפי מספר הליבות). פחות מ-2 - העיבוד נשאר ב-threads בתוך התהליך
+OCR_PROCESSES = int(os.environ.get('OCR_PROCESSES', '0')) or os.cpu_count() or 1
+
+_engine = None
+_engine_lock = threading.Lock()
+
+# fitz לא בטוח לשימוש מכמה threads במקביל - וכמה משימות סריקה יכולות לרוץ יחד
+_render_lock = threading.Lock()
+
+# השירות של תהליך העבודה - נוצר פעם אחת ב-_init_worker
+_service = None
+# הסריקה שהעמוד האחרון בתהליך העבודה היה שייך לה - סריקה חדשה מרוקנת את מטמון מפות האזורים
+_scan_id = None
+# מזהי סריקות בתהליך הראשי
+_scan_ids = itertools.count()
+
+
+def _init_worker(tesseract_path, layout_lookup, qr_lookup=None, qr_stats_store=None):
+    """אתחול תהליך עבודה - שירות OCR אחד לכל חיי התהליך"""
+    global _service
+    # כל תהליך כבר מקבל ליבה משלו - threads פנימיים של OpenCV רק היו מתחרים זה בזה
+    cv2.setNumThreads(1)
+    ocr_service.qr_strategy_stats.set_store(qr_stats_store)
+    _service = ExamOCRService(tesseract_path=tesseract_path, layout_lookup=layout_lookup, qr_lookup=qr_lookup)
+
+
+def _begin_scan(scan_id):
+    """עמוד ראשון של סריקה חדשה בתהליך העבודה - מפות אזורים שפורסמו מאז נקראות מחדש"""
+    global _scan_id
+    if scan_id != _scan_id:
+        _service.clear_layouts()
+        _scan_id = scan_id
+
+
+def _flush_stats():
+    """כתיבת מוני שיטות זיהוי ה-QR אחרי כל עמוד - תהליך עבודה נסגר בלי להריץ atexit"""
+    ocr_service.qr_strategy_stats.flush()
+
+
+def _render_page_in_worker(pdf_path, page_num, dpi):
+    """המרת עמוד ברזולוציה גבוהה יותר בתוך תהליך העבודה - רק לעמודים שה-QR שלהם לא זוהה"""
+    doc = fitz.open(pdf_path)
+    try:
+        return _service._render_pdf_page(doc, page_num, dpi, threading.Lock())
+    finally:
+        doc.close()
+
+
+def _process_shared_page(shm_name, shape, pdf_path, page_num, page_dpi, scan_id=None):
+    """
+    עיבוד עמוד PDF שהומר בתהליך הראשי - התמונה נקראת ישירות מהזיכרון המשותף, בלי העתקה
+
+    Args:
+        shm_name: שם בלוק הזיכרון המשותף
+        shape: מימדי התמונה (גובה, רוחב, ערוצים)
+        pdf_path: נתיב ה-PDF - להמרה מחדש ברזולוציה גבוהה אם ה-QR לא זוהה
+        page_num: מספר עמוד (מ-0)
+        page_dpi: הרזולוציה של התמונה
+        scan_id: מזהה הסריקה בתהליך הראשי
+
+    Returns:
+        dict עם התוצאות
+    """
+    _begin_scan(scan_id)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    image = None
+    try:
+        image = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        result = _service.process_single_page(image, page_dpi, partial(_render_page_in_worker, pdf_path, page_num))
+    finally:
+        # אסור שיישארו הפניות לזיכרון המשותף לפני close
+        image = None
+        shm.close()
+
+    result['page_number'] = page_num + 1
+    _flush_stats()
+    return result
+
+
+def _process_image_file(path, scan_id=None):
+    """עיבוד קובץ תמונה - נטען בתוך תהליך העבודה, כך שהתמונה לא עוברת בין תהליכים בכלל"""
+    _begin_scan(scan_id)
+    with Image.open(path) as img:
+        result = _service.process_single_page(img)
+    result['file_path'] = path
+    _flush_stats()
+    return result
+
+
+class OCRProcessEngine:
+    """מאגר תהליכים לעיבוד עמודים סרוקים - עוקף את ה-GIL ומתרחב לפי מספר הליבות"""
+
+    def __init__(self, processes, tesseract_path=None, layout_lookup=None, qr_lookup=None, qr_stats_store=None):
+        """
+        Args:
+            processes: מספר תהליכי עבודה
+            tesseract_path: נתיב ל-tesseract executable (אופציונלי)
+            layout_lookup: פונקציה (exam_id, version) -> מפת אזורים (חייבת להיות ניתנת ל-pickle)
+            qr_lookup: פונקציה student_exam_id -> פרטי ההקצאה (חייבת להיות ניתנת ל-pickle)
+            qr_stats_store: פונקציה שמחזירה את מסד הנתונים של מוני שיטות ה-QR (None - בלי שמירה, ניתנת ל-pickle)
+        """
+        self.processes = processes
+        self.broken = False
+        # spawn ולא fork - בתהליך הראשי רצים threads (gunicorn, תור המשימות) ו-fork איתם לא בטוח
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(tesseract_path, layout_lookup, qr_lookup, qr_stats_store)
+        )
+
+    def _render_to_shared_memory(self, doc, page_num):
+        """
+        המרת עמוד PDF ישירות לבלוק זיכרון משותף
+
+        Returns:
+            tuple של (SharedMemory, מימדי התמונה)
+        """
+        zoom = PAGE_DPI / 72
+        with _render_lock:
+            pix = doc[page_num].get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+            shape = (pix.height, pix.width, pix.n)
+            shm = shared_memory.SharedMemory(create=True, size=pix.height * pix.width * pix.n)
+
+            page = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            rows = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+            page[:] = rows[:, :pix.width * pix.n].reshape(shape)
+            page = rows = pix = None
+
+            fitz.TOOLS.store_shrink(100)
+
+        return shm, shape
+
+    @staticmethod
+    def _release_page(shm, in_flight, future):
+        """שחרור בלוק הזיכרון של עמוד שעיבודו הסתיים"""
+        shm.close()
+        shm.unlink()
+        in_flight.release()
+
+    def _result(self, future, fallback):
+        """תוצאת עמוד, או תוצאת כשלון אם תהליך העבודה נפל"""
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            self.broken = True
+            return fallback(f'OCR worker crashed: {str(e)}')
+        except Exception as e:
+            return fallback(f'Page processing failed: {str(e)}')
+
+    def process_pdf_pages(self, pdf_path, page_numbers=None, on_result=None):
+        """
+        סריקת עמודי PDF בתהליכי העבודה
+        העמודים מומרים בתהליך הראשי רק כשיש מקום - לכל היותר processes + PAGE_QUEUE_SIZE עמודים בזיכרון
+
+        Args:
+            pdf_path: נתיב לקובץ PDF
+            page_numbers: העמודים לסריקה (מ-0, ברירת מחדל - כולם)
+            on_result: פונקציה שנקראת עם תוצאת כל עמוד כשהיא מוכנה (אופציונלי)
+
+        Returns:
+            list של תוצאות לכל עמוד, לפי סדר העמודים
+        """
+        in_flight = threading.BoundedSemaphore(self.processes + ExamOCRService.PAGE_QUEUE_SIZE)
+        scan_id = next(_scan_ids)
+        pending = []
+        results = []
+
+        def add_result(result):
+            results.append(result)
+            if on_result:
+                try:
+                    on_result(result)
+                except Exception as e:
+                    # תקלה בדיווח לא עוצרת את הסריקה
+                    logger.warning("on_result_failed page=%s error=%s", result.get('page_number'), e)
+
+        def collect(wait):
+            # עמודים שהסתיימו - בלי לחכות לסוף הקובץ; wait - גם כל מה שעוד רץ
+            for item in list(pending):
+                page_num, future = item
+                if wait or future.done():
+                    pending.remove(item)
+                    add_result(self._result(future, partial(ExamOCRService.failed_page_result, page_num)))
+
+        doc = fitz.open(pdf_path)
+        try:
+            if page_numbers is None:
+                page_numbers = range(len(doc))
+
+            for page_num in page_numbers:
+                in_flight.acquire()
+                try:
+                    shm, shape = self._render_to_shared_memory(doc, page_num)
+                except Exception as e:
+                    in_flight.release()
+                    add_result(ExamOCRService.failed_page_result(page_num, f'Page rendering failed: {str(e)}'))
+                    continue
+
+                try:
+                    future = self._executor.submit(_process_shared_page, shm.name, shape, pdf_path, page_num, PAGE_DPI, scan_id)
+                except Exception:
+                    self._release_page(shm, in_flight, None)
+                    self.broken = True
+                    raise
+                future.add_done_callback(partial(self._release_page, shm, in_flight))
+                pending.append((page_num, future))
+                collect(wait=False)
+        finally:
+            doc.close()
+            collect(wait=True)
+
+        results.sort(key=lambda x: x['page_number'])
+        return results
+
+    def process_image_files(self, image_paths):
+        """
+        עיבוד קבצי תמונה בתהליכי העבודה
+
+        Args:
+            image_paths: רשימת נתיבים לתמונות
+
+        Returns:
+            list של תוצאות, לפי סדר הקבצים
+        """
+        scan_id = next(_scan_ids)
+        futures = [(path, self._executor.submit(_process_image_file, path, scan_id)) for path in image_paths]
+
+        results = []
+        for path, future in futures:
+            result = self._result(future, lambda message: {
+                'qr_data': None,
+                'grade': None,
+                'ocr_text': '',
+                'confidence': 0,
+                'errors': [message]
+            })
+            result['file_path'] = path
+            results.append(result)
+        return results
+
+    def shutdown(self):
+        """סגירת תהליכי העבודה"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def get_engine(tesseract_path=None, layout_lookup=None, qr_lookup=None, qr_stats_store=None):
+    """
+    מאגר התהליכים של האפליקציה - נוצר פעם אחת ומשמש את כל הסריקות, כך שכל תהליך מאותחל רק פעם אחת
+
+    Args:
+        tesseract_path: נתיב ל-tesseract executable (אופציונלי)
+        layout_lookup: פונקציה (exam_id, version) -> מפת אזורים
+        qr_lookup: פונקציה student_exam_id -> פרטי ההקצאה
+        qr_stats_store: פונקציה שמחזירה את מסד הנתונים של מוני שיטות ה-QR (None - בלי שמירה)
+
+    Returns:
+        OCRProcessEngine, או None אם יש ליבה אחת בלבד (ואז ExamOCRService משתמש ב-threads)
+    """
+    global _engine
+    if OCR_PROCESSES < 2:
+        return None
+
+    with _engine_lock:
+        if _engine is not None and _engine.broken:
+            # תהליך עבודה קרס - מאגר חדש במקום זה ששבור
+            _engine.shutdown()
+            _engine = None
+
+        if _engine is None:
+            try:
+                _engine = OCRProcessEngine(OCR_PROCESSES, tesseract_path, layout_lookup, qr_lookup, qr_stats_store)
+            except (OSError, NotImplementedError) as e:
+                logger.warning("ocr_pool_unavailable processes=%d error=%s", OCR_PROCESSES, e)
+                return None
+
+        return _engine
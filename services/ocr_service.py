@@ -6,32 +6,353 @@ Reads QR codes and grades from scanned exam PDFs
 import os
 import re
 import json
+import hashlib
+import threading
+import time
 import cv2
 import numpy as np
 from PIL import Image
-import pytesseract
 from pyzbar import pyzbar
 import fitz  # PyMuPDF
-from datetime import datetime
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Tuple, Optional
 
+from services import tesseract_backend
+from services import scan_diagnostics
+from services import digit_classifier
+from services.qr_token import decode_token
+
+logger = scan_diagnostics.get_logger(__name__)
+
+# רזולוציות לזיהוי QR - מהזולה ליקרה. ה-QR מודפס בגודל 4 ס"מ ומזוהה ברוב הסריקות כבר ב-150-200 DPI
+QR_DPI_LADDER = (150, 200, 300, 450, 720)
+
+# רזולוציית העמוד לקריאת הציון (tesseract עובד הכי טוב סביב 300 DPI)
+PAGE_DPI = 300
+
+# שיטות זיהוי QR - (מפענח, עיבוד מקדים). זה סדר ברירת המחדל; בפועל הסדר נלמד מ-qr_strategy_stats
+QR_STRATEGIES = (
+    ('pyzbar', 'original'),
+    ('pyzbar', 'adaptive_threshold'),
+    ('pyzbar', 'otsu'),
+    ('pyzbar', 'sharpened'),
+    ('pyzbar', 'clahe'),
+    ('zxing', 'original'),
+)
+
+# כמה זמן תוצאת סריקה נשמרת במטמון (שעות, 0 - בלי מטמון)
+SCAN_CACHE_TTL_HOURS = float(os.environ.get('SCAN_CACHE_TTL_HOURS', '168'))
+# עולה כשצינור הסריקה משתנה באופן שמשנה תוצאות - תוצאות ישנות לא נשלפות יותר
+SCAN_CACHE_VERSION = 5
+# שגיאות זמניות - עמוד שנכשל כך ייסרק שוב בהעלאה הבאה ולא נשמר במטמון
+TRANSIENT_ERRORS = ('Processing error', 'Page rendering failed', 'Page processing failed', 'Image processing failed')
+
+# threads העיבוד של הסריקות (כשאין מאגר תהליכים) - מאגר אחד בגודל קבוע שנשאר חי כל חיי התהליך,
+# כך שמנוע Tesseract שכל thread טוען (tesseract_backend) משמש גם את הסריקות הבאות.
+# כל עמוד נשלח כמשימה נפרדת - סריקות שרצות במקביל מתחלקות ב-threads ולא מחכות זו לסיום זו
+PAGE_THREADS = int(os.environ.get('PAGE_THREADS', '0')) or max(4, os.cpu_count() or 1)
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+
+def get_page_pool():
+    """
+    מאגר ה-threads של האפליקציה לעיבוד עמודים - נוצר פעם אחת ומשמש את כל הסריקות
+
+    Returns:
+        ThreadPoolExecutor עם PAGE_THREADS threads
+    """
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ThreadPoolExecutor(max_workers=PAGE_THREADS, thread_name_prefix='pdf-page-worker')
+        return _page_pool
+
+
+def file_hash(path):
+    """SHA-256 של קובץ (כולל גרסת צינור הסריקה) - מפתח המטמון של קובץ שלם"""
+    digest = hashlib.sha256(f"scan:{SCAN_CACHE_VERSION}:".encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return 'file:' + digest.hexdigest()
+
+
+def page_hash(doc, page_num):
+    """
+    SHA-256 של עמוד PDF - מהבתים שמהם העמוד מצויר (תוכן, תמונות, XObjects), גודל וסיבוב
+    אותם בתים = אותה תמונה בהמרה, בלי לשלם על ההמרה עצמה
+
+    Args:
+        doc: מסמך fitz פתוח
+        page_num: מספר עמוד (מ-0)
+    """
+    page = doc[page_num]
+    digest = hashlib.sha256(f"scan:{SCAN_CACHE_VERSION}:{tuple(page.rect)}:{page.rotation}".encode())
+
+    xrefs = list(page.get_contents())
+    for image in page.get_images(full=True):
+        xrefs += [xref for xref in image[:2] if xref]
+    xrefs += [xobject[0] for xobject in page.get_xobjects()]
+
+    for xref in xrefs:
+        digest.update(doc.xref_stream_raw(xref) or b'')
+    return 'page:' + digest.hexdigest()
+
+
+class QRResolutionStats:
+    """
+    באיזו רזולוציה QR זוהה בעמודים האחרונים - כדי שהסריקה תתחיל מהרזולוציה שמתאימה לסורק
+    ולא תבזבז ניסיונות על רזולוציות שכמעט אף פעם לא מספיקות
+    """
+
+    def __init__(self, ladder=QR_DPI_LADDER, window=20, coverage=0.8, probe_every=10):
+        """
+        Args:
+            ladder: רזולוציות לפי הסדר
+            window: מספר העמודים האחרונים שנלקחים בחשבון
+            coverage: חלק העמודים שצריכים להצליח ברזולוציית ההתחלה או מתחתיה
+            probe_every: כל כמה עמודים מתחילים שוב מהרזולוציה הנמוכה - למקרה שהסורק השתפר
+        """
+        self.ladder = tuple(ladder)
+        self.coverage = coverage
+        self.probe_every = probe_every
+        self._recent = deque(maxlen=window)
+        self._counts = {dpi: 0 for dpi in self.ladder}
+        self._failures = 0
+        self._pages = 0
+        self._lock = threading.Lock()
+
+    def start_index(self):
+        """האינדקס בסולם שממנו מתחילים את העמוד הבא"""
+        with self._lock:
+            self._pages += 1
+            if not self._recent or self._pages % self.probe_every == 0:
+                return 0
+
+            # הרזולוציה הנמוכה ביותר שמכסה את רוב ההצלחות האחרונות
+            needed = self.coverage * len(self._recent)
+            covered = 0
+            for index, dpi in enumerate(self.ladder):
+                covered += sum(1 for recent in self._recent if recent == dpi)
+                if covered >= needed:
+                    return index
+            return 0
+
+    def record(self, dpi):
+        """רישום תוצאת עמוד - dpi שבו הצליח, או None אם נכשל בכל הרזולוציות"""
+        with self._lock:
+            if dpi is None:
+                self._failures += 1
+                return
+            self._recent.append(dpi)
+            self._counts[dpi] += 1
+
+    def summary(self):
+        """סיכום לתצוגה/לוג"""
+        with self._lock:
+            return {
+                'successes_by_dpi': dict(self._counts),
+                'failures': self._failures
+            }
+
+
+class QRStrategyStats:
+    """
+    פגיעות וזמן לכל שיטת זיהוי QR (מפענח + עיבוד מקדים) - השיטות מנוסות לפי הסיכוי להצליח לכל ms של עבודה
+    המונים נשמרים במסד הנתונים, כך שהסדר נלמד פעם אחת לכל התקנה ומשותף לכל התהליכים
+    """
+
+    def __init__(self, strategies=QR_STRATEGIES, min_attempts=5, flush_every=20, store=None):
+        """
+        Args:
+            strategies: שיטות לפי סדר ברירת המחדל - (מפענח, עיבוד מקדים)
+            min_attempts: מתחת למספר הניסיונות הזה השיטה נשארת בסדר ברירת המחדל
+            flush_every: כל כמה ניסיונות המונים נכתבים למסד הנתונים
+            store: פונקציה שמחזירה אובייקט עם get/add_qr_strategy_stats (None - בלי שמירה)
+        """
+        self.strategies = [f"{decoder}:{variant}" for decoder, variant in strategies]
+        self.min_attempts = min_attempts
+        self.flush_every = flush_every
+        self._store_factory = store
+        self._store = None
+        self._totals = {}
+        self._pending = {}
+        self._pending_count = 0
+        self._loaded = store is None
+        self._lock = threading.Lock()
+
+    def set_store(self, store):
+        """
+        חיבור המונים למסד נתונים - האפליקציה ותהליכי ה-OCR שלה מחברים את מסד הנתונים שלהם;
+        בלי חיבור (בדיקות, benchmarks) המונים נשארים בזיכרון ולא משנים את הסדר של ההתקנה
+
+        Args:
+            store: פונקציה שמחזירה אובייקט עם get/add_qr_strategy_stats (None - בלי שמירה)
+        """
+        with self._lock:
+            if store is self._store_factory:
+                return
+            self._store_factory = store
+            self._store = None
+            self._loaded = store is None
+
+    def _get_store(self):
+        if self._store is None:
+            self._store = self._store_factory()
+        return self._store
+
+    def _load(self):
+        """טעינת המונים השמורים - פעם אחת, בשימוש הראשון (נקרא בתוך הנעילה)"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            self._totals = self._get_store().get_qr_strategy_stats()
+        except Exception as e:
+            logger.warning("qr_stats_load_failed error=%s", e)
+
+    def order(self):
+        """השיטות לפי הסדר שבו כדאי לנסות אותן בעמוד הבא"""
+        with self._lock:
+            self._load()
+
+            def rank(item):
+                index, name = item
+                counts = self._totals.get(name)
+                if not counts or counts['attempts'] < self.min_attempts:
+                    # שיטה שכמעט לא נוסתה - אחרי השיטות שנמדדו, בסדר ברירת המחדל
+                    return (1, index)
+                hit_rate = (counts['hits'] + 1) / (counts['attempts'] + 2)
+                mean_ms = counts['total_ms'] / counts['attempts']
+                return (0, -hit_rate / max(mean_ms, 1.0))
+
+            return [name for _, name in sorted(enumerate(self.strategies), key=rank)]
+
+    def record(self, strategy, hit, elapsed_ms):
+        """רישום ניסיון של שיטה - האם זיהתה קוד וכמה זמן לקח (כולל העיבוד המקדים)"""
+        with self._lock:
+            for counts in (self._totals, self._pending):
+                entry = counts.setdefault(strategy, {'attempts': 0, 'hits': 0, 'total_ms': 0.0})
+                entry['attempts'] += 1
+                entry['hits'] += int(hit)
+                entry['total_ms'] += elapsed_ms
+            self._pending_count += 1
+            should_flush = self._store_factory is not None and self._pending_count >= self.flush_every
+
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """כתיבת המונים שנצברו למסד הנתונים וטעינה מחדש של הסכומים (כולל תהליכים אחרים)"""
+        if self._store_factory is None:
+            return
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_count = 0
+
+        try:
+            store = self._get_store()
+            if pending:
+                store.add_qr_strategy_stats(pending)
+            totals = store.get_qr_strategy_stats()
+        except Exception as e:
+            logger.warning("qr_stats_save_failed error=%s", e)
+            return
+
+        with self._lock:
+            # ניסיונות שנרשמו בזמן הכתיבה עדיין לא במסד - מוסיפים אותם לסכומים שנטענו
+            for strategy, delta in self._pending.items():
+                entry = totals.setdefault(strategy, {'attempts': 0, 'hits': 0, 'total_ms': 0.0})
+                for key in ('attempts', 'hits', 'total_ms'):
+                    entry[key] += delta[key]
+            self._totals = totals
+            self._loaded = True
+
+    def summary(self):
+        """המונים לכל שיטה והסדר הנוכחי - לתצוגה/API"""
+        order = self.order()
+        with self._lock:
+            strategies = {}
+            for name in self.strategies:
+                counts = self._totals.get(name, {'attempts': 0, 'hits': 0, 'total_ms': 0.0})
+                attempts = counts['attempts']
+                strategies[name] = {
+                    'attempts': attempts,
+                    'hits': counts['hits'],
+                    'hit_rate': round(counts['hits'] / attempts, 3) if attempts else None,
+                    'mean_ms': round(counts['total_ms'] / attempts, 1) if attempts else None
+                }
+            return {'order': order, 'strategies': strategies}
+
+
+# משותף לכל מופעי השירות בתהליך - כל העלאה יוצרת ExamOCRService חדש
+qr_resolution_stats = QRResolutionStats()
+qr_strategy_stats = QRStrategyStats()
+
+
 class ExamOCRService:
     """שירות OCR לקריאת מבחנים סרוקים"""
 
-    def __init__(self, tesseract_path=None):
+    # עמודים מוכנים שממתינים ל-worker פנוי
+    PAGE_QUEUE_SIZE = 1
+
+    # שוליים סביב שורת הציון (ס"מ) - הציון נכתב ביד ולרוב חורג מעל השורה
+    GRADE_MARGIN_CM = {'top': 0.8, 'bottom': 0.3, 'side': 0.5}
+
+    # שוליים סביב ריבועי הספרות (ס"מ) - מספיק כדי שהמסגרות יימצאו גם אם הסריקה זזה מעט
+    DIGIT_BOX_MARGIN_CM = {'top': 0.3, 'bottom': 0.3, 'side': 0.3}
+    # ספרה באמינות נמוכה מזו - הציון מסומן לבדיקה ידנית (needs_review)
+    DIGIT_REVIEW_CONFIDENCE = 0.6
+    # חלק מגודל הריבוע שנחתך מכל צד - כדי שהמסגרת לא תיכנס לספרה
+    DIGIT_BOX_INSET = 0.15
+
+    # שוליים סביב גיליון התשובות (ס"מ) - טווח החיפוש של יישור העיגולים; קטן מהמרווח בין שורות
+    ANSWER_GRID_MARGIN_CM = {'top': 0.4, 'bottom': 0.4, 'side': 0.4}
+    # חלק מפנים העיגול שמכוסה בדיו: מעל MARKED - מסומן; בין FAINT ל-MARKED - סימון חלקי או מחיקה, לבדיקה
+    BUBBLE_MARKED_FILL = 0.5
+    BUBBLE_FAINT_FILL = 0.2
+    # חלק מטבעות העיגולים שצריך להיות דיו כדי שהגיליון ייחשב נמצא (קו מודפס מכסה כשליש מהטבעת)
+    BUBBLE_RING_MIN_INK = 0.1
+
+    # הטיה שמתחתיה לא מסובבים (מעלות) - לא משפיעה על קריאת הציון
+    SKEW_THRESHOLD_DEG = 0.3
+    # טווח הזוויות שנבדקות, ורוחב התמונה המוקטנת שעליה מעריכים את ההטיה
+    MAX_SKEW_DEG = 10
+    SKEW_THUMBNAIL_WIDTH = 800
+
+    # עמוד שתמונה מכסה לפחות חלק כזה ממנו נחשב סרוק
+    SCANNED_IMAGE_COVERAGE = 0.5
+
+    # QR וקטורי בעמוד דיגיטלי חד לגמרי - מספיקה רזולוציה נמוכה
+    TEXT_LAYER_QR_DPI = 150
+
+    def __init__(self, tesseract_path=None, layout_lookup=None, engine=None, result_cache=None, qr_lookup=None):
         """
         אתחול השירות
 
         Args:
             tesseract_path: נתיב ל-tesseract executable (אופציונלי)
+            layout_lookup: פונקציה (exam_id, version) -> מפת אזורים של התבנית (אופציונלי)
+            qr_lookup: פונקציה student_exam_id -> פרטי ההקצאה, לפענוח טוקן מספרי ב-QR (אופציונלי)
+            engine: OCRProcessEngine לעיבוד עמודים בתהליכים נפרדים (אופציונלי, ברירת מחדל - threads)
+            result_cache: אובייקט עם get/put_scan_cache - תוצאות לפי hash של התוכן (אופציונלי)
         """
-        if tesseract_path:
-            pytesseract.pytesseract.tesseract_cmd = tesseract_path
+        tesseract_backend.configure(tesseract_path)
 
         # הגדרות OCR
         self.tesseract_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789./'
 
+        self.layout_lookup = layout_lookup
+        self.qr_lookup = qr_lookup
+        self.engine = engine
+        self.result_cache = result_cache if SCAN_CACHE_TTL_HOURS > 0 else None
+        self._layouts = {}
+        self._layouts_lock = threading.Lock()
+
     def preprocess_image(self, image):
         """
         עיבוד מקדים של תמונה לשיפור דיוק OCR
@@ -65,42 +386,64 @@ class ExamOCRService:
 
         return thresh
 
-    def deskew_image(self, image):
+    def estimate_skew(self, image):
         """
-        תיקון זווית הטיה של התמונה
+        הערכת זווית ההטיה של העמוד על תמונה מוקטנת, לפי פרופיל ההטלה של הדיו:
+        בזווית הנכונה הדיו מתרכז בשורות, וסכום ריבועי הספירות לכל שורה מקסימלי
 
         Args:
-            image: תמונה (numpy array)
+            image: תמונת העמוד (numpy array)
 
         Returns:
-            תמונה מתוקנת
+            זווית במעלות, בכיוון של cv2.getRotationMatrix2D, שמיישרת את העמוד (0 אם אין מספיק דיו)
         """
-        # זיהוי קווים
-        edges = cv2.Canny(image, 50, 150, apertureSize=3)
-        lines = cv2.HoughLines(edges, 1, np.pi / 180, 200)
-
-        if lines is None:
-            return image
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        h, w = gray.shape
+        if w > self.SKEW_THUMBNAIL_WIDTH:
+            scale = self.SKEW_THUMBNAIL_WIDTH / w
+            gray = cv2.resize(gray, (self.SKEW_THUMBNAIL_WIDTH, int(h * scale)), interpolation=cv2.INTER_AREA)
+
+        _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        ys, xs = np.nonzero(ink)
+        if len(ys) < 100:
+            return 0.0
+        # רעש קבוע של פחות מפיקסל - בלעדיו זווית 0 מקבלת יתרון רק כי הפיקסלים יושבים על הרשת
+        jitter = np.random.default_rng(0).uniform(-0.5, 0.5, (2, len(ys)))
+        xs = xs - gray.shape[1] / 2 + jitter[0]
+        ys = ys - gray.shape[0] / 2 + jitter[1]
+
+        def score(angle):
+            theta = np.radians(angle)
+            rows = np.round(ys * np.cos(theta) - xs * np.sin(theta)).astype(np.int64)
+            counts = np.bincount(rows - rows.min())
+            return float(np.dot(counts, counts))
+
+        # חיפוש גס בחצאי מעלה ואז עדין בעשיריות סביב הטוב ביותר
+        best = max(np.arange(-self.MAX_SKEW_DEG, self.MAX_SKEW_DEG + 0.01, 0.5), key=score)
+        best = max(np.arange(best - 0.5, best + 0.51, 0.1), key=score)
+        return round(float(best), 2)
+
+    def deskew_image(self, image, angle=None):
+        """
+        תיקון זווית הטיה של התמונה - רק אם ההטיה מעל SKEW_THRESHOLD_DEG
 
-        # חישוב זווית ממוצעת
-        angles = []
-        for rho, theta in lines[:, 0]:
-            angle = np.degrees(theta) - 90
-            if abs(angle) < 45:
-                angles.append(angle)
+        Args:
+            image: תמונה (numpy array)
+            angle: זווית שכבר הוערכה (אופציונלי)
 
-        if not angles:
+        Returns:
+            תמונה מתוקנת (אותה תמונה אם אין הטיה משמעותית)
+        """
+        if angle is None:
+            angle = self.estimate_skew(image)
+        if abs(angle) < self.SKEW_THRESHOLD_DEG:
             return image
 
-        median_angle = np.median(angles)
-
         # סיבוב התמונה
         (h, w) = image.shape[:2]
         center = (w // 2, h // 2)
-        M = cv2.getRotationMatrix2D(center, median_angle, 1.0)
-        rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-
-        return rotated
+        M = cv2.getRotationMatrix2D(center, angle, 1.0)
+        return cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
 
     def read_pdf_metadata(self, pdf_path: str) -> Optional[Dict]:
         """
@@ -113,19 +456,16 @@ class ExamOCRService:
             from PyPDF2 import PdfReader
             import json
 
-            print("="*50)
-            print("DEBUG: Trying to read PDF metadata...")
-
             reader = PdfReader(pdf_path)
             metadata = reader.metadata
 
             if metadata:
-                print(f"DEBUG: Found metadata fields: {list(metadata.keys())}")
+                logger.debug("pdf_metadata fields=%s", list(metadata.keys()))
 
                 # חפש את המידע שלנו
                 if '/YeshivaData' in metadata:
                     yeshiva_data = json.loads(metadata['/YeshivaData'])
-                    print(f"DEBUG: SUCCESS! Found YeshivaData: {yeshiva_data}")
+                    logger.debug("pdf_metadata_found data=%s", yeshiva_data)
                     return yeshiva_data
 
                 # נסה לבנות מה שיש
@@ -137,177 +477,175 @@ class ExamOCRService:
                         'exam_title': metadata.get('/Exam_Title', ''),
                         'date': metadata.get('/Date', '')
                     }
-                    print(f"DEBUG: Built data from individual fields: {result}")
+                    logger.debug("pdf_metadata_fields_found data=%s", result)
                     return result
 
-            print("DEBUG: No YeshivaData in metadata")
-            print("="*50)
+            logger.debug("pdf_metadata_missing path=%s", pdf_path)
             return None
 
         except Exception as e:
-            print(f"DEBUG: Error reading metadata: {e}")
-            print("="*50)
+            logger.warning("pdf_metadata_failed path=%s error=%s", pdf_path, e)
             return None
 
-    def preprocess_for_qr(self, image_np):
+    def read_pdf_page_map(self, pdf_path: str) -> Optional[List[Dict]]:
         """
-        עיבוד מקדים מיוחד ל-QR codes - יותר אגרסיבי!
-        
-        Args:
-            image_np: תמונה (numpy array)
-        
+        קריאת מפת העמודים של PDF כיתתי מאוחד (/YeshivaPages)
+        כל רשומה מתארת טווח עמודים של תלמיד אחד
+
         Returns:
-            list של תמונות מעובדות לניסיון
+            list של dicts עם first_page, last_page ופרטי התלמיד, או None
         """
-        processed_images = []
-        
-        # המרה לגווני אפור
-        if len(image_np.shape) == 3:
-            gray = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY)
-        else:
-            gray = image_np
-        
-        # 1. התמונה המקורית באפור
-        processed_images.append(("grayscale", gray))
-        
-        # 2. Adaptive threshold - מצוין ל-QR
-        adaptive = cv2.adaptiveThreshold(
-            gray, 255, 
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY, 
-            11, 2
-        )
-        processed_images.append(("adaptive_threshold", adaptive))
-        
-        # 3. OTSU threshold
-        _, otsu = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        processed_images.append(("otsu", otsu))
-        
-        # 4. עם sharpening
-        kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-        sharpened = cv2.filter2D(gray, -1, kernel)
-        processed_images.append(("sharpened", sharpened))
-        
-        # 5. CLAHE לניגודיות
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(gray)
-        processed_images.append(("clahe", enhanced))
-        
-        return processed_images
+        try:
+            from PyPDF2 import PdfReader
+
+            metadata = PdfReader(pdf_path).metadata
+            if metadata and '/YeshivaPages' in metadata:
+                return json.loads(metadata['/YeshivaPages'])
+            return None
 
-    def read_qr_code(self, image) -> Optional[Dict]:
+        except Exception as e:
+            logger.warning("pdf_page_map_failed path=%s error=%s", pdf_path, e)
+            return None
+
+    def preprocess_for_qr(self, image, method, cache):
         """
-        קריאת QR code או barcode מתמונה - גרסה משופרת ואגרסיבית!
+        עיבוד מקדים ל-QR - שיטה אחת בכל קריאה, כך שעיבוד מחושב רק כשבאמת מגיעים לנסות אותו
 
         Args:
-            image: תמונה (numpy array או PIL Image)
+            image: התמונה המקורית (numpy array או PIL Image)
+            method: 'original', 'adaptive_threshold', 'otsu', 'sharpened' או 'clahe'
+            cache: dict של העמוד הנוכחי - גווני האפור והעיבודים שכבר חושבו
 
         Returns:
-            dict עם המידע מה-QR/barcode או None
+            התמונה המעובדת
         """
-        print("="*50)
-        print("DEBUG: Starting barcode/QR detection")
+        if method in cache:
+            return cache[method]
 
-        # המרה ל-PIL Image אם צריך
-        if isinstance(image, np.ndarray):
-            print(f"DEBUG: Converting numpy array to PIL. Shape: {image.shape}")
-            pil_image = Image.fromarray(image)
+        if method == 'original':
+            cache[method] = image
+            return image
+
+        gray = cache.get('grayscale')
+        if gray is None:
+            image_np = np.asarray(image)
+            gray = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY) if len(image_np.shape) == 3 else image_np
+            cache['grayscale'] = gray
+
+        if method == 'adaptive_threshold':
+            # מצוין ל-QR
+            processed = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+        elif method == 'otsu':
+            _, processed = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        elif method == 'sharpened':
+            kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+            processed = cv2.filter2D(gray, -1, kernel)
+        elif method == 'clahe':
+            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+            processed = clahe.apply(gray)
         else:
-            pil_image = image
-            print(f"DEBUG: Already PIL Image. Size: {pil_image.size}")
+            raise ValueError(f"Unknown QR preprocessing method: {method}")
 
-        # שמירת תמונת debug
-        try:
-            debug_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'temp')
-            os.makedirs(debug_dir, exist_ok=True)
-            debug_path = os.path.join(debug_dir, f'debug_scan_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png')
-            pil_image.save(debug_path)
-            print(f"DEBUG: Saved debug image to {debug_path}")
-        except Exception as e:
-            print(f"DEBUG: Could not save debug image: {e}")
+        cache[method] = processed
+        return processed
 
-        # זיהוי QR codes ו-barcodes (כולל CODE128)
-        print("DEBUG: Attempting pyzbar.decode on original image...")
-        codes = pyzbar.decode(pil_image)
+    def _decode_codes(self, decoder, image):
+        """
+        הרצת מפענח אחד - מחזיר רשימת קודים בפורמט של pyzbar (data, type, quality, rect)
+        זורק ImportError אם המפענח לא מותקן
+        """
+        if decoder == 'pyzbar':
+            return pyzbar.decode(image if isinstance(image, Image.Image) else Image.fromarray(image))
+
+        if decoder == 'zxing':
+            import zxingcpp
+            from types import SimpleNamespace
+
+            codes = []
+            for result in zxingcpp.read_barcodes(np.asarray(image)):
+                position = result.position
+                xs = [position.top_left.x, position.top_right.x, position.bottom_left.x, position.bottom_right.x]
+                ys = [position.top_left.y, position.top_right.y, position.bottom_left.y, position.bottom_right.y]
+                codes.append(SimpleNamespace(
+                    data=result.text.encode('utf-8'),
+                    type=result.format.name,
+                    quality=50,
+                    rect=SimpleNamespace(left=min(xs), top=min(ys), width=max(xs) - min(xs), height=max(ys) - min(ys))
+                ))
+            return codes
+
+        raise ValueError(f"Unknown QR decoder: {decoder}")
+
+    def iter_qr_attempts(self, image):
+        """
+        מפל ניסיונות זיהוי ה-QR - generator עצלני לפי הסדר של qr_strategy_stats
+        כל עיבוד מקדים מחושב רק כשמגיעים אליו, והקורא מפסיק בהצלחה הראשונה
 
-        print(f"DEBUG: Found {len(codes)} codes on original image")
+        Args:
+            image: תמונה (numpy array או PIL Image)
 
-        if not codes:
-            print("DEBUG: No codes found on original. Trying multiple preprocessing methods...")
-            # נסה שוב עם עיבודים מקדימים משופרים
-            try:
-                # המרה ל-numpy אם צריך
-                if not isinstance(image, np.ndarray):
-                    image_np = np.array(pil_image)
-                else:
-                    image_np = image
-
-                print(f"DEBUG: Image array shape: {image_np.shape}, dtype: {image_np.dtype}")
-
-                # נסה מספר שיטות עיבוד שונות
-                processed_versions = self.preprocess_for_qr(image_np)
-                
-                for method_name, processed in processed_versions:
-                    print(f"DEBUG: Trying method: {method_name}")
-                    processed_pil = Image.fromarray(processed)
-                    codes = pyzbar.decode(processed_pil)
-                    print(f"DEBUG: Method {method_name} found {len(codes)} codes")
-                    
-                    if codes:
-                        print(f"DEBUG: SUCCESS with method: {method_name}")
-                        break
-                
-            except Exception as e:
-                print(f"DEBUG: Preprocessing failed with error: {e}")
-                import traceback
-                traceback.print_exc()
-        
-        # אם pyzbar נכשל, נסה zxing-cpp (אם זמין)
-        if not codes:
+        Yields:
+            tuple של (שם השיטה, רשימת הקודים שנמצאו)
+        """
+        cache = {}
+        for strategy in qr_strategy_stats.order():
+            decoder, method = strategy.split(':', 1)
+            start = time.perf_counter()
             try:
-                import zxingcpp
-                print("DEBUG: Trying zxing-cpp as fallback...")
-                
-                # המרה ל-numpy
-                if not isinstance(image, np.ndarray):
-                    image_np = np.array(pil_image)
-                else:
-                    image_np = image
-                
-                results = zxingcpp.read_barcodes(image_np)
-                print(f"DEBUG: zxing-cpp found {len(results)} codes")
-                
-                if results and len(results) > 0:
-                    # המר לפורמט של pyzbar
-                    from types import SimpleNamespace
-                    code = SimpleNamespace(
-                        data=results[0].text.encode('utf-8'),
-                        type=results[0].format.name,
-                        quality=50,
-                        rect=SimpleNamespace(left=0, top=0, width=0, height=0)
-                    )
-                    codes = [code]
-                    print(f"DEBUG: zxing-cpp SUCCESS! Found {results[0].format.name}")
+                codes = self._decode_codes(decoder, self.preprocess_for_qr(image, method, cache))
             except ImportError:
-                print("DEBUG: zxing-cpp not available, skipping")
+                # מפענח שלא מותקן - לא נספר כניסיון
+                continue
             except Exception as e:
-                print(f"DEBUG: zxing-cpp failed: {e}")
+                logger.warning("qr_strategy_error strategy=%s error=%s", strategy, e)
+                codes = []
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            qr_strategy_stats.record(strategy, bool(codes), elapsed_ms)
+            logger.debug("qr_attempt strategy=%s codes=%d ms=%.0f", strategy, len(codes), elapsed_ms)
+            yield strategy, codes
+
+    def read_qr_code(self, image, with_rect=False):
+        """
+        קריאת QR code או barcode מתמונה - מנסה שיטות זיהוי עד ההצלחה הראשונה
+
+        Args:
+            image: תמונה (numpy array או PIL Image)
+            with_rect: להחזיר גם את מיקום הקוד בתמונה
+
+        Returns:
+            dict עם המידע מה-QR/barcode או None
+            (עם with_rect: tuple של (המידע, (left, top, width, height) או None))
+        """
+        codes = []
+        strategy = None
+        for strategy, codes in self.iter_qr_attempts(image):
+            if codes:
+                break
 
         if not codes:
-            print("DEBUG: FAILED - No codes found even after all attempts")
-            print("="*50)
-            return None
+            logger.debug("qr_not_found")
+            return (None, None) if with_rect else None
 
         # קריאת הראשון
         code = codes[0]
         code_data = code.data.decode('utf-8')
-        code_type = code.type
+        logger.debug("qr_found strategy=%s type=%s data=%s rect=%s", strategy, code.type, code_data, code.rect)
+
+        qr_data = self._parse_code_data(code_data)
+        if not with_rect:
+            return qr_data
 
-        print(f"DEBUG: SUCCESS! Code type: {code_type}")
-        print(f"DEBUG: Code data: {code_data}")
-        print(f"DEBUG: Code quality: {code.quality}")
-        print(f"DEBUG: Code rect: {code.rect}")
-        print("="*50)
+        rect = code.rect
+        if not rect.width or not rect.height:
+            return qr_data, None
+        return qr_data, (rect.left, rect.top, rect.width, rect.height)
+
+    def _parse_code_data(self, code_data):
+        """פענוח תוכן הקוד - טוקן מספרי, JSON (QR ישן) או StudentID-ExamID-Date (barcode ישן)"""
+        student_exam_id = decode_token(code_data)
+        if student_exam_id is not None:
+            return self._resolve_token(student_exam_id)
 
         try:
             # אם זה JSON (QR code ישן)
@@ -316,17 +654,339 @@ class ExamOCRService:
             # אם זה barcode בפורמט: StudentID-ExamID-Date
             if '-' in code_data:
                 parts = code_data.split('-')
-                print(f"DEBUG: Barcode parts: {parts}")
                 if len(parts) >= 3:
                     result = {
                         'student_id': int(parts[0]) if parts[0].isdigit() else parts[0],
                         'exam_id': int(parts[1]) if parts[1].isdigit() else parts[1],
                         'date': f"{parts[2][:4]}-{parts[2][4:6]}-{parts[2][6:8]}" if len(parts[2]) == 8 else parts[2]
                     }
-                    print(f"DEBUG: Parsed barcode result: {result}")
                     return result
             return {'raw_data': code_data}
 
+    def _resolve_token(self, student_exam_id):
+        """פרטי ההקצאה של טוקן מספרי מבסיס הנתונים - בלי qr_lookup (או הקצאה שנמחקה) רק המזהה"""
+        identity = None
+        if self.qr_lookup:
+            try:
+                identity = self.qr_lookup(student_exam_id)
+            except Exception as e:
+                logger.warning("qr_lookup_failed student_exam_id=%s error=%s", student_exam_id, e)
+
+        if not identity:
+            logger.warning("qr_token_unresolved student_exam_id=%s", student_exam_id)
+            return {'student_exam_id': student_exam_id}
+        return dict(identity)
+
+    def read_qr_code_adaptive(self, page_image, page_dpi, render_page):
+        """
+        קריאת QR בסולם רזולוציות - מתחילים בזול ועולים רק אם לא זוהה
+        רזולוציות עד page_dpi מוקטנות מתמונת העמוד, גבוהות יותר מומרות מחדש מה-PDF
+
+        Args:
+            page_image: תמונת העמוד (numpy array) ב-page_dpi
+            page_dpi: הרזולוציה של page_image
+            render_page: פונקציה שמקבלת dpi ומחזירה את העמוד בתמונה ברזולוציה הזו
+
+        Returns:
+            tuple של (מידע ה-QR או None, ה-DPI שבו זוהה או None,
+                      מיקום ה-QR בקואורדינטות של page_image או None)
+        """
+        stats = qr_resolution_stats
+        for dpi in stats.ladder[stats.start_index():]:
+            if dpi == page_dpi:
+                image = page_image
+            elif dpi < page_dpi:
+                scale = dpi / page_dpi
+                image = cv2.resize(page_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            else:
+                image = np.array(render_page(dpi))
+
+            logger.debug("qr_try dpi=%d", dpi)
+            qr_data, rect = self.read_qr_code(image, with_rect=True)
+            image = None
+
+            if qr_data:
+                stats.record(dpi)
+                if rect:
+                    scale = page_dpi / dpi
+                    rect = tuple(value * scale for value in rect)
+                return qr_data, dpi, rect
+
+        stats.record(None)
+        return None, None, None
+
+    def clear_layouts(self):
+        """ריקון מטמון מפות האזורים - בתחילת כל סריקה, כדי שתבנית שפורסמה בינתיים תיקרא מחדש"""
+        with self._layouts_lock:
+            self._layouts.clear()
+
+    def get_layout(self, qr_data):
+        """
+        מפת האזורים של התבנית שממנה נוצר העמוד (לפי המבחן והגרסה שב-QR), עם מטמון לאורך הסריקה
+        מבחן שעוד אין לו מפה לא נשמר במטמון - המפה עשויה להתפרסם באמצע הסריקה
+        """
+        if not self.layout_lookup or not qr_data or not qr_data.get('exam_id'):
+            return None
+
+        key = (qr_data['exam_id'], qr_data.get('version', 'A'))
+        with self._layouts_lock:
+            if key in self._layouts:
+                return self._layouts[key]
+
+        try:
+            layout = self.layout_lookup(*key)
+        except Exception as e:
+            logger.warning("layout_lookup_failed exam_id=%s version=%s error=%s", key[0], key[1], e)
+            layout = None
+
+        if layout is not None:
+            with self._layouts_lock:
+                self._layouts[key] = layout
+        return layout
+
+    def crop_layout_region(self, image, layout, name, qr_rect=None, margins_cm=None, angle=0.0):
+        """
+        חיתוך אזור מהעמוד הסרוק לפי מפת האזורים של התבנית
+        ה-QR שזוהה משמש עוגן: ההפרש בין המיקום הצפוי שלו למיקום בפועל מתקן הזזה של הדף בסורק,
+        וסביבו מתוקנת ההטיה - רק הפיקסלים של האזור מסובבים, לא כל הדף
+
+        Args:
+            image: תמונת העמוד (numpy array) - כל הדף, לא מיושר
+            layout: מפת אזורים מ-layout_manifest
+            name: שם האזור ('grade', 'qr')
+            qr_rect: מיקום ה-QR שזוהה (left, top, width, height) בקואורדינטות של image
+            margins_cm: שוליים סביב האזור - dict עם top, bottom, side
+            angle: זווית ההטיה מ-estimate_skew (מעלות)
+
+        Returns:
+            תמונת האזור, או None אם אין לאזור מיקום בעמוד הזה
+        """
+        regions = layout.get('regions', {})
+        region = regions.get(name)
+        qr_region = regions.get('qr')
+        if not region or not qr_region or region['page'] != qr_region['page']:
+            return None
+
+        h, w = image.shape[:2]
+        page_width, page_height = layout.get('page_size', [595.2756, 841.8898])
+        px_per_cm_x = w / (page_width / 72 * 2.54)
+        px_per_cm_y = h / (page_height / 72 * 2.54)
+
+        # הזזה לפי ה-QR
+        dx = dy = 0
+        if qr_rect:
+            expected_cx = (qr_region['x0'] + qr_region['x1']) / 2 * w
+            expected_cy = (qr_region['y0'] + qr_region['y1']) / 2 * h
+            dx = qr_rect[0] + qr_rect[2] / 2 - expected_cx
+            dy = qr_rect[1] + qr_rect[3] / 2 - expected_cy
+
+        margins = margins_cm or {'top': 0, 'bottom': 0, 'side': 0}
+        x0 = int(region['x0'] * w + dx - margins['side'] * px_per_cm_x)
+        x1 = int(region['x1'] * w + dx + margins['side'] * px_per_cm_x)
+        y0 = int(region['y0'] * h + dy - margins['top'] * px_per_cm_y)
+        y1 = int(region['y1'] * h + dy + margins['bottom'] * px_per_cm_y)
+
+        x0, x1 = max(0, x0), min(w, x1)
+        y0, y1 = max(0, y0), min(h, y1)
+        if x1 - x0 < 10 or y1 - y0 < 10:
+            return None
+
+        if abs(angle) < self.SKEW_THRESHOLD_DEG:
+            return image[y0:y1, x0:x1]
+
+        # המלבן מחושב בדף המיושר; הסיבוב סביב ה-QR (או מרכז הדף) ממפה אותו חזרה לדף הסרוק,
+        # ו-warpAffine מחשב רק את הפיקסלים של האזור
+        if qr_rect:
+            center = (qr_rect[0] + qr_rect[2] / 2, qr_rect[1] + qr_rect[3] / 2)
+        else:
+            center = (w / 2, h / 2)
+        M = cv2.getRotationMatrix2D(center, angle, 1.0)
+        M[:, 2] -= (x0, y0)
+        return cv2.warpAffine(image, M, (x1 - x0, y1 - y0), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    def _find_digit_boxes(self, crop, count, box_px):
+        """
+        מסגרות ריבועי הספרות בתוך החיתוך - לפי קווי המסגרת עצמם, כך שהזזה קטנה של הסריקה לא משנה
+
+        Returns:
+            list של (x, y, w, h) משמאל לימין, או None אם לא נמצא בדיוק count ריבועים
+        """
+        _, binary = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        boxes = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if 0.75 * box_px <= w <= 1.3 * box_px and 0.75 * box_px <= h <= 1.3 * box_px:
+                boxes.append((x, y, w, h))
+
+        if len(boxes) != count:
+            return None
+        return sorted(boxes)
+
+    def read_digit_boxes(self, image, layout, qr_rect=None, angle=0.0):
+        """
+        קריאת הציון מריבועי הספרות של התבנית - ספרה בכל ריבוע, במסווג תבניות בלי טסרקט
+
+        Args:
+            image: תמונת העמוד (numpy array) - כל הדף, לא מיושר
+            layout: מפת אזורים מ-layout_manifest (עם grade_boxes)
+            qr_rect: מיקום ה-QR שזוהה (left, top, width, height)
+            angle: זווית ההטיה מ-estimate_skew (מעלות)
+
+        Returns:
+            dict עם score, total, percentage, confidence, digits, digit_confidence ו-needs_review;
+            score None אם כל הריבועים ריקים; None אם לאזור אין מיקום בעמוד הזה
+        """
+        region = layout['regions']['grade_boxes']
+        crop = self.crop_layout_region(image, layout, 'grade_boxes', qr_rect, self.DIGIT_BOX_MARGIN_CM, angle)
+        if crop is None:
+            return None
+        if crop.ndim == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+
+        count = region['digits']
+        box_px = (region['y1'] - region['y0']) * image.shape[0]
+        boxes = self._find_digit_boxes(crop, count, box_px)
+        if boxes is None:
+            # המסגרות לא נמצאו (קו שבור, כתב שחורג) - לפי המיקום במפה
+            crop = self.crop_layout_region(image, layout, 'grade_boxes', qr_rect, None, angle)
+            if crop is None:
+                return None
+            if crop.ndim == 3:
+                crop = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+            h, w = crop.shape
+            gap = (w - count * h) / (count - 1) if count > 1 else 0
+            boxes = [(int(i * (h + gap)), 0, h, h) for i in range(count)]
+
+        cells = []
+        for x, y, w, h in boxes:
+            dx, dy = int(w * self.DIGIT_BOX_INSET), int(h * self.DIGIT_BOX_INSET)
+            cells.append(crop[y + dy:y + h - dy, x + dx:x + w - dx])
+
+        digits = digit_classifier.get_classifier().classify(cells)
+        filled = [i for i, (digit, _) in enumerate(digits) if digit is not None]
+        max_score = region.get('max_score')
+
+        grade = {
+            'score': None,
+            'total': max_score,
+            'percentage': None,
+            'confidence': 0,
+            'digits': [digit for digit, _ in digits],
+            'digit_confidence': [round(confidence, 3) for _, confidence in digits],
+            'needs_review': True
+        }
+        if not filled:
+            return grade
+
+        # הספרות צריכות להיות רצופות - ריבוע ריק באמצע ("8 _ 5") הוא קריאה חשודה
+        contiguous = filled[-1] - filled[0] + 1 == len(filled)
+        score = int(''.join(str(digits[i][0]) for i in filled))
+        confidence = min(digits[i][1] for i in filled)
+
+        grade.update(
+            score=score,
+            percentage=round(score / max_score * 100, 2) if max_score else None,
+            confidence=round(confidence, 3),
+            needs_review=(confidence < self.DIGIT_REVIEW_CONFIDENCE or not contiguous
+                          or bool(max_score and score > max_score))
+        )
+        return grade
+
+    def read_answer_grid(self, image, layout, qr_rect=None, angle=0.0):
+        """
+        קריאת גיליון התשובות - מדידת המילוי של כל העיגולים יחד, במיקומים הידועים מהתבנית
+
+        העיגולים המודפסים מיישרים את הגיליון: מבין כל ההזזות בטווח השוליים נבחרת זו שבה
+        הכי הרבה דיו נופל על הטבעות, ואז המילוי נמדד בפנים של כל עיגול
+
+        Args:
+            image: תמונת העמוד (numpy array) - כל הדף, לא מיושר
+            layout: מפת אזורים מ-layout_manifest (עם answer_grid)
+            qr_rect: מיקום ה-QR שזוהה (left, top, width, height)
+            angle: זווית ההטיה מ-estimate_skew (מעלות)
+
+        Returns:
+            list של dicts לכל שאלה - question_number, answer (אינדקס מ-0, או None), fill, confidence ו-needs_review;
+            None אם הגיליון לא נמצא בעמוד הזה
+        """
+        region = layout['regions']['answer_grid']
+        margins = self.ANSWER_GRID_MARGIN_CM
+        crop = self.crop_layout_region(image, layout, 'answer_grid', qr_rect, margins, angle)
+        if crop is None:
+            return None
+        if crop.ndim == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+
+        h, w = image.shape[:2]
+        page_width, page_height = layout.get('page_size', [595.2756, 841.8898])
+        origin_x = margins['side'] * w / (page_width / 72 * 2.54)
+        origin_y = margins['top'] * h / (page_height / 72 * 2.54)
+        grid_w = (region['x1'] - region['x0']) * w
+        grid_h = (region['y1'] - region['y0']) * h
+        radius = region['radius'] * grid_w
+
+        questions = region['questions']
+        centers = np.array([(origin_x + fx * grid_w, origin_y + fy * grid_h)
+                            for question in questions for fx, fy in question['bubbles']])
+        centers = np.round(centers).astype(int)
+
+        # דיו - Otsu, עם סף שלא מסמן נייר נקי ורועש כדיו
+        blurred = cv2.GaussianBlur(crop, (3, 3), 0)
+        threshold, _ = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        threshold = min(threshold, int(np.median(blurred)) - 40)
+        ink = (blurred < threshold).astype(np.float32)
+
+        # ממוצע הדיו בטבעת ובפנים העיגול סביב כל פיקסל
+        size = int(np.ceil(radius * 1.3))
+        yy, xx = np.mgrid[-size:size + 1, -size:size + 1]
+        distance = np.hypot(xx, yy)
+        ring = ((distance >= radius * 0.8) & (distance <= radius * 1.2)).astype(np.float32)
+        disk = (distance <= radius * 0.55).astype(np.float32)
+        ring_ink = cv2.filter2D(ink, -1, ring / ring.sum(), borderType=cv2.BORDER_CONSTANT)
+        fill = cv2.filter2D(ink, -1, disk / disk.sum(), borderType=cv2.BORDER_CONSTANT)
+
+        # יישור: כל ההזזות בטווח השוליים, כל העיגולים בבת אחת
+        crop_h, crop_w = ink.shape
+        max_shift = int(min(origin_x, origin_y))
+        shifts = np.arange(-max_shift, max_shift + 1)
+        xs, ys = np.broadcast_arrays(
+            np.clip(centers[:, 0][None, None, :] + shifts[None, :, None], 0, crop_w - 1),
+            np.clip(centers[:, 1][None, None, :] + shifts[:, None, None], 0, crop_h - 1)
+        )
+        scores = ring_ink[ys, xs].sum(axis=-1)
+        dy, dx = np.unravel_index(scores.argmax(), scores.shape)
+        if scores[dy, dx] / len(centers) < self.BUBBLE_RING_MIN_INK:
+            return None
+
+        fills = np.clip(fill[ys[dy, dx], xs[dy, dx]], 0, 1)
+
+        answers = []
+        start = 0
+        for question in questions:
+            values = fills[start:start + len(question['bubbles'])]
+            start += len(question['bubbles'])
+
+            marked = np.flatnonzero(values >= self.BUBBLE_MARKED_FILL)
+            faint = np.flatnonzero((values >= self.BUBBLE_FAINT_FILL) & (values < self.BUBBLE_MARKED_FILL))
+            ordered = np.sort(values)[::-1]
+            if len(marked) == 1:
+                # המרחק של העיגול השני בגובהו מסף הסימון
+                confidence = min(1.0, (ordered[0] - ordered[1]) / self.BUBBLE_MARKED_FILL) if len(values) > 1 else 1.0
+            else:
+                confidence = max(0.0, 1 - ordered[0] / self.BUBBLE_MARKED_FILL) if len(marked) == 0 else 0.0
+
+            answers.append({
+                'question_number': question['question_number'],
+                'answer': int(marked[0]) if len(marked) == 1 else None,
+                'fill': [round(float(value), 3) for value in values],
+                'confidence': round(float(confidence), 3),
+                # שני סימונים, או סימון חלקי (מחיקה, V במקום מילוי)
+                'needs_review': len(marked) > 1 or len(faint) > 0
+            })
+        return answers
+
     def extract_grade_region(self, image, region_keywords=['ציון', 'סה"כ', 'נקודות']):
         """
         חילוץ אזור הציון מהתמונה
@@ -339,7 +999,7 @@ class ExamOCRService:
             תמונה של אזור הציון או None
         """
         # OCR מלא לזיהוי המיקום
-        data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, lang='heb+eng')
+        data = tesseract_backend.image_to_data(image, lang='heb+eng')
 
         # חיפוש מילות המפתח
         grade_regions = []
@@ -411,12 +1071,14 @@ class ExamOCRService:
 
         return None
 
-    def process_single_page(self, image) -> Dict:
+    def process_single_page(self, image, page_dpi=None, render_page=None) -> Dict:
         """
         עיבוד עמוד בודד של מבחן
 
         Args:
             image: תמונה של העמוד
+            page_dpi: הרזולוציה של התמונה (לעמודי PDF)
+            render_page: פונקציה להמרת העמוד ברזולוציה אחרת - מפעילה זיהוי QR ברזולוציה מדורגת
 
         Returns:
             dict עם התוצאות
@@ -434,27 +1096,68 @@ class ExamOCRService:
             if isinstance(image, Image.Image):
                 image = np.array(image)
 
-            # תיקון הטיה
+            # הערכת ההטיה על תמונה מוקטנת - הסיבוב עצמו נעשה רק על האזור שנקרא
             try:
-                image = self.deskew_image(image)
+                angle = self.estimate_skew(image)
             except Exception as e:
+                angle = 0.0
                 result['errors'].append(f'Deskew failed: {str(e)}')
+            result['skew_angle'] = angle
 
             # קריאת QR code
-            qr_data = self.read_qr_code(image)
+            if render_page is not None:
+                qr_data, result['qr_dpi'], qr_rect = self.read_qr_code_adaptive(image, page_dpi, render_page)
+            else:
+                qr_data, qr_rect = self.read_qr_code(image, with_rect=True)
             if qr_data:
                 result['qr_data'] = qr_data
             else:
                 result['errors'].append('No QR code found')
 
-            # עיבוד מקדים
-            processed = self.preprocess_image(image)
-
-            # חילוץ אזור הציון
-            grade_region = self.extract_grade_region(processed)
+            layout = self.get_layout(qr_data)
+            if qr_data:
+                # המפה שלפיה נקרא העמוד - המטמון בודק מולה אם התבנית פורסמה מחדש מאז
+                result['layout_key'] = self.layout_hash(layout)
+
+            # גיליון תשובות - הבדיקה מול מפתח התשובות נעשית בשמירה (apply_answer_key)
+            if layout and 'answer_grid' in layout.get('regions', {}):
+                answers = self.read_answer_grid(image, layout, qr_rect, angle)
+                if answers is None:
+                    result['errors'].append('Answer grid not found')
+                else:
+                    result['answers'] = answers
+
+            # ריבועי ספרות בתבנית - כל ספרה מסווגת לבד, בלי טסרקט
+            boxes = None
+            if layout and 'grade_boxes' in layout.get('regions', {}):
+                boxes = self.read_digit_boxes(image, layout, qr_rect, angle)
+            if boxes is not None:
+                result['grade_region_source'] = 'digit_boxes'
+                result['needs_review'] = boxes.pop('needs_review')
+                result['ocr_text'] = ''.join('_' if digit is None else str(digit) for digit in boxes['digits'])
+                if boxes['score'] is None:
+                    result['errors'].append('Grade boxes are empty')
+                else:
+                    result['grade'] = boxes
+                    result['confidence'] = boxes['confidence']
+                return self._finish_page(image, result)
+
+            # אזור הציון לפי מפת התבנית - בלי OCR על כל הדף
+            grade_region = None
+            if layout:
+                grade_region = self.crop_layout_region(image, layout, 'grade', qr_rect, self.GRADE_MARGIN_CM, angle)
+
+            if grade_region is not None:
+                result['grade_region_source'] = 'layout'
+                grade_region = self.preprocess_image(grade_region)
+            else:
+                # גיבוי: עיבוד כל הדף וחיפוש המילה "ציון" ב-OCR
+                result['grade_region_source'] = 'ocr_search'
+                processed = self.preprocess_image(self.deskew_image(image, angle))
+                grade_region = self.extract_grade_region(processed)
 
             # OCR על אזור הציון
-            grade_text = pytesseract.image_to_string(
+            grade_text = tesseract_backend.image_to_string(
                 grade_region,
                 config=self.tesseract_config,
                 lang='eng'
@@ -472,83 +1175,486 @@ class ExamOCRService:
         except Exception as e:
             result['errors'].append(f'Processing error: {str(e)}')
 
+        return self._finish_page(image, result)
+
+    def _finish_page(self, image, result):
+        """רישום עמוד שלא נקרא במלואו ושמירת תמונת אבחון"""
+        if result['errors']:
+            logger.info("page_incomplete qr=%s errors=%s", bool(result['qr_data']), result['errors'])
+        scan_diagnostics.capture_page(image, result)
+
         return result
 
-    def process_pdf(self, pdf_path: str, max_workers: int = 4) -> List[Dict]:
+    def process_pdf(self, pdf_path: str, max_workers: int = 4, on_result=None) -> List[Dict]:
         """
         עיבוד PDF של מבחנים סרוקים
+        כל עמוד נבדק קודם: עמוד דיגיטלי (טקסט ו-QR וקטורי) נקרא ישירות מה-PDF,
+        ורק עמודים סרוקים באמת עוברים המרה לתמונה ו-OCR.
+        קובץ או עמוד שכבר נסרקו (אותו hash) נלקחים מהמטמון
 
         Args:
             pdf_path: נתיב לקובץ PDF
             max_workers: מספר threads למקביליות
+            on_result: פונקציה שנקראת עם כל תוצאה ברגע שהיא מוכנה - לפני שכל הקובץ הסתיים (אופציונלי)
 
         Returns:
-            list של תוצאות לכל עמוד
-        """
-        # תחילה, נסה לקרוא metadata מה-PDF (הפתרון היצירתי!)
-        metadata_info = self.read_pdf_metadata(pdf_path)
-        if metadata_info:
-            print("SUCCESS! Found exam data in PDF metadata - no barcode needed!")
-            # אם מצאנו metadata, נחזיר תוצאה מיידית בלי סריקה
-            return [{
-                'page_number': 1,
-                'qr_data': metadata_info,
-                'grade': {'score': '-', 'total': '-'},
-                'confidence': 1.0,
-                'metadata_source': True  # סימן שזה מmetadata
-            }]
-
-        # אם אין metadata, נמשיך עם הסריקה הרגילה
-        print("No metadata found, falling back to barcode scanning...")
-
-        # פתיחת ה-PDF
+            list של תוצאות - לכל עמוד סרוק, ולכל תלמיד בעמודים הדיגיטליים
+        """
+        # מפות אזורים שפורסמו מאז הסריקה הקודמת נקראות מחדש
+        self.clear_layouts()
+
+        # אותו קובץ בדיוק כבר נסרק - בלי לפתוח אותו בכלל
+        file_key = file_hash(pdf_path) if self.result_cache else None
+        if file_key:
+            cached = self._cache_get([file_key]).get(file_key)
+            if cached is not None and all(self._cache_valid(result) for result in cached):
+                logger.info("scan_cache_hit path=%s results=%d", pdf_path, len(cached))
+                results = self._without_layout_keys([dict(result, cached=True) for result in cached])
+                for result in results:
+                    if on_result:
+                        on_result(result)
+                return results
+
+        # PDF כיתתי מאוחד - כל תלמיד מזוהה לפי טווח העמודים שלו
+        page_map = self.read_pdf_page_map(pdf_path)
+        # PDF של תלמיד אחד - הפרטים שלו ב-metadata
+        metadata_info = None if page_map else self.read_pdf_metadata(pdf_path)
+
         doc = fitz.open(pdf_path)
+        try:
+            scanned = [page_num for page_num in range(len(doc)) if self.is_scanned_page(doc[page_num])]
+            digital = sorted(set(range(len(doc))) - set(scanned))
+            results = self.read_text_layer_pages(doc, digital, page_map, metadata_info) if digital else []
+            page_keys = {page_num: page_hash(doc, page_num) for page_num in scanned} if file_key else {}
+        finally:
+            doc.close()
+
+        # עמודים סרוקים שלא השתנו מהעלאה קודמת (למשל כשרק עמוד אחד נסרק מחדש)
+        cached_pages = self._cache_get(list(page_keys.values())) if page_keys else {}
+        cached_pages = {key: result for key, result in cached_pages.items() if self._cache_valid(result)}
+        pending = [page_num for page_num in scanned if page_keys.get(page_num) not in cached_pages]
+        for page_num in scanned:
+            if page_num not in pending:
+                results.append(dict(cached_pages[page_keys[page_num]], page_number=page_num + 1, cached=True))
+
+        logger.info("pdf_scan_start path=%s digital_pages=%d scanned_pages=%d cached_pages=%d",
+                    pdf_path, len(digital), len(scanned), len(scanned) - len(pending))
+
+        if on_result:
+            # מה שכבר מוכן - עמודים דיגיטליים ועמודים מהמטמון
+            for result in sorted(results, key=lambda x: x['page_number']):
+                on_result(result)
+
+        def finish(result):
+            # עמוד סרוק שה-QR שלו לא זוהה - התלמיד לפי מפת העמודים, אם יש
+            if not result.get('qr_data'):
+                identity = self._page_map_identity(page_map, result['page_number'] - 1)
+                if identity:
+                    result['qr_data'] = identity
+                    result['errors'] = [e for e in result.get('errors', []) if e != 'No QR code found']
+            if on_result:
+                on_result(result)
+
+        if pending:
+            if self.engine is not None:
+                scanned_results = self.engine.process_pdf_pages(pdf_path, pending, on_result=finish)
+            else:
+                scanned_results = self._process_pdf_pages(pdf_path, max_workers, pending, on_result=finish)
+
+            if page_keys:
+                self._cache_put({page_keys[result['page_number'] - 1]: result for result in scanned_results})
+            results += scanned_results
+
+        results.sort(key=lambda x: x['page_number'])
+        if file_key:
+            self._cache_put({file_key: results})
+        return self._without_layout_keys(results)
+
+    def process_image_file(self, image_path: str) -> Dict:
+        """
+        עיבוד קובץ תמונה של עמוד בודד - מהמטמון אם אותה תמונה כבר נסרקה
+
+        Args:
+            image_path: נתיב לתמונה
 
-        # עיבוד מקבילי של העמודים
+        Returns:
+            dict עם התוצאות
+        """
+        self.clear_layouts()
+
+        file_key = file_hash(image_path) if self.result_cache else None
+        if file_key:
+            cached = self._cache_get([file_key]).get(file_key)
+            if cached is not None and self._cache_valid(cached):
+                logger.info("scan_cache_hit path=%s results=1", image_path)
+                return self._without_layout_keys([dict(cached, cached=True)])[0]
+
+        with Image.open(image_path) as img:
+            result = self.process_single_page(img)
+
+        if file_key:
+            self._cache_put({file_key: result})
+        return self._without_layout_keys([result])[0]
+
+    def _cache_get(self, keys):
+        """תוצאות שמורות שלא פג תוקפן, לפי מפתח. תקלה במטמון לא עוצרת את הסריקה"""
+        try:
+            return self.result_cache.get_scan_cache(keys, SCAN_CACHE_TTL_HOURS)
+        except Exception as e:
+            logger.warning("scan_cache_read_failed error=%s", e)
+            return {}
+
+    def _cache_put(self, entries):
+        """שמירת תוצאות במטמון - בלי תוצאות שנכשלו מסיבה זמנית, שייסרקו שוב בפעם הבאה"""
+        def cacheable(result):
+            return not any(error.startswith(TRANSIENT_ERRORS) for error in result.get('errors', []))
+
+        def strip(result):
+            # תוצאה שנלקחה מהמטמון נשמרת כמו תוצאה רגילה, עם מפתח התבנית שלפיה נקראה (layout_key)
+            return {k: v for k, v in result.items() if k != 'cached'}
+
+        stored = {}
+        for key, value in entries.items():
+            if isinstance(value, list):
+                if all(cacheable(result) for result in value):
+                    stored[key] = [strip(result) for result in value]
+            elif cacheable(value):
+                stored[key] = strip(value)
+
+        if not stored:
+            return
+        try:
+            self.result_cache.put_scan_cache(stored, SCAN_CACHE_TTL_HOURS)
+        except Exception as e:
+            logger.warning("scan_cache_write_failed error=%s", e)
+
+    @staticmethod
+    def layout_hash(layout):
+        """hash של מפת אזורים - משתנה כשהתבנית של המבחן והגרסה מתפרסמת מחדש (None - בלי מפה)"""
+        if not layout:
+            return None
+        return hashlib.sha256(json.dumps(layout, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def _without_layout_keys(results):
+        """הסרת layout_key מהתוצאות שחוזרות לקורא - הוא נחוץ רק למטמון"""
+        for result in results:
+            result.pop('layout_key', None)
+        return results
+
+    def _cache_valid(self, result):
+        """
+        האם תוצאה מהמטמון עדיין נכונה - המפתח שלה נגזר רק מתוכן הסריקה, אבל התוצאה תלויה גם במסד הנתונים
+        פרטי התלמיד של טוקן מספרי נקראים מחדש (ההקצאה אולי השתנתה), והציון נשאר רק אם מפת האזורים
+        של המבחן והגרסה היא אותה מפה שלפיה נקרא. מעדכן את התוצאה במקום
+
+        Args:
+            result: תוצאה שנשלפה מהמטמון
+
+        Returns:
+            True אם אפשר להשתמש בתוצאה, False אם צריך לסרוק את העמוד מחדש
+        """
+        qr_data = result.get('qr_data')
+        if qr_data and qr_data.get('student_exam_id') is not None and self.qr_lookup:
+            qr_data = result['qr_data'] = self._resolve_token(qr_data['student_exam_id'])
+        if 'layout_key' not in result:
+            # ה-QR לא זוהה בעמוד - הוא נקרא בלי מפת אזורים, והתוצאה לא תלויה בה
+            return True
+        return result['layout_key'] == self.layout_hash(self.get_layout(qr_data))
+
+    def is_scanned_page(self, page):
+        """
+        עמוד סרוק = תמונות שמכסות יחד את רוב העמוד. עמוד בלי תמונות כאלה נוצר דיגיטלית ונקרא בלי OCR
+        הכיסוי נמדד לפי האיחוד של כל התמונות - יש סורקים ששומרים עמוד כמה רצועות,
+        ותמונות חופפות (אותה תמונה פעמיים) לא נספרות פעמיים
+        """
+        rects = [fitz.Rect(info['bbox']) & page.rect for info in page.get_image_info()]
+        rects = [rect for rect in rects if not rect.is_empty]
+        return self._union_area(rects) >= self.SCANNED_IMAGE_COVERAGE * abs(page.rect)
+
+    @staticmethod
+    def _union_area(rects):
+        """השטח שמכסה איחוד המלבנים - לכל רצועה אנכית בין קצוות המלבנים, אורך האיחוד של הקטעים בה"""
+        xs = sorted({x for rect in rects for x in (rect.x0, rect.x1)})
+        area = 0
+        for left, right in zip(xs, xs[1:]):
+            spans = sorted((rect.y0, rect.y1) for rect in rects if rect.x0 <= left and rect.x1 >= right)
+            covered, end = 0, None
+            for top, bottom in spans:
+                if end is None or top > end:
+                    covered += bottom - top
+                    end = bottom
+                elif bottom > end:
+                    covered += bottom - end
+                    end = bottom
+            area += covered * (right - left)
+        return area
+
+    def _page_map_identity(self, page_map, page_num):
+        """פרטי התלמיד של עמוד (מ-0) לפי /YeshivaPages, או None"""
+        for section in page_map or []:
+            if section['first_page'] <= page_num + 1 <= section['last_page']:
+                return {
+                    'student_id': section['student_id'],
+                    'exam_id': section['exam_id'],
+                    'student_name': section.get('student_name', ''),
+                    'version': section.get('version', 'A')
+                }
+        return None
+
+    def _read_vector_qr(self, page):
+        """קריאת QR וקטורי מעמוד דיגיטלי - המרה מהירה באפור ברזולוציה נמוכה, הקוד חד ולא צריך עיבוד"""
+        zoom = self.TEXT_LAYER_QR_DPI / 72
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY)
+        # samples - עותק שמחזיק את עצמו, התמונה לא תלויה ב-pixmap
+        image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+        image = np.ascontiguousarray(image)
+
+        for decoder in ('pyzbar', 'zxing'):
+            try:
+                codes = self._decode_codes(decoder, image)
+            except ImportError:
+                continue
+            if codes:
+                return self._parse_code_data(codes[0].data.decode('utf-8'))
+        return None
+
+    def _typed_entries(self, page, rect=None):
+        """טקסט שהוקלד על העמוד - תוכן הערות ושדות טופס, רק אלה שחופפים ל-rect אם ניתן"""
+        entries = []
+        for annot in page.annots():
+            content = (annot.info.get('content') or '').strip()
+            if content:
+                entries.append((annot.rect, content))
+        for widget in page.widgets():
+            value = widget.field_value
+            if value not in (None, '', 'Off', False):
+                entries.append((widget.rect, str(value)))
+
+        if rect is not None:
+            entries = [(entry_rect, text) for entry_rect, text in entries if entry_rect.intersects(rect)]
+        return [text for _, text in entries]
+
+    def _grade_rect(self, page, layout, page_offset):
+        """
+        אזור הציון בעמוד לפי מפת התבנית (עם השוליים של כתב יד)
+
+        Returns:
+            fitz.Rect, None אם אין מפה, או False אם אזור הציון לא בעמוד הזה
+        """
+        region = (layout or {}).get('regions', {}).get('grade')
+        if not region:
+            return None
+        if region['page'] != page_offset:
+            return False
+
+        width, height = page.rect.width, page.rect.height
+        cm = 72 / 2.54
+        margins = self.GRADE_MARGIN_CM
+        return fitz.Rect(
+            region['x0'] * width - margins['side'] * cm,
+            region['y0'] * height - margins['top'] * cm,
+            region['x1'] * width + margins['side'] * cm,
+            region['y1'] * height + margins['bottom'] * cm
+        )
+
+    def read_text_layer_pages(self, doc, page_numbers, page_map=None, metadata_info=None):
+        """
+        קריאת עמודים דיגיטליים ישירות מה-PDF - בלי המרה ל-300 DPI ובלי OCR
+        התלמיד מזוהה לפי מפת העמודים, ה-QR הווקטורי או העמוד שלפניו; הציון - מהערה או שדה טופס שהוקלדו
+
+        Args:
+            doc: מסמך fitz פתוח
+            page_numbers: מספרי העמודים הדיגיטליים (מ-0)
+            page_map: /YeshivaPages (אופציונלי)
+            metadata_info: /YeshivaData - לעמודים שאין דרך אחרת לזהות (אופציונלי)
+
+        Returns:
+            list של תוצאות - אחת לכל רצף עמודים של תלמיד
+        """
+        sections = []
+        for page_num in page_numbers:
+            identity = self._page_map_identity(page_map, page_num)
+            from_metadata = identity is not None
+            if identity is None:
+                identity = self._read_vector_qr(doc[page_num])
+
+            current = sections[-1] if sections else None
+            contiguous = current is not None and current['pages'][-1] == page_num - 1
+            same_student = (identity is None or (current is not None and current['qr_data'] is not None and
+                            identity.get('student_id') == current['qr_data'].get('student_id') and
+                            identity.get('exam_id') == current['qr_data'].get('exam_id')))
+
+            if contiguous and same_student:
+                # עמוד המשך של אותו מבחן
+                current['pages'].append(page_num)
+            else:
+                if identity is None and metadata_info:
+                    identity, from_metadata = metadata_info, True
+                sections.append({'qr_data': identity, 'pages': [page_num], 'metadata_source': from_metadata})
+
+        return [self._text_layer_result(doc, section) for section in sections]
+
+    def _text_layer_result(self, doc, section):
+        """תוצאה לתלמיד אחד מהעמודים הדיגיטליים שלו"""
+        qr_data = section['qr_data']
+        pages = section['pages']
+        result = {
+            'page_number': pages[0] + 1,
+            'pages': [pages[0] + 1, pages[-1] + 1],
+            'qr_data': qr_data,
+            'grade': None,
+            'ocr_text': '',
+            'confidence': 0,
+            'errors': [],
+            'text_layer': True,
+            'metadata_source': section['metadata_source']
+        }
+
+        layout = self.get_layout(qr_data)
+        if qr_data:
+            result['layout_key'] = self.layout_hash(layout)
+        entries = []
+        for offset, page_num in enumerate(pages):
+            page = doc[page_num]
+            rect = self._grade_rect(page, layout, offset)
+            if rect is not False:
+                entries += self._typed_entries(page, rect)
+
+        result['ocr_text'] = ' '.join(entries)
+        grade = self.read_grade_from_text(result['ocr_text']) if entries else None
+        if grade:
+            # טקסט שהוקלד באזור הציון - אין אי-ודאות של זיהוי
+            if layout:
+                grade['confidence'] = 1.0
+            result['grade'] = grade
+            result['confidence'] = grade['confidence']
+
+        if not qr_data:
+            result['errors'].append('No QR code found')
+        if not grade:
+            result['errors'].append('No typed grade found')
+
+        logger.debug("text_layer_section pages=%s qr=%s grade=%s", result['pages'], bool(qr_data), grade)
+        return result
+
+    @staticmethod
+    def failed_page_result(page_num, message):
+        """תוצאה לעמוד שלא ניתן היה לעבד (page_num מ-0)"""
+        return {
+            'page_number': page_num + 1,
+            'qr_data': None,
+            'grade': None,
+            'ocr_text': '',
+            'confidence': 0,
+            'errors': [message]
+        }
+
+    def _render_pdf_page(self, doc, page_num, dpi, render_lock):
+        """
+        המרת עמוד PDF לתמונה - ה-pixmap משתחרר מיד, נשארת רק תמונת ה-PIL
+
+        Args:
+            doc: מסמך fitz פתוח
+            page_num: מספר עמוד (מ-0)
+            dpi: רזולוציה
+            render_lock: נעילה - fitz לא בטוח לשימוש מכמה threads במקביל
+
+        Returns:
+            תמונת PIL
+        """
+        zoom = dpi / 72
+        matrix = fitz.Matrix(zoom, zoom)
+
+        with render_lock:
+            pix = doc[page_num].get_pixmap(matrix=matrix)
+            # samples_mv - בלי עותק ביניים של ה-pixmap בזמן ההמרה
+            img = Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", pix.stride, 1).copy()
+            pix = None
+
+            # MuPDF שומר במטמון את התמונה הסרוקה המפוענחת של כל עמוד - לא נחוצה שוב, משחררים
+            fitz.TOOLS.store_shrink(100)
+
+        logger.debug("page_rendered page=%d size=%s dpi=%d", page_num + 1, img.size, dpi)
+        return img
+
+    def _process_pdf_pages(self, pdf_path: str, max_workers: int, page_numbers=None, on_result=None) -> List[Dict]:
+        """
+        סריקת עמודי PDF במאגר ה-threads
+        העמודים מומרים לתמונה (PAGE_DPI) רק כשיש מקום, ומשתחררים מיד אחרי העיבוד -
+        כך שבזיכרון יש לכל היותר max_workers + PAGE_QUEUE_SIZE עמודים, בלי קשר לאורך המסמך
+
+        Args:
+            pdf_path: נתיב לקובץ PDF
+            max_workers: מספר העמודים שמעובדים במקביל
+            page_numbers: העמודים לסריקה (מ-0, ברירת מחדל - כולם)
+            on_result: פונקציה שנקראת עם תוצאת כל עמוד כשהיא מוכנה, מה-thread שעיבד אותו (אופציונלי)
+
+        Returns:
+            list של תוצאות לכל עמוד, לפי סדר העמודים
+        """
+        doc = fitz.open(pdf_path)
+        if page_numbers is None:
+            page_numbers = range(len(doc))
+        max_workers = max(1, min(max_workers, len(page_numbers)))
+
+        in_flight = threading.BoundedSemaphore(max_workers + self.PAGE_QUEUE_SIZE)
+        pool = get_page_pool()
+        futures = []
         results = []
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # שליחת כל עמוד לעיבוד
-            future_to_page = {}
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-
-                # המרה לתמונה ברזולוציה גבוהה מאוד - זה קריטי לזיהוי QR!
-                # QR code נוצר עם box_size=12 וborder=5, אז צריך רזולוציה גבוהה
-                # ב-PDF סרוק, איכות יורדת, אז נקרא ברזולוציה מאוד גבוהה
-                zoom = 10.0  # 720 DPI - רזולוציה מאוד גבוהה לסריקה
-
-                matrix = fitz.Matrix(zoom, zoom)
-                pix = page.get_pixmap(matrix=matrix)
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-                print(f"DEBUG PDF: Processing page {page_num + 1}, Image size: {img.size}, DPI: {zoom * 72}, Zoom: {zoom}")
-
-                # שליחה לעיבוד
-                future = executor.submit(self.process_single_page, img)
-                future_to_page[future] = page_num
-
-            # איסוף תוצאות
-            for future in as_completed(future_to_page):
-                page_num = future_to_page[future]
+        results_lock = threading.Lock()
+        render_lock = threading.Lock()
+
+        def add_result(result):
+            with results_lock:
+                results.append(result)
+            if on_result:
                 try:
-                    result = future.result()
-                    result['page_number'] = page_num + 1
-                    results.append(result)
+                    on_result(result)
                 except Exception as e:
-                    results.append({
-                        'page_number': page_num + 1,
-                        'qr_data': None,
-                        'grade': None,
-                        'ocr_text': '',
-                        'confidence': 0,
-                        'errors': [f'Page processing failed: {str(e)}']
-                    })
+                    # תקלה בדיווח לא עוצרת את הסריקה
+                    logger.warning("on_result_failed page=%s error=%s", result.get('page_number'), e)
 
-        doc.close()
+        def process(page_num, img):
+            try:
+                # רזולוציה גבוהה יותר מומרת רק לעמודים שה-QR שלהם לא זוהה
+                def render_page(dpi):
+                    return self._render_pdf_page(doc, page_num, dpi, render_lock)
+
+                result = self.process_single_page(img, PAGE_DPI, render_page)
+                result['page_number'] = page_num + 1
+            except Exception as e:
+                result = self.failed_page_result(page_num, f'Page processing failed: {str(e)}')
+            finally:
+                # שחרור התמונה לפני שהמקום מתפנה לעמוד הבא
+                img = None
+                in_flight.release()
+            add_result(result)
+
+        try:
+            for page_num in page_numbers:
+                # נחסם עד שאחד העמודים שבדרך מסתיים
+                in_flight.acquire()
+                try:
+                    img = self._render_pdf_page(doc, page_num, PAGE_DPI, render_lock)
+                except Exception as e:
+                    in_flight.release()
+                    add_result(self.failed_page_result(page_num, f'Page rendering failed: {str(e)}'))
+                    continue
+                futures.append(pool.submit(process, page_num, img))
+                img = None
+        finally:
+            # המסמך נשאר פתוח עד שכל העמודים הסתיימו - הם עוד עשויים להמיר אותו ברזולוציה גבוהה
+            for future in futures:
+                future.result()
+            doc.close()
 
         # מיון לפי מספר עמוד
         results.sort(key=lambda x: x['page_number'])
 
+        # מוני שיטות הזיהוי של הסריקה הזו - למסד הנתונים, גם אם לא הגיעו ל-flush_every
+        qr_strategy_stats.flush()
+
         return results
 
     def process_image_batch(self, image_paths: List[str], max_workers: int = 4) -> List[Dict]:
@@ -562,40 +1668,102 @@ class ExamOCRService:
         Returns:
             list של תוצאות
         """
+        if self.engine is not None:
+            return self._without_layout_keys(self.engine.process_image_files(image_paths))
+
+        self.clear_layouts()
         results = []
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_path = {}
+        executor = get_page_pool()
+        future_to_path = {}
 
-            for path in image_paths:
-                # טעינת התמונה
-                img = Image.open(path)
-                future = executor.submit(self.process_single_page, img)
-                future_to_path[future] = path
+        for path in image_paths:
+            # טעינת התמונה
+            img = Image.open(path)
+            future = executor.submit(self.process_single_page, img)
+            future_to_path[future] = path
 
-            # איסוף תוצאות
-            for future in as_completed(future_to_path):
-                path = future_to_path[future]
-                try:
-                    result = future.result()
-                    result['file_path'] = path
-                    results.append(result)
-                except Exception as e:
-                    results.append({
-                        'file_path': path,
-                        'qr_data': None,
-                        'grade': None,
-                        'ocr_text': '',
-                        'confidence': 0,
-                        'errors': [f'Image processing failed: {str(e)}']
-                    })
+        # איסוף תוצאות
+        for future in as_completed(future_to_path):
+            path = future_to_path[future]
+            try:
+                result = future.result()
+                result['file_path'] = path
+                results.append(result)
+            except Exception as e:
+                results.append({
+                    'file_path': path,
+                    'qr_data': None,
+                    'grade': None,
+                    'ocr_text': '',
+                    'confidence': 0,
+                    'errors': [f'Image processing failed: {str(e)}']
+                })
 
-        return results
+        qr_strategy_stats.flush()
+
+        return self._without_layout_keys(results)
+
+
+def apply_answer_key(result: Dict, key: Optional[Dict]) -> Dict:
+    """
+    בדיקת גיליון התשובות מול מפתח התשובות - ציון לכל שאלת רב ברירה,
+    ובמבחן שכולו רב ברירה גם הציון הכולל (אלא אם המורה כתב ציון בריבועים או תיקן ידנית)
+
+    Args:
+        result: תוצאת עמוד מ-process_single_page (עם answers)
+        key: מפתח התשובות של המבחן מ-ExamDatabase.get_answer_keys
+
+    Returns:
+        result, עם question_grades
+    """
+    answers = result.get('answers')
+    if not answers or not key:
+        return result
+
+    question_grades = []
+    for answer in answers:
+        question = key['questions'].get(answer['question_number'])
+        if not question or question['correct_answer'] is None:
+            continue
+        marked = '-' if answer['answer'] is None else answer['answer'] + 1
+        question_grades.append({
+            'question_id': question['id'],
+            'question_number': answer['question_number'],
+            'points_earned': question['points'] if answer['answer'] == question['correct_answer'] else 0,
+            'points_possible': question['points'],
+            'feedback': f"OMR: {marked}"
+        })
+    result['question_grades'] = question_grades
+
+    review = any(answer['needs_review'] for answer in answers)
+    grade = result.get('grade')
+    if (key['all_multiple_choice'] and question_grades and not result.get('manually_edited')
+            and (grade is None or grade.get('source') == 'answer_grid')):
+        score = sum(q['points_earned'] for q in question_grades)
+        total = sum(q['points_possible'] for q in question_grades)
+        confidence = min(answer['confidence'] for answer in answers)
+        result['grade'] = {
+            'score': score,
+            'total': total,
+            'percentage': round(score / total * 100, 2) if total else None,
+            'confidence': confidence,
+            'source': 'answer_grid'
+        }
+        result['confidence'] = confidence
+        result['needs_review'] = review
+        # במבחן רב ברירה הריבועים נשארים ריקים - זו לא שגיאה
+        result['errors'] = [error for error in result.get('errors', []) if error != 'Grade boxes are empty']
+    elif review:
+        result['needs_review'] = True
+
+    return result
 
 
 def save_grades_to_database(ocr_results: List[Dict], db, graded_by: str = 'OCR') -> Dict:
     """
-    שמירת ציונים במסד הנתונים
+    שמירת ציונים במסד הנתונים - כל הסריקה בטרנזקציה אחת
+    שמירה חוזרת של אותה סריקה מעדכנת את הציונים הקיימים ולא מוסיפה כפולים
 
     Args:
         ocr_results: תוצאות OCR
@@ -608,66 +1776,82 @@ def save_grades_to_database(ocr_results: List[Dict], db, graded_by: str = 'OCR')
     stats = {
         'total': len(ocr_results),
         'saved': 0,
+        'updated': 0,
+        'duplicates': 0,
+        'needs_review': 0,
+        'question_grades': 0,
         'failed': 0,
         'errors': []
     }
 
+    # גיליונות תשובות - כל מפתחות התשובות בשאילתה אחת
+    exam_ids = [result['qr_data'].get('exam_id') for result in ocr_results
+                if result.get('answers') and result.get('qr_data')]
+    answer_keys = db.get_answer_keys([int(exam_id) for exam_id in exam_ids if exam_id])
     for result in ocr_results:
-        try:
-            # בדיקה שיש QR data וציון
-            if not result.get('qr_data') or not result.get('grade'):
-                stats['failed'] += 1
-                stats['errors'].append(f"Page {result.get('page_number', 'unknown')}: Missing QR or grade data")
-                continue
-
-            qr_data = result['qr_data']
-            grade = result['grade']
-
-            student_id = qr_data.get('student_id')
-            exam_id = qr_data.get('exam_id')
+        if result.get('answers') and result.get('qr_data') and result['qr_data'].get('exam_id'):
+            apply_answer_key(result, answer_keys.get(int(result['qr_data']['exam_id'])))
 
-            if not student_id or not exam_id:
-                stats['failed'] += 1
-                stats['errors'].append(f"Page {result.get('page_number', 'unknown')}: Invalid QR data")
-                continue
+    # ציון אחד לכל (תלמיד, מבחן) - אם כמה עמודים שייכים לאותו מבחן, הציון עם האמינות הגבוהה ביותר
+    grades = {}
+    for result in ocr_results:
+        page = result.get('page_number', 'unknown')
 
-            # חיפוש student_exam_id
-            conn = db.connect()
-            cursor = conn.cursor()
+        # בדיקה שיש QR data וציון
+        if not result.get('qr_data') or not result.get('grade'):
+            stats['failed'] += 1
+            stats['errors'].append(f"Page {page}: Missing QR or grade data")
+            continue
 
-            cursor.execute('''
-                SELECT id FROM student_exams
-                WHERE student_id = ? AND exam_id = ?
-                ORDER BY scheduled_date DESC
-                LIMIT 1
-            ''', (student_id, exam_id))
+        qr_data = result['qr_data']
+        student_id = qr_data.get('student_id')
+        exam_id = qr_data.get('exam_id')
 
-            row = cursor.fetchone()
+        if not student_id or not exam_id:
+            stats['failed'] += 1
+            stats['errors'].append(f"Page {page}: Invalid QR data")
+            continue
 
-            if not row:
-                stats['failed'] += 1
-                stats['errors'].append(f"Student {student_id} not assigned to exam {exam_id}")
-                conn.close()
+        try:
+            score = float(result['grade']['score'])
+        except (KeyError, TypeError, ValueError):
+            stats['failed'] += 1
+            stats['errors'].append(f"Page {page}: Invalid grade {result['grade'].get('score')!r}")
+            continue
+
+        key = (int(student_id), int(exam_id))
+        confidence = result.get('confidence', 0) or 0
+        if key in grades:
+            stats['duplicates'] += 1
+            if confidence <= grades[key]['ocr_confidence']:
                 continue
 
-            student_exam_id = row[0]
-
-            # שמירת הציון
-            db.save_exam_grade(
-                student_exam_id=student_exam_id,
-                total_score=grade['score'],
-                graded_by=graded_by,
-                grading_method='ocr',
-                ocr_confidence=result.get('confidence', 0),
-                notes=f"OCR: {result.get('ocr_text', '')[:100]}"
-            )
-
-            stats['saved'] += 1
-            conn.close()
+        grades[key] = {
+            'student_id': key[0],
+            'exam_id': key[1],
+            'total_score': int(score) if score.is_integer() else score,
+            'ocr_confidence': confidence,
+            # ציון שתוקן ידנית במסך הסריקה כבר נבדק
+            'needs_review': bool(result.get('needs_review')) and not result.get('manually_edited'),
+            'notes': f"OCR: {(result.get('ocr_text') or '')[:100]}",
+            'question_grades': result.get('question_grades')
+        }
 
-        except Exception as e:
-            stats['failed'] += 1
-            stats['errors'].append(f"Error saving grade: {str(e)}")
+    try:
+        saved = db.save_exam_grades_bulk(list(grades.values()), graded_by=graded_by, grading_method='ocr')
+    except Exception as e:
+        stats['failed'] += len(grades)
+        stats['errors'].append(f"Error saving grades: {str(e)}")
+        return stats
+
+    stats['saved'] = saved['saved'] + saved['updated']
+    stats['updated'] = saved['updated']
+    stats['question_grades'] = saved['question_grades']
+    missing = set(saved['missing'])
+    stats['needs_review'] = sum(1 for key, grade in grades.items() if grade['needs_review'] and key not in missing)
+    stats['failed'] += len(saved['missing'])
+    stats['errors'] += [f"Student {student_id} not assigned to exam {exam_id}"
+                        for student_id, exam_id in saved['missing']]
 
     return stats
 
@@ -685,7 +1869,7 @@ def process_scanned_pdf(pdf_path: str, db) -> Dict:
     Returns:
         dict עם התוצאות והסטטיסטיקות
     """
-    ocr = ExamOCRService()
+    ocr = ExamOCRService(layout_lookup=db.get_exam_layout, qr_lookup=db.get_student_exam_identity)
 
     # עיבוד ה-PDF
     results = ocr.process_pdf(pdf_path)
@@ -710,7 +1894,7 @@ def process_scanned_images(image_paths: List[str], db) -> Dict:
     Returns:
         dict עם התוצאות והסטטיסטיקות
     """
-    ocr = ExamOCRService()
+    ocr = ExamOCRService(layout_lookup=db.get_exam_layout, qr_lookup=db.get_student_exam_identity)
 
     # עיבוד התמונות
     results = ocr.process_image_batch(image_paths)
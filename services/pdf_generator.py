@@ -7,17 +7,265 @@ import os
 import io
 import json
 import qrcode
-import barcode
-from barcode.writer import ImageWriter
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
 from datetime import datetime
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Flowable
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase.pdfdoc import PDFInfo, PDFDictionary, PDFString
+from reportlab.pdfgen.canvas import Canvas
 from reportlab.lib.enums import TA_RIGHT, TA_CENTER
+from services import bidi_text
+from services.qr_token import encode_token
+
+
+class ExamDocInfo(PDFInfo):
+    """
+    מילון /Info של ה-PDF עם שדות מותאמים אישית (כמו /YeshivaData)
+    השדות הרגילים (כותרת, מחבר, נושא) נקבעים דרך setTitle/setAuthor/setSubject של ה-Canvas;
+    כאן רק מוסיפים את השדות שלנו בסוף המילון ש-ReportLab בונה
+    """
+
+    def __init__(self, custom_fields=None):
+        super().__init__()
+        self.custom_fields = custom_fields or {}
+
+    def format(self, document):
+        standard = super().format(document)
+        if not self.custom_fields:
+            return standard
+
+        # המפתחות נשמרים בלי ה-'/' המוביל
+        custom = PDFDictionary({
+            key.lstrip('/'): PDFString(str(value)) for key, value in self.custom_fields.items()
+        }).format(document)
+        return standard[:standard.rindex(b'>>')] + custom[custom.index(b'<<') + 2:]
+
+
+def metadata_canvasmaker(custom_fields):
+    """
+    יצירת canvasmaker ל-SimpleDocTemplate שמטמיע metadata מותאם ב-/Info
+    ל-ReportLab אין API ציבורי לשדות מותאמים, לכן זה המקום היחיד שנוגע ב-_doc.info;
+    SimpleDocTemplate קורא ל-setTitle/setAuthor/setSubject אחרי יצירת ה-Canvas, כך שהם נכתבים לאותו מילון
+
+    Args:
+        custom_fields: dict של שדות (למשל {'/YeshivaData': '...'})
+
+    Returns:
+        פונקציה שיוצרת Canvas
+    """
+    def make_canvas(*args, **kwargs):
+        canv = Canvas(*args, **kwargs)
+        canv._doc.info = ExamDocInfo(custom_fields)
+        return canv
+    return make_canvas
+
+
+class LayoutSlot(Flowable):
+    """
+    Flowable שתופס מקום בעמוד ורושם את המיקום המוחלט שלו בזמן הציור
+    משמש לתבניות: התוכן עצמו מוטבע אחר כך בשכבה נפרדת באותו מיקום
+    """
+
+    def __init__(self, name, flowable, registry, draw_content=False, info=None):
+        super().__init__()
+        self.name = name
+        self.flowable = flowable
+        self.registry = registry
+        self.draw_content = draw_content
+        self.info = info or {}
+        self.hAlign = getattr(flowable, 'hAlign', 'LEFT')
+
+    def wrap(self, availWidth, availHeight):
+        self.width, self.height = self.flowable.wrap(availWidth, availHeight)
+        return self.width, self.height
+
+    def getSpaceBefore(self):
+        return self.flowable.getSpaceBefore()
+
+    def getSpaceAfter(self):
+        return self.flowable.getSpaceAfter()
+
+    def draw(self):
+        x, y = self.canv.absolutePosition(0, 0)
+        self.registry[self.name] = {
+            'page': self.canv.getPageNumber() - 1,
+            'x': x,
+            'y': y,
+            'width': self.width,
+            'height': self.height,
+            **self.info
+        }
+        if self.draw_content:
+            self.flowable.drawOn(self.canv, 0, 0)
+
+
+class VectorQRCode(Flowable):
+    """
+    QR code שמצויר כמסלול וקטורי ישירות על ה-canvas
+    בלי PIL ובלי קידוד PNG - קובץ קטן יותר ומודולים חדים בכל רזולוציית סריקה
+    """
+
+    def __init__(self, data, width, height, border=5):
+        super().__init__()
+        qr = qrcode.QRCode(
+            error_correction=qrcode.constants.ERROR_CORRECT_H,  # 30% תיקון שגיאות!
+            border=border,  # שוליים רחבים לסריקה קלה
+        )
+        qr.add_data(data)
+        qr.make(fit=True)
+
+        self.matrix = qr.get_matrix()
+        self.width = width
+        self.height = height
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        modules = len(self.matrix)
+        module_width = self.width / modules
+        module_height = self.height / modules
+
+        # רקע לבן - גם השוליים השקטים סביב הקוד
+        self.canv.setFillColor(colors.white)
+        self.canv.rect(0, 0, self.width, self.height, fill=1, stroke=0)
+
+        # כל רצף של מודולים שחורים בשורה הופך למלבן אחד
+        path = self.canv.beginPath()
+        for row_index, row in enumerate(self.matrix):
+            y = self.height - (row_index + 1) * module_height
+            col = 0
+            while col < modules:
+                if row[col]:
+                    start = col
+                    while col < modules and row[col]:
+                        col += 1
+                    path.rect(start * module_width, y, (col - start) * module_width, module_height)
+                else:
+                    col += 1
+
+        self.canv.setFillColor(colors.black)
+        self.canv.drawPath(path, fill=1, stroke=0)
+
+
+class DigitBoxes(Flowable):
+    """
+    שורת ריבועים לציון - ספרה אחת בכל ריבוע, כך שהסורק קורא כל ספרה לבד במקום OCR על כתב יד חופשי
+    """
+
+    def __init__(self, count, box_size=1.0*cm, gap=0.2*cm):
+        super().__init__()
+        self.count = count
+        self.box_size = box_size
+        self.gap = gap
+        self.width = count * box_size + (count - 1) * gap
+        self.height = box_size
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        self.canv.setStrokeColor(colors.black)
+        self.canv.setLineWidth(1)
+        for i in range(self.count):
+            self.canv.rect(i * (self.box_size + self.gap), 0, self.box_size, self.box_size, fill=0, stroke=1)
+
+
+class BubbleGrid(Flowable):
+    """
+    גיליון תשובות לשאלות רב ברירה - שורת עיגולים לכל שאלה, מסודרות בעמודות מימין לשמאל
+    מיקום כל עיגול ידוע מראש, כך שהסורק מודד את המילוי בלי לחפש את העיגולים
+    """
+
+    def __init__(self, questions, width, radius=0.22*cm, pitch=0.75*cm, row_height=0.65*cm,
+                 label_width=0.9*cm, column_gap=0.8*cm, header_height=0.5*cm, max_rows=10):
+        """
+        Args:
+            questions: list של (מספר השאלה בגיליון, מספר אפשרויות)
+            width: הרוחב הזמין - כמה עמודות נכנסות
+        """
+        super().__init__()
+        self.questions = questions
+        self.radius = radius
+        self.pitch = pitch
+        self.row_height = row_height
+        self.label_width = label_width
+        self.header_height = header_height
+        self.hAlign = 'RIGHT'
+
+        options = max(count for _, count in questions)
+        self.column_width = label_width + options * pitch
+        self.column_stride = self.column_width + column_gap
+        max_columns = max(1, int((width + column_gap) // self.column_stride))
+        self.rows = max(min(len(questions), max_rows), -(-len(questions) // max_columns))
+        self.columns = -(-len(questions) // self.rows)
+
+        self.width = self.columns * self.column_width + (self.columns - 1) * column_gap
+        self.height = header_height + self.rows * row_height
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def _cell(self, index):
+        """(ימין העמודה, מרכז השורה) של השאלה ה-index בגיליון - העמודה הראשונה מימין"""
+        column, row = divmod(index, self.rows)
+        right = self.width - column * self.column_stride
+        y = self.height - self.header_height - (row + 0.5) * self.row_height
+        return right, y
+
+    def bubble_centers(self, index):
+        """מרכזי העיגולים של שאלה - האפשרות הראשונה מימין, כמו סדר הקריאה"""
+        right, y = self._cell(index)
+        count = self.questions[index][1]
+        return [(right - self.label_width - (j + 0.5) * self.pitch, y) for j in range(count)]
+
+    def layout_info(self, question_numbers):
+        """
+        מיקומי העיגולים למפת האזורים - יחסית לגיליון (0-1, מהפינה השמאלית העליונה)
+
+        Args:
+            question_numbers: מספר השאלה במבחן (question_number) לכל שורה בגיליון
+        """
+        return {
+            'radius': self.radius / self.width,
+            'questions': [{
+                'question_number': number,
+                'bubbles': [[round(x / self.width, 5), round(1 - y / self.height, 5)]
+                            for x, y in self.bubble_centers(index)]
+            } for index, number in enumerate(question_numbers)]
+        }
+
+    def draw(self):
+        canv = self.canv
+        canv.setStrokeColor(colors.black)
+        canv.setFillColor(colors.black)
+        canv.setLineWidth(0.8)
+
+        for column in range(self.columns):
+            right = self.width - column * self.column_stride
+            canv.setFont('Helvetica', 7)
+            options = max(count for _, count in self.questions[column * self.rows:(column + 1) * self.rows])
+            for j in range(options):
+                x = right - self.label_width - (j + 0.5) * self.pitch
+                canv.drawCentredString(x, self.height - self.header_height * 0.7, str(j + 1))
+
+        for index, (label, _) in enumerate(self.questions):
+            right, y = self._cell(index)
+            canv.setFont('Helvetica-Bold', 9)
+            canv.drawRightString(right - 0.1 * cm, y - 3, str(label))
+            for x, y in self.bubble_centers(index):
+                canv.circle(x, y, self.radius, fill=0, stroke=1)
+
 
 class ExamPDFGenerator:
     """מחלקה ליצירת PDFs של מבחנים עם QR codes"""
@@ -26,6 +274,11 @@ class ExamPDFGenerator:
         """אתחול המחלקה"""
         self.page_width, self.page_height = A4
         self.margin = 2 * cm
+        self.qr_size = 4  # cm
+
+        # מטמון תבניות של גוף המבחן - מפתח לפי תוכן המבחן והגרסה
+        self.template_cache_size = 8
+        self._template_cache = OrderedDict()
 
         # טעינת פונט עברי
         self.hebrew_font = None
@@ -72,6 +325,7 @@ class ExamPDFGenerator:
         """
         הכנת טקסט עברי להצגה ב-PDF
         מטפל בטקסט עם נקודתיים (label: value) וגם עם תגיות HTML
+        התוצאות נשמרות במטמון משותף - ראה services.bidi_text
 
         Args:
             text: טקסט לעיבוד
@@ -79,65 +333,12 @@ class ExamPDFGenerator:
         Returns:
             טקסט מעובד
         """
-        if not text:
-            return text
-
-        try:
-            from bidi.algorithm import get_display
-            import re
-
-            # טיפול מיוחד בתבנית: <b>label:</b> value
-            # זה הפורמט הנפוץ שלנו
-            bold_pattern = r'<b>(.*?):</b>\s*(.*?)$'
-            match = re.match(bold_pattern, text)
-
-            if match:
-                # יש תבנית של <b>label:</b> value
-                label = match.group(1).strip()
-                value = match.group(2).strip()
-
-                # הפוך כל חלק בנפרד
-                label_display = get_display(label)
-                value_display = get_display(value) if value else ''
-
-                # החזר בפורמט הנכון עם תגיות במקום הנכון
-                return f"<b>{value_display} :{label_display}</b>"
-
-            # אם זה לא התבנית הזו, טפל בצורה רגילה
-            # קודם הוצא תגיות
-            text_no_tags = re.sub(r'<[^>]+>', '', text)
-
-            # אם יש נקודתיים, טפל בתווית וערך בנפרד
-            if ':' in text_no_tags:
-                parts = text_no_tags.split(':', 1)
-                label = parts[0].strip()
-                value = parts[1].strip() if len(parts) > 1 else ''
-
-                label_display = get_display(label)
-                value_display = get_display(value) if value else ''
-
-                # אם יש תגיות <b> בטקסט המקורי, החזר אותן
-                if '<b>' in text:
-                    return f"<b>{value_display} :{label_display}</b>"
-                else:
-                    return f"{value_display} :{label_display}"
-            else:
-                # טקסט רגיל ללא נקודתיים
-                result = get_display(text_no_tags)
-
-                # אם יש תגיות במקור, החזר אותן
-                if '<b>' in text and '</b>' in text:
-                    return f"<b>{result}</b>"
-                return result
-
-        except ImportError:
-            # אם אין bidi, נחזיר כמו שהוא (לא יהיה נכון)
-            print("Warning: python-bidi not found. Hebrew text may not display correctly.")
-            return text
+        return bidi_text.prepare_hebrew_text(text)
 
     def generate_barcode(self, data, width=3.5, height=3.5):
         """
-        יצירת QR Code - עמיד הרבה יותר לסריקה אחרי הדפסה!
+        יצירת QR Code וקטורי - עמיד הרבה יותר לסריקה אחרי הדפסה!
+        המודולים מצוירים כצורות וקטוריות ישירות ב-PDF - בלי תמונה, חדים בכל רזולוציית סריקה
 
         Args:
             data: המידע לקידוד (dict או string)
@@ -145,11 +346,8 @@ class ExamPDFGenerator:
             height: גובה ב-cm (ברירת מחדל 3.5cm)
 
         Returns:
-            Image object של reportlab
+            VectorQRCode flowable
         """
-        import qrcode
-        import json
-
         # המרה לפורמט JSON עבור QR
         if isinstance(data, dict):
             # קידוד כל הנתונים ל-JSON
@@ -158,32 +356,13 @@ class ExamPDFGenerator:
                 'exam_id': data.get('exam_id', 0),
                 'date': data.get('date', ''),
                 'student_name': data.get('student_name', ''),
-                'exam_title': data.get('exam_title', '')
+                'exam_title': data.get('exam_title', ''),
+                'version': data.get('version', 'A')  # לאיתור מפת האזורים של התבנית בסריקה
             }, ensure_ascii=False)  # תמיכה בעברית
         else:
             qr_data = str(data)
 
-        # יצירת QR Code עם הגדרות מקסימליות לעמידות
-        qr = qrcode.QRCode(
-            version=4,  # גודל 33x33 מודולים - מאזן בין גודל לעמידות
-            error_correction=qrcode.constants.ERROR_CORRECT_H,  # 30% תיקון שגיאות!
-            box_size=12,  # גודל כל ריבוע - גדול יותר = קל יותר לסריקה
-            border=5,  # שוליים רחבים לסריקה קלה
-        )
-
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-
-        # יצירת תמונה בשחור-לבן עם ניגודיות מקסימלית
-        img = qr.make_image(fill_color="black", back_color="white")
-
-        # שמירה ל-BytesIO בפורמט PNG
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-
-        # יצירת Image object של reportlab
-        return Image(img_buffer, width=width*cm, height=height*cm)
+        return VectorQRCode(qr_data, width=width*cm, height=height*cm)
 
     def create_exam_pdf(self, exam_data, questions, student_data, output_path=None):
         """
@@ -205,19 +384,325 @@ class ExamPDFGenerator:
             pdf_buffer = io.BytesIO()
 
         # יצירת המסמך
-        doc = SimpleDocTemplate(
+        doc = self._create_document(pdf_buffer, exam_data, author=student_data.get('name', ''))
+
+        # סגנונות
+        styles = self._create_styles()
+
+        # פרטי התלמיד ו-QR code
+        name_cell, id_cell, qr_cell = self._student_header_flowables(exam_data, student_data, styles)
+
+        # אלמנטים של ה-PDF
+        story = self._build_story(exam_data, questions, styles, name_cell, id_cell, qr_cell)
+
+        # בניית ה-PDF - ה-metadata נכתב כבר בזמן הבנייה, במעבר אחד ישר ליעד
+        doc.build(story, canvasmaker=metadata_canvasmaker(self._build_metadata(exam_data, student_data)))
+
+        if output_path:
+            return None
+        return pdf_buffer.getvalue()
+
+    def get_exam_template(self, exam_data, questions, version='A'):
+        """
+        תבנית של גוף המבחן - נבנית פעם אחת לכל (מבחן, גרסה) ונשמרת במטמון
+        במקום פרטי התלמיד וה-QR יש מקומות שמורים, שהמיקום שלהם נרשם בזמן הבנייה
+
+        Args:
+            exam_data: dict עם פרטי המבחן
+            questions: list של שאלות
+            version: קוד גרסת המבחן
+
+        Returns:
+            dict עם bytes של התבנית ומיקומי המקומות השמורים
+        """
+        key = self._template_key(exam_data, questions, version)
+
+        template = self._template_cache.get(key)
+        if template:
+            self._template_cache.move_to_end(key)
+            return template
+
+        slots = {}
+        pdf_buffer = io.BytesIO()
+        doc = self._create_document(pdf_buffer, exam_data)
+        styles = self._create_styles()
+
+        # מקומות שמורים באותו גודל בדיוק כמו התוכן האמיתי - כדי שהפריסה תהיה זהה
+        name_cell, id_cell, qr_cell = self._student_header_flowables(
+            exam_data, {'name': '', 'id_number': '_______________'}, styles, with_qr=False
+        )
+        story = self._build_story(
+            exam_data, questions, styles,
+            LayoutSlot('student_name', name_cell, slots),
+            LayoutSlot('id_number', id_cell, slots),
+            LayoutSlot('qr', Spacer(self.qr_size * cm, self.qr_size * cm), slots),
+            slots=slots
+        )
+        doc.build(story)
+
+        template = {
+            'key': key,
+            'version': version,
+            'pdf_bytes': pdf_buffer.getvalue(),
+            'slots': slots
+        }
+
+        self._template_cache[key] = template
+        while len(self._template_cache) > self.template_cache_size:
+            self._template_cache.popitem(last=False)
+
+        return template
+
+    def layout_manifest(self, template):
+        """
+        מפת האזורים של התבנית לסורק - איפה ה-QR, שורת הציון וגיליון התשובות
+        הקואורדינטות יחסיות לגודל העמוד (0-1, מהפינה השמאלית העליונה), כך שהן לא תלויות ברזולוציית הסריקה
+
+        Args:
+            template: תבנית מ-get_exam_template
+
+        Returns:
+            dict עם template_key, version, page_size ו-regions
+        """
+        page_width, page_height = A4
+        regions = {}
+        for name in ('qr', 'grade', 'grade_boxes', 'answer_grid'):
+            slot = template['slots'].get(name)
+            if not slot:
+                continue
+            regions[name] = {
+                'page': slot['page'],
+                'x0': slot['x'] / page_width,
+                'y0': 1 - (slot['y'] + slot['height']) / page_height,
+                'x1': (slot['x'] + slot['width']) / page_width,
+                'y1': 1 - slot['y'] / page_height
+            }
+            # פרטים נוספים של האזור (ספרות הציון, מיקומי העיגולים)
+            regions[name].update({k: v for k, v in slot.items() if k not in ('page', 'x', 'y', 'width', 'height')})
+
+        return {
+            'template_key': template['key'],
+            'version': template['version'],
+            'page_size': [page_width, page_height],
+            'regions': regions
+        }
+
+    def stamp_student_pdf(self, template, exam_data, student_data, output_path=None):
+        """
+        יצירת PDF לתלמיד מתוך תבנית - רק שכבה קטנה עם שם, ת.ז. ו-QR מוטבעת על התבנית
+
+        Args:
+            template: תבנית מ-get_exam_template
+            exam_data: dict עם פרטי המבחן
+            student_data: dict עם פרטי התלמיד
+            output_path: נתיב לשמירה (אופציונלי)
+
+        Returns:
+            bytes של ה-PDF או None אם נשמר לקובץ
+        """
+        import fitz  # PyMuPDF
+
+        doc = fitz.open(stream=template['pdf_bytes'], filetype='pdf')
+        try:
+            self._stamp_student_header(doc, 0, template, exam_data, student_data)
+
+            # metadata - אותם שדות כמו ב-create_exam_pdf
+            self._set_fitz_metadata(doc, exam_data, student_data.get('name', ''),
+                                    self._build_metadata(exam_data, student_data))
+
+            if output_path:
+                doc.save(output_path, garbage=1, deflate=True)
+                return None
+            return doc.tobytes(garbage=1, deflate=True)
+        finally:
+            doc.close()
+
+    def create_merged_exam_pdf(self, exam_data, questions, students_list, output_path=None):
+        """
+        PDF אחד לכל הכיתה להדפסה - המבחנים של כל התלמידים ברצף, לפי סדר הרשימה
+        עמודי התבנית זהים בין התלמידים, כך שהפונטים והאובייקטים המשותפים נשמרים פעם אחת בלבד.
+        לכל תלמיד יש סימניה, וב-/YeshivaPages נשמר טווח העמודים שלו לזיהוי בסריקה
+
+        Args:
+            exam_data: פרטי המבחן
+            questions: רשימת שאלות
+            students_list: רשימת תלמידים
+            output_path: נתיב לשמירה (אופציונלי)
+
+        Returns:
+            bytes של ה-PDF או None אם נשמר לקובץ
+        """
+        import fitz  # PyMuPDF
+
+        merged = fitz.open()
+        template_docs = {}
+        toc = []
+        sections = []
+
+        try:
+            for student in students_list:
+                first_page = len(merged)
+                try:
+                    template = self.get_exam_template(exam_data, questions, student.get('version', 'A'))
+                    if template['key'] not in template_docs:
+                        template_docs[template['key']] = fitz.open(stream=template['pdf_bytes'], filetype='pdf')
+
+                    merged.insert_pdf(template_docs[template['key']])
+                    self._stamp_student_header(merged, first_page, template, exam_data, student)
+                except Exception as e:
+                    # עמודים שכבר נוספו בלי כותרת ו-QR לא ניתנים לזיהוי בסריקה - מוסרים
+                    if len(merged) > first_page:
+                        merged.delete_pages(first_page, len(merged) - 1)
+                    # תלמיד שנכשל לא עוצר את שאר הכיתה
+                    print(f"Warning: Could not add exam for student {student.get('id')}: {e}")
+                    continue
+
+                toc.append([1, student.get('name', ''), first_page + 1])
+                sections.append({
+                    'first_page': first_page + 1,
+                    'last_page': len(merged),
+                    'student_id': student['id'],
+                    'student_name': student.get('name', ''),
+                    'exam_id': exam_data['id'],
+                    'version': student.get('version', 'A')
+                })
+
+            if not sections:
+                raise ValueError("לא נוצר אף מבחן")
+
+            merged.set_toc(toc)
+            self._set_fitz_metadata(merged, exam_data, '', {
+                '/Exam_ID': str(exam_data['id']),
+                '/Exam_Title': exam_data['title'],
+                '/YeshivaPages': json.dumps(sections)
+            })
+
+            # garbage=4 מאחד אובייקטים כפולים - כל עותק של התבנית מצביע לאותם פונטים
+            if output_path:
+                merged.save(output_path, garbage=4, deflate=True)
+                return None
+            return merged.tobytes(garbage=4, deflate=True)
+        finally:
+            for template_doc in template_docs.values():
+                template_doc.close()
+            merged.close()
+
+    def _stamp_student_header(self, doc, first_page, template, exam_data, student_data):
+        """
+        הטבעת שם, ת.ז. ו-QR של התלמיד על עותק של התבנית בתוך מסמך fitz פתוח
+
+        Args:
+            doc: מסמך fitz
+            first_page: אינדקס העמוד הראשון של עותק התבנית במסמך
+            template: תבנית מ-get_exam_template
+            exam_data: dict עם פרטי המבחן
+            student_data: dict עם פרטי התלמיד
+        """
+        import fitz  # PyMuPDF
+
+        styles = self._create_styles()
+        name_cell, id_cell, qr_cell = self._student_header_flowables(exam_data, student_data, styles)
+
+        # שכבת העל - עמוד אחד שמכיל רק את החלקים המשתנים, במיקומים שנרשמו בתבנית
+        overlay_buffer = io.BytesIO()
+        overlay_canvas = Canvas(overlay_buffer, pagesize=A4)
+        for slot_name, flowable in (('student_name', name_cell), ('id_number', id_cell), ('qr', qr_cell)):
+            slot = template['slots'][slot_name]
+            flowable.wrap(slot['width'], slot['height'])
+            flowable.drawOn(overlay_canvas, slot['x'], slot['y'])
+        overlay_canvas.showPage()
+        overlay_canvas.save()
+
+        overlay = fitz.open(stream=overlay_buffer.getvalue(), filetype='pdf')
+        try:
+            page = doc[first_page + template['slots']['qr']['page']]
+            page.show_pdf_page(page.rect, overlay, 0)
+        finally:
+            overlay.close()
+
+    def _set_fitz_metadata(self, doc, exam_data, author, custom_fields):
+        """כתיבת /Info למסמך fitz - השדות הרגילים והשדות המותאמים שלנו"""
+        import fitz  # PyMuPDF
+
+        doc.set_metadata({
+            'title': exam_data.get('title', ''),
+            'author': author,
+            'subject': exam_data.get('subject', '')
+        })
+        info_xref = int(doc.xref_get_key(-1, 'Info')[1].split()[0])
+        for field, value in custom_fields.items():
+            doc.xref_set_key(info_xref, field.lstrip('/'), fitz.get_pdf_str(str(value)))
+
+    def _template_key(self, exam_data, questions, version):
+        """מפתח מטמון לתבנית - משתנה כשתוכן המבחן או השאלות משתנים"""
+        content = json.dumps({
+            'exam': {k: exam_data.get(k) for k in ('id', 'title', 'subject', 'grade', 'scheduled_date', 'description')},
+            'questions': questions,
+            'version': version
+        }, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _create_document(self, pdf_buffer, exam_data, author=''):
+        """יצירת מסמך ReportLab בהגדרות הקבועות של המבחן"""
+        return SimpleDocTemplate(
             pdf_buffer,
             pagesize=A4,
             rightMargin=self.margin,
             leftMargin=self.margin,
             topMargin=self.margin,
-            bottomMargin=self.margin
+            bottomMargin=self.margin,
+            title=exam_data.get('title', ''),
+            author=author,
+            subject=exam_data.get('subject', '')
         )
 
-        # סגנונות
-        styles = self._create_styles()
+    def _student_header_flowables(self, exam_data, student_data, styles, with_qr=True):
+        """
+        החלקים האישיים בראש המבחן: שם התלמיד, ת.ז. ו-QR
 
-        # אלמנטים של ה-PDF
+        Returns:
+            tuple של (שם, ת.ז., QR)
+        """
+        student_name = student_data.get('name', '')
+        id_number = student_data.get('id_number', '_______________')
+
+        name_cell = Paragraph(self.prepare_hebrew_text(f"<b>שם התלמיד:</b> {student_name}"), styles['RightAligned'])
+        id_cell = Paragraph(self.prepare_hebrew_text(f"<b>תעודת זהות:</b> {id_number}"), styles['RightAligned'])
+
+        qr_cell = None
+        if with_qr and student_data.get('student_exam_id'):
+            # טוקן מספרי קצר - QR בגרסה נמוכה עם מודולים גדולים; השאר נשלף מבסיס הנתונים בסריקה
+            qr_cell = self.generate_barcode(encode_token(student_data['student_exam_id']),
+                                            width=self.qr_size, height=self.qr_size)
+        elif with_qr:
+            # מבחן שלא הוקצה (אין student_exam) - כל הפרטים בתוך ה-QR
+            student_qr_data = {
+                'student_id': student_data.get('id'),
+                'exam_id': exam_data.get('id'),
+                'student_name': student_data.get('name'),
+                'date': datetime.now().strftime('%Y-%m-%d'),
+                'version': student_data.get('version', 'A')
+            }
+
+            # QR Code - גדול יותר לסריקה קלה יותר!
+            qr_cell = self.generate_barcode(student_qr_data, width=self.qr_size, height=self.qr_size)
+
+        return name_cell, id_cell, qr_cell
+
+    def _build_story(self, exam_data, questions, styles, name_cell, id_cell, qr_cell, slots=None):
+        """
+        בניית רשימת האלמנטים של המבחן
+
+        Args:
+            exam_data: dict עם פרטי המבחן
+            questions: list של שאלות
+            styles: סגנונות מ-_create_styles
+            name_cell, id_cell, qr_cell: החלקים האישיים (או מקומות שמורים בתבנית)
+            slots: רישום מיקומים של התבנית - אם ניתן, נרשם גם מיקום שורת הציון
+
+        Returns:
+            list של flowables
+        """
         story = []
 
         # כותרת ראשית
@@ -239,31 +724,10 @@ class ExamPDFGenerator:
 
         story.append(Spacer(1, 0.5*cm))
 
-        # פרטי התלמיד ו-QR code
-        student_qr_data = {
-            'student_id': student_data.get('id'),
-            'exam_id': exam_data.get('id'),
-            'student_name': student_data.get('name'),
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'version': student_data.get('version', 'A')
-        }
-
-        # QR Code - גדול יותר לסריקה קלה יותר!
-        barcode_image = self.generate_barcode(student_qr_data, width=4, height=4)
-
         # טבלה עם פרטי תלמיד ו-QR
-        student_name = student_data.get('name', '')
-        id_number = student_data.get('id_number', '_______________')
-
         student_table_data = [
-            [
-                Paragraph(self.prepare_hebrew_text(f"<b>שם התלמיד:</b> {student_name}"), styles['RightAligned']),
-                barcode_image
-            ],
-            [
-                Paragraph(self.prepare_hebrew_text(f"<b>תעודת זהות:</b> {id_number}"), styles['RightAligned']),
-                ''
-            ]
+            [name_cell, qr_cell],
+            [id_cell, '']
         ]
 
         student_table = Table(student_table_data, colWidths=[9*cm, 8*cm])
@@ -279,6 +743,22 @@ class ExamPDFGenerator:
         story.append(student_table)
         story.append(Spacer(1, 0.7*cm))
 
+        # גיליון תשובות לשאלות רב הברירה - בעמוד הראשון, ליד ה-QR שהסורק מיישר לפיו
+        choice_questions = [(i, question) for i, question in enumerate(questions, 1)
+                            if question.get('question_type') == 'multiple_choice']
+        if choice_questions:
+            grid = BubbleGrid([(i, len(self._question_options(question)) or 4) for i, question in choice_questions],
+                              self.page_width - 2 * self.margin)
+            if slots is not None:
+                grid = LayoutSlot('answer_grid', grid, slots, draw_content=True,
+                                  info=grid.layout_info([question.get('question_number', i)
+                                                         for i, question in choice_questions]))
+            story.append(Paragraph(self.prepare_hebrew_text("<b>גיליון תשובות</b> - מלאו עיגול אחד בכל שאלה"),
+                                   styles['RightAligned']))
+            story.append(Spacer(1, 0.2*cm))
+            story.append(grid)
+            story.append(Spacer(1, 0.7*cm))
+
         # הוראות
         if exam_data.get('description'):
             description = exam_data.get('description', '')
@@ -307,18 +787,15 @@ class ExamPDFGenerator:
             story.append(Spacer(1, 0.3*cm))
 
             # אם זו שאלת רב ברירה
-            if question.get('question_type') == 'multiple_choice' and question.get('options'):
-                try:
-                    options = json.loads(question.get('options', '[]')) if isinstance(question.get('options'), str) else question.get('options', [])
-                    for j, option in enumerate(options, 1):
-                        if option:  # רק אם האופציה לא ריקה
-                            option_line = f"    {j}. {option}"
-                            story.append(Paragraph(self.prepare_hebrew_text(option_line), styles['RightAligned']))
-                except:
-                    pass
+            if question.get('question_type') == 'multiple_choice':
+                for j, option in enumerate(self._question_options(question), 1):
+                    if option:  # רק אם האופציה לא ריקה
+                        option_line = f"    {j}. {option}"
+                        story.append(Paragraph(self.prepare_hebrew_text(option_line), styles['RightAligned']))
 
                 story.append(Spacer(1, 0.2*cm))
-                story.append(Paragraph(self.prepare_hebrew_text("תשובה: _______"), styles['RightAligned']))
+                story.append(Paragraph(self.prepare_hebrew_text("סמנו את התשובה בגיליון התשובות"),
+                                       styles['RightAligned']))
             else:
                 # שאלה פתוחה - מקום לתשובה
                 answer_lines = max(3, int(points / 5))  # מספר שורות לפי נקודות
@@ -338,72 +815,77 @@ class ExamPDFGenerator:
         story.append(Paragraph("_" * 100, styles['Centered']))
         story.append(Spacer(1, 0.3*cm))
         story.append(Paragraph(self.prepare_hebrew_text(f"<b>סה\"כ נקודות במבחן: {total_points}</b>"), styles['Centered']))
-        story.append(Paragraph(self.prepare_hebrew_text(f"<b>ציון שהתקבל: ______ / {total_points}</b>"), styles['Centered']))
 
-        # בניית ה-PDF
-        doc.build(story)
-
-        # הוספת metadata ל-PDF עם פרטי התלמיד והמבחן
-        # זה יישמר בתוך ה-PDF ונוכל לקרוא אותו בקלות בלי צורך בברקוד!
-        try:
-            from PyPDF2 import PdfReader, PdfWriter
-            import json
-
-            pdf_buffer.seek(0)
-            reader = PdfReader(pdf_buffer)
-            writer = PdfWriter()
-
-            # העתק את כל העמודים
-            for page in reader.pages:
-                writer.add_page(page)
-
-            # הוסף metadata מותאם אישית
-            metadata = {
-                '/Student_ID': str(student_data['id']),
-                '/Student_Name': student_data['name'],
-                '/Exam_ID': str(exam_data['id']),
-                '/Exam_Title': exam_data['title'],
-                '/YeshivaData': json.dumps({  # כל המידע בJSON
-                    'student_id': student_data['id'],
-                    'student_name': student_data['name'],
-                    'exam_id': exam_data['id'],
-                    'exam_title': exam_data['title'],
-                    'date': datetime.now().strftime('%Y-%m-%d'),
-                    'version': student_data.get('version', 'A')
-                })
-            }
-            writer.add_metadata(metadata)
-
-            # כתוב ל-buffer חדש
-            final_buffer = io.BytesIO()
-            writer.write(final_buffer)
-            final_buffer.seek(0)
+        # ריבוע לכל ספרה של הציון המקסימלי - מיקום הריבועים נרשם בתבנית כדי שהסורק יקרא כל ספרה לבד
+        digit_boxes = DigitBoxes(max(2, len(str(total_points))))
+        boxes = digit_boxes
+        if slots is not None:
+            boxes = LayoutSlot('grade_boxes', digit_boxes, slots, draw_content=True,
+                               info={'digits': digit_boxes.count, 'max_score': total_points})
+        grade_line = Table([[
+            Paragraph(self.prepare_hebrew_text(f"<b>/ {total_points}</b>"), styles['Centered']),
+            boxes,
+            Paragraph(self.prepare_hebrew_text("<b>ציון שהתקבל:</b>"), styles['Centered'])
+        ]], colWidths=[1.6*cm, digit_boxes.width + 0.4*cm, 3.2*cm])
+        grade_line.setStyle(TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('ALIGN', (1, 0), (1, 0), 'CENTER'),
+        ]))
+        if slots is not None:
+            grade_line = LayoutSlot('grade', grade_line, slots, draw_content=True)
+        story.append(grade_line)
+
+        return story
+
+    @staticmethod
+    def _question_options(question):
+        """האפשרויות של שאלת רב ברירה - list, גם כשנשמרו כ-JSON"""
+        options = question.get('options')
+        if isinstance(options, str):
+            try:
+                options = json.loads(options)
+            except ValueError:
+                return []
+        return options if isinstance(options, list) else []
+
+    def _build_metadata(self, exam_data, student_data):
+        """
+        שדות ה-metadata המותאמים של המבחן
+        זה יישמר בתוך ה-PDF ונוכל לקרוא אותו בקלות בלי צורך בברקוד!
 
-            if output_path:
-                with open(output_path, 'wb') as f:
-                    f.write(final_buffer.getvalue())
-                return None
-            else:
-                return final_buffer.getvalue()
+        Args:
+            exam_data: dict עם פרטי המבחן
+            student_data: dict עם פרטי התלמיד
 
-        except Exception as e:
-            print(f"Warning: Could not add metadata to PDF: {e}")
-            # אם נכשל, החזר את ה-PDF המקורי
-            if output_path:
-                return None
-            else:
-                pdf_buffer.seek(0)
-                return pdf_buffer.getvalue()
+        Returns:
+            dict של שדות /Info
+        """
+        return {
+            '/Student_ID': str(student_data['id']),
+            '/Student_Name': student_data['name'],
+            '/Exam_ID': str(exam_data['id']),
+            '/Exam_Title': exam_data['title'],
+            '/YeshivaData': json.dumps({  # כל המידע בJSON
+                'student_id': student_data['id'],
+                'student_name': student_data['name'],
+                'exam_id': exam_data['id'],
+                'exam_title': exam_data['title'],
+                'date': datetime.now().strftime('%Y-%m-%d'),
+                'version': student_data.get('version', 'A')
+            })
+        }
 
-    def create_batch_exams(self, exam_data, questions, students_list, output_dir):
+    def create_batch_exams(self, exam_data, questions, students_list, output_dir, workers=None):
         """
         יצירת PDFs לכל התלמידים
+        גוף המבחן נפרס פעם אחת לכל גרסה, ולכל תלמיד מוטבעת רק שכבת הכותרת האישית
 
         Args:
             exam_data: פרטי המבחן
             questions: רשימת שאלות
             students_list: רשימת תלמידים
             output_dir: תיקייה לשמירת הקבצים
+            workers: מספר תהליכים (ברירת מחדל לפי PDF_WORKERS)
 
         Returns:
             list של נתיבי הקבצים שנוצרו
@@ -413,18 +895,81 @@ class ExamPDFGenerator:
 
         created_files = []
 
-        for student in students_list:
-            # יצירת שם קובץ
-            safe_name = student.get('name', 'student').replace(' ', '_')
-            filename = f"exam_{exam_data.get('id')}_{student.get('id')}_{safe_name}.pdf"
-            filepath = os.path.join(output_dir, filename)
+        for student, pdf_bytes, error in self.iter_batch_exams(exam_data, questions, students_list, workers):
+            if error:
+                # תלמיד שנכשל לא עוצר את שאר הכיתה
+                print(f"Warning: Could not create exam PDF for student {student.get('id')}: {error}")
+                continue
 
-            # יצירת ה-PDF
-            self.create_exam_pdf(exam_data, questions, student, filepath)
+            filepath = os.path.join(output_dir, batch_pdf_filename(exam_data, student))
+            with open(filepath, 'wb') as f:
+                f.write(pdf_bytes)
             created_files.append(filepath)
 
         return created_files
 
+    def iter_batch_exams(self, exam_data, questions, students_list, workers=None):
+        """
+        יצירת PDFs לכל התלמידים במקביל על פני מספר תהליכים
+        התוצאות חוזרות לפי סדר הרשימה, וכשלון של תלמיד אחד לא מפיל את השאר
+
+        Args:
+            exam_data: פרטי המבחן
+            questions: רשימת שאלות
+            students_list: רשימת תלמידים
+            workers: מספר תהליכים (ברירת מחדל לפי PDF_WORKERS)
+
+        Yields:
+            tuple של (תלמיד, bytes של ה-PDF או None, הודעת שגיאה או None)
+        """
+        if workers is None:
+            workers = get_pdf_workers()
+
+        # תהליך יחיד או תלמיד יחיד - אין טעם להעביר לתהליכים אחרים
+        if workers <= 1 or len(students_list) <= 1:
+            for student in students_list:
+                try:
+                    template = self.get_exam_template(exam_data, questions, student.get('version', 'A'))
+                    yield student, self.stamp_student_pdf(template, exam_data, student), None
+                except Exception as e:
+                    yield student, None, str(e)
+            return
+
+        pool = _get_pdf_pool(workers)
+
+        def submit(student):
+            nonlocal pool
+            try:
+                return pool, pool.submit(_render_student_pdf, exam_data, questions, student)
+            except BrokenProcessPool:
+                # המאגר נשבר בזמן האצווה - שאר התלמידים עוברים למאגר חדש
+                _discard_pdf_pool(pool)
+                pool = _get_pdf_pool(workers)
+                return pool, pool.submit(_render_student_pdf, exam_data, questions, student)
+
+        # חלון מוגבל של משימות פתוחות - כדי שהזיכרון לא יגדל עם גודל הכיתה
+        pending = deque()
+        students = iter(students_list)
+        for student in students:
+            pending.append((student, *submit(student)))
+            if len(pending) >= workers * 2:
+                break
+
+        while pending:
+            student, student_pool, future = pending.popleft()
+            try:
+                yield student, future.result(), None
+            except BrokenProcessPool as e:
+                # תהליך worker קרס - המאגר הזה לא ישמש יותר אצוות חדשות
+                _discard_pdf_pool(student_pool)
+                yield student, None, str(e) or 'PDF worker crashed'
+            except Exception as e:
+                yield student, None, str(e)
+
+            next_student = next(students, None)
+            if next_student is not None:
+                pending.append((next_student, *submit(next_student)))
+
     def _create_styles(self):
         """יצירת סגנונות לטקסט"""
         styles = getSampleStyleSheet()
@@ -489,9 +1034,95 @@ class ExamPDFGenerator:
         return styles
 
 
+def batch_pdf_filename(exam_data, student):
+    """שם הקובץ של מבחן תלמיד בתוך אצווה"""
+    safe_name = student.get('name', 'student').replace(' ', '_')
+    return f"exam_{exam_data.get('id')}_{student.get('id')}_{safe_name}.pdf"
+
+
+# ===== יצירה מקבילית בתהליכים =====
+
+# מאגר לכל מספר תהליכים - מאגר לא נסגר כל עוד אצווה אחרת עשויה להשתמש בו
+_pdf_pools = {}
+_pdf_pool_lock = threading.Lock()
+
+# המחולל של תהליך ה-worker - נוצר פעם אחת לכל תהליך (כולל רישום הפונטים)
+_worker_generator = None
+
+
+def get_pdf_workers():
+    """
+    מספר התהליכים ליצירת PDFs
+    נקבע ב-PDF_WORKERS; ברירת המחדל שמרנית כדי להתאים לשרת קטן ב-Render
+    """
+    try:
+        return max(1, int(os.environ.get('PDF_WORKERS', '')))
+    except ValueError:
+        return max(1, min(2, os.cpu_count() or 1))
+
+
+def _init_pdf_worker():
+    """אתחול תהליך worker - יצירת מחולל אחד שנשאר חי בין המשימות"""
+    global _worker_generator
+    _worker_generator = ExamPDFGenerator()
+
+
+def _render_student_pdf(exam_data, questions, student):
+    """יצירת PDF לתלמיד אחד בתוך תהליך worker (התבנית נשמרת במטמון של התהליך)"""
+    template = _worker_generator.get_exam_template(exam_data, questions, student.get('version', 'A'))
+    return _worker_generator.stamp_student_pdf(template, exam_data, student)
+
+
+def _get_pdf_pool(workers):
+    """מאגר התהליכים המשותף - נוצר בפעם הראשונה ונשמר לאצוות הבאות"""
+    with _pdf_pool_lock:
+        pool = _pdf_pools.get(workers)
+        if pool is None:
+            # spawn ולא fork - בתהליך הראשי רצים threads (gunicorn, תור המשימות) ו-fork איתם לא בטוח
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=get_context('spawn'),
+                initializer=_init_pdf_worker
+            )
+            _pdf_pools[workers] = pool
+        return pool
+
+
+def _discard_pdf_pool(pool):
+    """
+    הוצאת מאגר שנשבר מהשימוש - האצווה הבאה תקבל מאגר חדש
+    המשימות שכבר נשלחו אליו נכשלו ממילא, לכן אין מה לבטל
+    """
+    with _pdf_pool_lock:
+        for workers, current in list(_pdf_pools.items()):
+            if current is pool:
+                del _pdf_pools[workers]
+    pool.shutdown(wait=False)
+
+
+def publish_exam_layouts(exam_data, questions, students_list, db, generator):
+    """
+    שמירת מפת האזורים של כל גרסה שבשימוש - כדי שהסורק יחתוך את אזור הציון ישירות
+
+    Args:
+        exam_data: פרטי המבחן
+        questions: רשימת שאלות
+        students_list: רשימת תלמידים (לפי הגרסאות שלהם)
+        db: אובייקט ExamDatabase
+        generator: ExamPDFGenerator (התבנית נשמרת במטמון שלו ומשמשת גם ליצירה עצמה)
+    """
+    for version in sorted({student.get('version', 'A') for student in students_list}):
+        try:
+            template = generator.get_exam_template(exam_data, questions, version)
+            db.save_exam_layout(exam_data['id'], version, template['key'], generator.layout_manifest(template))
+        except Exception as e:
+            print(f"Warning: Could not publish layout for exam {exam_data.get('id')} version {version}: {e}")
+
+
 def generate_exam_pdf_for_student(exam_id, student_id, db):
     """
-    פונקציית עזר ליצירת PDF למבחן ותלמיד ספציפיים
+    פונקציית עזר ל-PDF של מבחן לתלמיד ספציפי
+    הקובץ מגיע ממאגר ה-PDFs (pdf_store) - אותו קובץ מוטבע שמסלול ההורדה מגיש
 
     Args:
         exam_id: מזהה המבחן
@@ -501,66 +1132,24 @@ def generate_exam_pdf_for_student(exam_id, student_id, db):
     Returns:
         bytes של ה-PDF
     """
-    # קבלת נתוני המבחן
-    exam = db.get_exam(exam_id)
-    if not exam:
-        raise ValueError(f"מבחן {exam_id} לא נמצא")
+    # pdf_store מייבא את המודול הזה - ייבוא בתוך הפונקציה
+    from services.pdf_store import get_student_pdf_path
 
-    # exam הוא dictionary עכשיו, לא tuple
-    exam_data = {
-        'id': exam['id'],
-        'subject': exam['subject'],
-        'title': exam['title'],
-        'description': exam.get('description', ''),
-        'syllabus_text': exam.get('syllabus_text', ''),
-        'grade': exam.get('grade', ''),
-        'total_points': exam.get('total_points', 0)
-    }
+    with open(get_student_pdf_path(exam_id, student_id, db), 'rb') as f:
+        return f.read()
 
-    # קבלת שאלות
-    questions_raw = db.get_exam_questions(exam_id)
-    questions = [{
-        'question_number': q[2],
-        'question_text': q[3],
-        'points': q[4],
-        'question_type': q[5],
-        'options': q[6] if len(q) > 6 else None,
-        'correct_answer': q[6] if q[5] == 'multiple_choice' and len(q) > 6 else None
-    } for q in questions_raw]
 
-    # קבלת נתוני התלמיד
-    from services.database import YeshivaDatabase
-    yeshiva_db = YeshivaDatabase()
-    student = yeshiva_db.get_student(student_id)
-
-    if not student:
-        raise ValueError(f"תלמיד {student_id} לא נמצא")
-
-    # student הוא dictionary עכשיו, לא tuple
-    student_data = {
-        'id': student['id'],
-        'name': f"{student['last_name']} {student['first_name']}",  # שם משפחה + שם פרטי
-        'id_number': student.get('id_number', ''),
-        'version': 'A'
-    }
-
-    # יצירת ה-PDF
-    generator = ExamPDFGenerator()
-    return generator.create_exam_pdf(exam_data, questions, student_data)
-
-
-def generate_batch_pdfs(exam_id, student_ids, output_dir, db):
+def load_batch_data(exam_id, student_ids, db):
     """
-    יצירת PDFs לרשימת תלמידים
+    טעינת נתוני המבחן, השאלות והתלמידים לאצווה
 
     Args:
         exam_id: מזהה המבחן
         student_ids: רשימת מזהי תלמידים
-        output_dir: תיקייה לשמירה
         db: אובייקט ExamDatabase
 
     Returns:
-        list של נתיבי קבצים שנוצרו
+        tuple של (exam_data, questions, students_list)
     """
     # קבלת נתונים
     exam = db.get_exam(exam_id)
@@ -584,13 +1173,18 @@ def generate_batch_pdfs(exam_id, student_ids, output_dir, db):
         'question_text': q[3],
         'points': q[4],
         'question_type': q[5],
-        'options': q[6] if len(q) > 6 else None
+        'options': q[8],
+        'correct_answer': q[6]
     } for q in questions_raw]
 
     # קבלת נתוני תלמידים
     from services.database import YeshivaDatabase
     yeshiva_db = YeshivaDatabase()
 
+    # מזהי ההקצאה - נכנסים ל-QR של כל תלמיד; הגרסה שהוקצתה - קובעת את התבנית שלו
+    student_exam_ids = db.get_student_exam_ids(exam_id, student_ids)
+    versions = db.get_student_exam_versions(exam_id, student_ids)
+
     students_list = []
     for student_id in student_ids:
         student = yeshiva_db.get_student(student_id)
@@ -600,9 +1194,77 @@ def generate_batch_pdfs(exam_id, student_ids, output_dir, db):
                 'id': student['id'],
                 'name': f"{student['last_name']} {student['first_name']}",  # שם משפחה + שם פרטי
                 'id_number': student.get('id_number', ''),
-                'version': 'A'
+                'version': versions.get(student['id'], 'A'),
+                'student_exam_id': student_exam_ids.get(student['id'])
             })
 
+    return exam_data, questions, students_list
+
+
+def generate_batch_pdfs(exam_id, student_ids, output_dir, db):
+    """
+    יצירת PDFs לרשימת תלמידים
+
+    Args:
+        exam_id: מזהה המבחן
+        student_ids: רשימת מזהי תלמידים
+        output_dir: תיקייה לשמירה
+        db: אובייקט ExamDatabase
+
+    Returns:
+        list של נתיבי קבצים שנוצרו
+    """
+    exam_data, questions, students_list = load_batch_data(exam_id, student_ids, db)
+
     # יצירת PDFs
     generator = ExamPDFGenerator()
+    publish_exam_layouts(exam_data, questions, students_list, db, generator)
     return generator.create_batch_exams(exam_data, questions, students_list, output_dir)
+
+
+def iter_batch_pdfs(exam_id, student_ids, db):
+    """
+    יצירת PDFs לרשימת תלמידים - כל קובץ חוזר ברגע שהוא מוכן, בלי תיקייה זמנית
+
+    Args:
+        exam_id: מזהה המבחן
+        student_ids: רשימת מזהי תלמידים
+        db: אובייקט ExamDatabase
+
+    Returns:
+        generator של (שם קובץ, bytes של ה-PDF או None, הודעת שגיאה או None)
+    """
+    # הטעינה נעשית מיד - כדי ששגיאות (מבחן לא קיים) יעלו לפני שהתחלנו להזרים
+    exam_data, questions, students_list = load_batch_data(exam_id, student_ids, db)
+    generator = ExamPDFGenerator()
+    publish_exam_layouts(exam_data, questions, students_list, db, generator)
+
+    def entries():
+        for student, pdf_bytes, error in generator.iter_batch_exams(exam_data, questions, students_list):
+            yield batch_pdf_filename(exam_data, student), pdf_bytes, error
+
+    return entries()
+
+
+def generate_merged_pdf(exam_id, db, student_ids=None):
+    """
+    PDF אחד עם המבחנים של כל התלמידים שהוקצו למבחן, לפי סדר הרשימה
+
+    Args:
+        exam_id: מזהה המבחן
+        db: אובייקט ExamDatabase
+        student_ids: רשימת מזהי תלמידים (ברירת מחדל - כל מי שהוקצה למבחן)
+
+    Returns:
+        bytes של ה-PDF
+    """
+    if student_ids is None:
+        student_ids = db.get_exam_roster(exam_id)
+    if not student_ids:
+        raise ValueError(f"אין תלמידים שהוקצו למבחן {exam_id}")
+
+    exam_data, questions, students_list = load_batch_data(exam_id, student_ids, db)
+
+    generator = ExamPDFGenerator()
+    publish_exam_layouts(exam_data, questions, students_list, db, generator)
+    return generator.create_merged_exam_pdf(exam_data, questions, students_list)
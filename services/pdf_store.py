@@ -0,0 +1,163 @@
+"""
+Pre-generated Exam PDF Store
+Content-addressed storage for student exam PDFs, filled by a background job when an exam is assigned
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+from services.database import get_data_path
+from services.pdf_generator import ExamPDFGenerator, load_batch_data, publish_exam_layouts
+
+# מעלים את המספר כשמשנים את עיצוב ה-PDF - כל הקבצים הישנים יוצאים מהמטמון
+RENDER_VERSION = 5
+
+STORE_DIR = get_data_path('generated_pdfs')
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def pdf_key(exam_data, questions, student_data):
+    """
+    מפתח תוכן ל-PDF של תלמיד - משתנה רק כשהמבחן, השאלות או פרטי התלמיד משתנים
+
+    Args:
+        exam_data: פרטי המבחן
+        questions: רשימת שאלות
+        student_data: פרטי התלמיד
+
+    Returns:
+        SHA-256 hex
+    """
+    content = json.dumps({
+        'render_version': RENDER_VERSION,
+        'exam': exam_data,
+        'questions': questions,
+        'student': {k: student_data.get(k) for k in ('id', 'name', 'id_number', 'version', 'student_exam_id')}
+    }, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def path_for_key(key):
+    """נתיב הקובץ במאגר - תת-תיקייה לפי שני התווים הראשונים כדי שתיקייה אחת לא תתפוצץ"""
+    return os.path.join(STORE_DIR, key[:2], f"{key}.pdf")
+
+
+def store_pdf(key, pdf_bytes):
+    """
+    שמירת PDF במאגר - כתיבה לקובץ זמני והחלפה, כך שקורא אף פעם לא רואה קובץ חלקי
+
+    Returns:
+        נתיב הקובץ
+    """
+    path = path_for_key(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _get_generator():
+    """מחולל אחד להורדות בתהליך - כדי שמטמון התבניות ישמש את כל הבקשות"""
+    global _generator
+    if _generator is None:
+        _generator = ExamPDFGenerator()
+    return _generator
+
+
+def _record_path(db, exam_id, student_id, path):
+    """עדכון pdf_generated_path ומחיקת הקובץ הקודם אם התוכן השתנה"""
+    old_path = db.set_student_exam_pdf_path(exam_id, student_id, path)
+    if old_path and old_path != path and os.path.exists(old_path):
+        try:
+            os.remove(old_path)
+        except OSError as e:
+            print(f"אזהרה: לא ניתן למחוק PDF ישן {old_path}: {e}")
+
+
+def get_student_pdf_path(exam_id, student_id, db):
+    """
+    נתיב ל-PDF של תלמיד - מהמאגר אם הוא עדכני, אחרת נוצר ונשמר עכשיו
+
+    Args:
+        exam_id: מזהה המבחן
+        student_id: מזהה התלמיד
+        db: אובייקט ExamDatabase
+
+    Returns:
+        נתיב הקובץ בדיסק
+    """
+    exam_data, questions, students_list = load_batch_data(exam_id, [student_id], db)
+    if not students_list:
+        raise ValueError(f"תלמיד {student_id} לא נמצא")
+    student = students_list[0]
+
+    key = pdf_key(exam_data, questions, student)
+    path = path_for_key(key)
+
+    if not os.path.exists(path):
+        with _generator_lock:
+            generator = _get_generator()
+            publish_exam_layouts(exam_data, questions, students_list, db, generator)
+            template = generator.get_exam_template(exam_data, questions, student.get('version', 'A'))
+            pdf_bytes = generator.stamp_student_pdf(template, exam_data, student)
+        store_pdf(key, pdf_bytes)
+
+    _record_path(db, exam_id, student_id, path)
+    return path
+
+
+def pregenerate_exam_pdfs(exam_id, student_ids, db, generator=None, progress=None):
+    """
+    יצירת PDFs לכל התלמידים שעדיין אין להם קובץ עדכני במאגר
+    רץ כמשימת רקע (exam_pdf_pregenerate) אחרי הקצאת מבחן
+
+    Args:
+        exam_id: מזהה המבחן
+        student_ids: רשימת מזהי תלמידים
+        db: אובייקט ExamDatabase
+        generator: מחולל PDF (ברירת מחדל - חדש, כדי לא לחסום הורדות בזמן האצווה)
+        progress: פונקציה (done, total, message) לדיווח התקדמות (אופציונלי)
+
+    Returns:
+        מספר הקבצים שנוצרו
+    """
+    exam_data, questions, students_list = load_batch_data(exam_id, student_ids, db)
+
+    missing = []
+    for student in students_list:
+        key = pdf_key(exam_data, questions, student)
+        path = path_for_key(key)
+        if os.path.exists(path):
+            _record_path(db, exam_id, student['id'], path)
+        else:
+            missing.append((student, key))
+
+    if not missing:
+        return 0
+
+    if generator is None:
+        generator = ExamPDFGenerator()
+    publish_exam_layouts(exam_data, questions, students_list, db, generator)
+
+    created = 0
+    students = [student for student, _ in missing]
+    keys = {student['id']: key for student, key in missing}
+    for done, (student, pdf_bytes, error) in enumerate(
+            generator.iter_batch_exams(exam_data, questions, students), start=1):
+        if progress:
+            progress(done, len(students), student.get('name', ''))
+        if error:
+            print(f"אזהרה: שגיאה ביצירת PDF מראש לתלמיד {student.get('name', '')}: {error}")
+            continue
+        path = store_pdf(keys[student['id']], pdf_bytes)
+        _record_path(db, exam_id, student['id'], path)
+        created += 1
+
+    return created
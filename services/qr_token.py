@@ -0,0 +1,44 @@
+"""
+Compact QR Token
+Numeric student-exam token with check digits - fits a low-version QR that decodes at low scan DPI
+"""
+
+# ספרה ראשונה של הטוקן - מעלים אותה אם המבנה משתנה, כך שטוקנים ישנים עדיין מזוהים
+TOKEN_FORMAT = 1
+
+# ISO 7064 MOD 97-10 (כמו ב-IBAN) - מזהה כל טעות בספרה אחת וכל החלפה של שתי ספרות סמוכות
+CHECK_MODULUS = 97
+
+
+def encode_token(student_exam_id):
+    """
+    טוקן מספרי להקצאת מבחן: ספרת פורמט, מזהה ה-student_exam ושתי ספרות ביקורת
+    QR במצב מספרי - 10 סיביות לכל 3 ספרות, כך שגם מזהה של מיליונים נכנס ב-QR גרסה 1
+
+    Args:
+        student_exam_id: מזהה שורת ההקצאה ב-student_exams
+
+    Returns:
+        מחרוזת ספרות
+    """
+    body = f"{TOKEN_FORMAT}{int(student_exam_id)}"
+    check = 98 - (int(body) * 100) % CHECK_MODULUS
+    return f"{body}{check:02d}"
+
+
+def decode_token(text):
+    """
+    פענוח טוקן מ-encode_token
+
+    Args:
+        text: תוכן הקוד שנקרא
+
+    Returns:
+        מזהה ה-student_exam, או None אם זה לא טוקן תקין (פורמט אחר או ספרות ביקורת שגויות)
+    """
+    text = text.strip()
+    if len(text) < 4 or not text.isdigit() or text[0] != str(TOKEN_FORMAT):
+        return None
+    if int(text) % CHECK_MODULUS != 1:
+        return None
+    return int(text[1:-2])
@@ -0,0 +1,150 @@
+"""
+Scan Diagnostics
+Leveled logging for the scan pipeline, and opt-in capture of failed or sampled pages -
+downscaled and bounded by a disk quota, so by default the hot path does no debug I/O
+"""
+
+import os
+import sys
+import json
+import random
+import logging
+import threading
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from services.database import get_data_path
+
+# רמת הלוג של צינור הסריקה: DEBUG / INFO / WARNING / ERROR
+SCAN_LOG_LEVEL = os.environ.get('SCAN_LOG_LEVEL', 'WARNING').upper()
+
+# שמירת תמונות של עמודים לאבחון - כבוי כברירת מחדל
+SCAN_DIAGNOSTICS = os.environ.get('SCAN_DIAGNOSTICS', '').lower() in ('1', 'true', 'yes')
+# חלק מהעמודים שהצליחו שנשמרים גם הם (עמודים שנכשלו נשמרים תמיד כשהאבחון פעיל)
+SAMPLE_RATE = float(os.environ.get('SCAN_DIAGNOSTICS_SAMPLE_RATE', '0.02'))
+QUOTA_MB = float(os.environ.get('SCAN_DIAGNOSTICS_QUOTA_MB', '200'))
+MAX_WIDTH = 1200
+
+DIAGNOSTICS_DIR = get_data_path('scan_diagnostics')
+
+_configured = False
+_configure_lock = threading.Lock()
+_capture_lock = threading.Lock()
+
+
+def get_logger(name):
+    """
+    logger של צינור הסריקה - כולם תחת 'scan', עם פורמט key=value אחיד
+
+    Args:
+        name: שם המודול (__name__)
+    """
+    global _configured
+    with _configure_lock:
+        if not _configured:
+            parent = logging.getLogger('scan')
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter(
+                '%(asctime)s level=%(levelname)s logger=%(name)s pid=%(process)d %(message)s'))
+            parent.addHandler(handler)
+            parent.setLevel(getattr(logging, SCAN_LOG_LEVEL, logging.WARNING))
+            parent.propagate = False
+            _configured = True
+
+    return logging.getLogger(f"scan.{name.rsplit('.', 1)[-1]}")
+
+
+logger = get_logger(__name__)
+
+
+def should_capture(result):
+    """האם לשמור את העמוד - תמיד אם נכשל, ודגימה מהעמודים שהצליחו"""
+    if not SCAN_DIAGNOSTICS:
+        return False
+    if result.get('errors'):
+        return True
+    return random.random() < SAMPLE_RATE
+
+
+def _enforce_quota(incoming_bytes):
+    """מחיקת הקבצים הישנים ביותר עד שיש מקום לקובץ החדש במכסה"""
+    quota = QUOTA_MB * 1024 * 1024
+    try:
+        entries = [entry for entry in os.scandir(DIAGNOSTICS_DIR) if entry.is_file()]
+    except FileNotFoundError:
+        return
+
+    files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if total + incoming_bytes <= quota:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def capture_page(image, result, context=None):
+    """
+    שמירת עמוד לאבחון - מוקטן ל-MAX_WIDTH, עם קובץ JSON של התוצאה לצידו
+    לא עושה כלום אם האבחון כבוי או שהעמוד לא נבחר
+
+    Args:
+        image: תמונת העמוד (numpy array)
+        result: תוצאת process_single_page
+        context: פרטים נוספים לקובץ ה-JSON (קובץ, עמוד)
+
+    Returns:
+        נתיב התמונה שנשמרה, או None
+    """
+    if not should_capture(result):
+        return None
+
+    try:
+        image = np.asarray(image)
+        h, w = image.shape[:2]
+        if w > MAX_WIDTH:
+            scale = MAX_WIDTH / w
+            image = cv2.resize(image, (MAX_WIDTH, int(h * scale)), interpolation=cv2.INTER_AREA)
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+        ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        if not ok:
+            return None
+
+        info = {
+            'reason': 'failed' if result.get('errors') else 'sampled',
+            'errors': result.get('errors'),
+            'qr_data': result.get('qr_data'),
+            'qr_dpi': result.get('qr_dpi'),
+            'grade': result.get('grade'),
+            'ocr_text': result.get('ocr_text'),
+            'grade_region_source': result.get('grade_region_source'),
+            'skew_angle': result.get('skew_angle'),
+            'original_size': [w, h],
+            **(context or {})
+        }
+        sidecar = json.dumps(info, ensure_ascii=False, default=str).encode('utf-8')
+
+        name = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{os.getpid()}_{info['reason']}"
+        path = os.path.join(DIAGNOSTICS_DIR, f"{name}.jpg")
+
+        with _capture_lock:
+            os.makedirs(DIAGNOSTICS_DIR, exist_ok=True)
+            _enforce_quota(len(encoded) + len(sidecar))
+            with open(path, 'wb') as f:
+                f.write(encoded.tobytes())
+            with open(os.path.join(DIAGNOSTICS_DIR, f"{name}.json"), 'wb') as f:
+                f.write(sidecar)
+
+        logger.info("diagnostics_captured path=%s reason=%s", path, info['reason'])
+        return path
+
+    except Exception as e:
+        logger.warning("diagnostics_capture_failed error=%s", e)
+        return None
@@ -0,0 +1,166 @@
+"""
+Tesseract OCR Backend
+Keeps a Tesseract engine resident per thread through tesserocr (the C API binding), so the traineddata
+is loaded once and not on every call; falls back to pytesseract (a tesseract subprocess per call)
+when tesserocr is missing or its engine cannot be started
+"""
+
+import os
+import re
+import threading
+
+import numpy as np
+from PIL import Image
+import pytesseract
+
+from services import scan_diagnostics
+
+try:
+    import tesserocr
+except (ImportError, ValueError):
+    # ValueError - בחלק מההתקנות tesserocr טוען את cysignals, שמתקין signal handlers ונכשל מחוץ ל-main thread
+    tesserocr = None
+
+logger = scan_diagnostics.get_logger(__name__)
+
+_local = threading.local()
+_tessdata_path = None
+# המנוע של tesserocr נכשל באתחול (למשל אין tessdata) - מכאן והלאה רק pytesseract
+_init_failed = False
+
+
+def configure(tesseract_path=None):
+    """
+    הגדרת מיקום tesseract - ל-pytesseract הנתיב לקובץ ההרצה, ל-tesserocr תיקיית tessdata שלידו
+
+    Args:
+        tesseract_path: נתיב ל-tesseract executable (אופציונלי)
+    """
+    global _tessdata_path
+    if not tesseract_path:
+        return
+
+    pytesseract.pytesseract.tesseract_cmd = tesseract_path
+    tessdata = os.path.join(os.path.dirname(tesseract_path), 'tessdata')
+    if os.path.isdir(tessdata):
+        _tessdata_path = tessdata
+
+
+def is_resident():
+    """האם המנוע נשאר טעון בין קריאות (tesserocr מותקן והמנוע שלו עולה)"""
+    return tesserocr is not None and not _init_failed
+
+
+def _parse_config(config):
+    """פירוק מחרוזת config בסגנון שורת הפקודה של tesseract ל-psm ומשתנים"""
+    psm_match = re.search(r'--psm\s+(\d+)', config or '')
+    psm = int(psm_match.group(1)) if psm_match else None
+    variables = tuple(re.findall(r'-c\s+(\w+)=(\S+)', config or ''))
+    return psm, variables
+
+
+def _get_api(lang, psm, variables):
+    """
+    מנוע Tesseract של ה-thread הנוכחי לשפה ולהגדרות האלה - נוצר בקריאה הראשונה ונשאר טעון
+    PyTessBaseAPI לא בטוח לשימוש מכמה threads, לכן לכל thread מנוע משלו
+
+    Returns:
+        PyTessBaseAPI, או None אם המנוע לא עולה - ואז הקורא עובר ל-pytesseract
+    """
+    global _init_failed
+    if not is_resident():
+        return None
+
+    apis = getattr(_local, 'apis', None)
+    if apis is None:
+        apis = _local.apis = {}
+
+    key = (lang, psm, variables)
+    api = apis.get(key)
+    if api is None:
+        kwargs = {'lang': lang}
+        if psm is not None:
+            kwargs['psm'] = psm
+        if _tessdata_path:
+            kwargs['path'] = _tessdata_path
+        try:
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+        except RuntimeError as e:
+            _init_failed = True
+            logger.warning("tesserocr_init_failed lang=%s tessdata=%s error=%s - falling back to pytesseract",
+                           lang, _tessdata_path, e)
+            return None
+        for name, value in variables:
+            api.SetVariable(name, value)
+        apis[key] = api
+    return api
+
+
+def _to_pil(image):
+    """tesserocr מקבל רק תמונות PIL"""
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image)
+    return image
+
+
+def image_to_string(image, lang='eng', config=''):
+    """
+    זיהוי טקסט בתמונה - אותה חתימה כמו pytesseract.image_to_string
+
+    Args:
+        image: תמונה (numpy array או PIL)
+        lang: שפות (למשל 'heb+eng')
+        config: הגדרות בסגנון שורת הפקודה (--psm, -c)
+
+    Returns:
+        הטקסט שזוהה
+    """
+    api = _get_api(lang, *_parse_config(config))
+    if api is None:
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+    try:
+        api.SetImage(_to_pil(image))
+        return api.GetUTF8Text()
+    finally:
+        api.Clear()
+
+
+def image_to_data(image, lang='eng', config=''):
+    """
+    זיהוי מילים ומיקומן - כמו pytesseract.image_to_data עם Output.DICT
+
+    Args:
+        image: תמונה (numpy array או PIL)
+        lang: שפות (למשל 'heb+eng')
+        config: הגדרות בסגנון שורת הפקודה (--psm, -c)
+
+    Returns:
+        dict עם רשימות text, left, top, width, height, conf - איבר לכל מילה
+    """
+    api = _get_api(lang, *_parse_config(config))
+    if api is None:
+        return pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, lang=lang, config=config)
+
+    data = {'text': [], 'left': [], 'top': [], 'width': [], 'height': [], 'conf': []}
+
+    try:
+        api.SetImage(_to_pil(image))
+        api.Recognize()
+
+        level = tesserocr.RIL.WORD
+        for word in tesserocr.iterate_level(api.GetIterator(), level):
+            box = word.BoundingBox(level)
+            if box is None:
+                continue
+            x1, y1, x2, y2 = box
+            data['text'].append(word.GetUTF8Text(level) or '')
+            data['left'].append(x1)
+            data['top'].append(y1)
+            data['width'].append(x2 - x1)
+            data['height'].append(y2 - y1)
+            data['conf'].append(word.Confidence(level))
+    finally:
+        api.Clear()
+
+    return data
@@ -0,0 +1,76 @@
+"""
+Streaming ZIP Writer
+Builds a ZIP archive incrementally so it can be sent while entries are still being produced
+"""
+
+import zipfile
+
+
+class _ChunkSink:
+    """יעד כתיבה ל-ZipFile שצובר את הבתים עד שהם נשלחים ללקוח"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """החזרת כל מה שנכתב מאז הפעם הקודמת וריקון הצובר"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """
+    הזרמת ZIP - כל קובץ נשלח מיד כשהוא מוכן, והזיכרון לא גדל עם מספר הקבצים
+    הקבצים נשמרים בלי דחיסה (ZIP_STORED) - PDF כבר דחוס בפנים
+
+    Args:
+        entries: iterable של (שם קובץ, bytes)
+
+    Yields:
+        חלקים של קובץ ה-ZIP
+    """
+    sink = _ChunkSink()
+
+    # ליעד אין seek/tell - zipfile כותב data descriptor אחרי כל קובץ
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as zip_file:
+        for name, data in entries:
+            zip_file.writestr(name, data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+    # ה-central directory נכתב בסגירה
+    yield sink.drain()
+
+
+def with_error_report(results, on_progress=None):
+    """
+    קבצים לארכיון מתוך תוצאות שחלקן נכשלו - הכשלונות נאספים ל-errors.txt בסוף,
+    כדי שה-ZIP יכלול את כל השאר
+
+    Args:
+        results: iterable של (שם קובץ, bytes או None, הודעת שגיאה או None)
+        on_progress: פונקציה שנקראת עם (מספר התוצאות שהסתיימו, שם הקובץ) אחרי כל תוצאה (אופציונלי)
+
+    Yields:
+        (שם קובץ, bytes) - מתאים ל-stream_zip
+    """
+    errors = []
+    for done, (name, data, error) in enumerate(results, start=1):
+        if on_progress:
+            on_progress(done, name)
+        if error:
+            errors.append(f"{name}: {error}")
+            continue
+        yield name, data
+
+    if errors:
+        yield 'errors.txt', '\n'.join(errors).encode('utf-8')
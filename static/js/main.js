@@ -86,6 +86,35 @@ async function apiCall(endpoint, options = {}) {
     }
 }
 
+// Background jobs - משימות רקע
+// Poll a job until it finishes, reporting progress along the way
+async function waitForJob(jobId, onProgress, interval = 1000) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const job = await response.json();
+        if (!response.ok) {
+            throw new Error(job.error || 'שגיאה בבדיקת המשימה');
+        }
+
+        if (onProgress) onProgress(job);
+
+        if (job.status === 'done') return job;
+        if (job.status === 'failed') throw new Error(job.error || 'המשימה נכשלה');
+        if (job.status === 'cancelled') throw new Error('המשימה בוטלה');
+
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
+// Start the download of a finished job's file
+function downloadJobResult(jobId) {
+    const a = document.createElement('a');
+    a.href = `/api/jobs/${jobId}/result`;
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
+}
+
 // Confirm dialog helper
 function confirmAction(message) {
     return confirm(message);
@@ -112,3 +141,5 @@ window.showSuccess = showSuccess;
 window.confirmAction = confirmAction;
 window.formatDate = formatDate;
 window.escapeHtml = escapeHtml;
+window.waitForJob = waitForJob;
+window.downloadJobResult = downloadJobResult;
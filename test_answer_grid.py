@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת גיליון התשובות לשאלות רב ברירה
+העיגולים המסומנים נמדדים במיקומים הידועים מהתבנית, נבדקים מול מפתח התשובות ונשמרים כציוני שאלות
+"""
+
+import os
+import sqlite3
+import tempfile
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+from services.database import ExamDatabase
+from services.ocr_service import ExamOCRService, save_grades_to_database
+from services.pdf_generator import ExamPDFGenerator
+
+EXAM = {'id': 4, 'title': 'מבחן', 'subject': 'גמרא'}
+QUESTIONS = [
+    {'question_number': n, 'question_text': f'שאלה {n}', 'points': points, 'question_type': 'multiple_choice',
+     'options': ['א', 'ב', 'ג', 'ד'], 'correct_answer': correct}
+    for n, points, correct in ((1, 30, 1), (2, 30, 0), (3, 40, 3))
+]
+
+
+def scanned_page(marks, student_exam_id=None, questions=QUESTIONS):
+    """
+    עמוד מבחן ב-200 DPI עם עיגולים מסומנים
+
+    Args:
+        marks: dict של אינדקס שאלה בגיליון -> list של (אפשרות, מילוי) - מילוי 1 הוא עיגול מלא
+    """
+    generator = ExamPDFGenerator()
+    template = generator.get_exam_template(EXAM, questions)
+    layout = generator.layout_manifest(template)
+    pdf_bytes = generator.stamp_student_pdf(template, EXAM, {'id': 1, 'name': 'בדיקה',
+                                                             'student_exam_id': student_exam_id})
+
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+        pix = doc[0].get_pixmap(dpi=200, colorspace=fitz.csGRAY)
+        page = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width).copy()
+
+    grid = layout['regions']['answer_grid']
+    h, w = page.shape
+    grid_w = (grid['x1'] - grid['x0']) * w
+    grid_h = (grid['y1'] - grid['y0']) * h
+    radius = grid['radius'] * grid_w
+    for index, options in marks.items():
+        for option, amount in options:
+            fx, fy = grid['questions'][index]['bubbles'][option]
+            center = (int(grid['x0'] * w + fx * grid_w), int(grid['y0'] * h + fy * grid_h))
+            if amount >= 1:
+                cv2.circle(page, center, int(radius * 0.85), 30, -1, cv2.LINE_AA)
+            else:
+                # סימון V קטן במקום מילוי
+                cv2.line(page, (center[0] - int(radius * 0.4), center[1]), center, 30, 3)
+                cv2.line(page, center, (center[0] + int(radius * 0.5), center[1] - int(radius * 0.6)), 30, 3)
+    return page, layout
+
+
+def test_template_has_answer_grid():
+    """מפת האזורים כוללת את הגיליון - בעמוד של ה-QR, עם עיגול לכל אפשרות"""
+    _, layout = scanned_page({})
+    grid = layout['regions']['answer_grid']
+
+    assert grid['page'] == layout['regions']['qr']['page']
+    assert [q['question_number'] for q in grid['questions']] == [1, 2, 3]
+    assert all(len(q['bubbles']) == 4 for q in grid['questions'])
+
+
+def test_read_answers():
+    """סימון אחד בכל שאלה, ושאלה שלא סומנה - נקראים בלי בדיקה ידנית"""
+    page, layout = scanned_page({0: [(1, 1)], 1: [(0, 1)]})
+    answers = ExamOCRService().read_answer_grid(page, layout)
+
+    assert [a['answer'] for a in answers] == [1, 0, None]
+    assert not any(a['needs_review'] for a in answers)
+
+
+def test_ambiguous_marks_flagged():
+    """שני עיגולים מסומנים וסימון V חלקי - בלי תשובה, לבדיקה ידנית"""
+    page, layout = scanned_page({0: [(1, 1), (2, 1)], 1: [(3, 0.5)], 2: [(2, 1)]})
+    answers = ExamOCRService().read_answer_grid(page, layout)
+
+    assert answers[0]['answer'] is None and answers[0]['needs_review']
+    assert answers[1]['needs_review']
+    assert answers[2]['answer'] == 2 and not answers[2]['needs_review']
+
+
+def test_save_question_grades():
+    """מבחן שכולו רב ברירה - ציון לכל שאלה והציון הכולל נשמרים; שמירה חוזרת לא משכפלת"""
+    db = ExamDatabase(os.path.join(tempfile.mkdtemp(), 'grid.db'))
+    student_id = db.add_student({'first_name': 'ראובן', 'last_name': 'בדיקה'})
+    exam_id = db.create_exam({'title': 'מבחן', 'subject': 'גמרא', 'total_points': 100}, QUESTIONS)
+    (student_exam_id,) = db.assign_exam_to_students(exam_id, [student_id], '2026-01-01')
+
+    # שאלה 1 נכונה, שאלה 2 שגויה, שאלה 3 נכונה
+    page, layout = scanned_page({0: [(1, 1)], 1: [(2, 1)], 2: [(3, 1)]}, student_exam_id)
+    ocr = ExamOCRService(layout_lookup=lambda exam_id, version: layout, qr_lookup=db.get_student_exam_identity)
+
+    for _ in range(2):
+        result = ocr.process_single_page(page)
+        stats = save_grades_to_database([result], db)
+        assert stats['saved'] == 1 and stats['question_grades'] == 3 and not stats['errors']
+
+    conn = sqlite3.connect(db.db_name)
+    grades = conn.execute('SELECT id, total_score, needs_review FROM exam_grades').fetchall()
+    questions = conn.execute('''
+        SELECT q.question_number, g.points_earned, g.points_possible
+        FROM question_grades g JOIN exam_questions q ON g.question_id = q.id
+        WHERE g.grade_id = ? ORDER BY q.question_number
+    ''', (grades[0][0],)).fetchall()
+    conn.close()
+
+    assert [(score, review) for _, score, review in grades] == [(70, 0)]
+    assert questions == [(1, 30, 30), (2, 0, 30), (3, 40, 40)]
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת גיליון התשובות")
+    print("=" * 60)
+
+    test_template_has_answer_grid()
+    print("[V] גיליון במפת התבנית")
+
+    test_read_answers()
+    print("[V] קריאת הסימונים")
+
+    test_ambiguous_marks_flagged()
+    print("[V] סימון כפול או חלקי מסומן לבדיקה")
+
+    test_save_question_grades()
+    print("[V] שמירת ציוני שאלות")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת הכנת טקסט עברי (bidi) ל-PDF
+התוצאות מקובעות להתנהגות של prepare_hebrew_text לפני הוספת המטמון
+"""
+
+from services import bidi_text
+from services.pdf_generator import ExamPDFGenerator
+
+# (קלט, פלט צפוי)
+PINNED_CASES = [
+    ('מבחן', 'ןחבמ'),
+    ('<b>שם המבחן:</b> מבחן גמרא', '<b>ארמג ןחבמ :ןחבמה םש</b>'),
+    ('<b>מקצוע:</b> גמרא', '<b>ארמג :עוצקמ</b>'),
+    ("<b>שיעור:</b> א'", "<b>'א :רועיש</b>"),
+    ('<b>תאריך:</b> 2026-10-20', '<b>2026-10-20 :ךיראת</b>'),
+    ('<b>שם התלמיד:</b> כהן משה', '<b>השמ ןהכ :דימלתה םש</b>'),
+    ('<b>תעודת זהות:</b> 123456789', '<b>123456789 :תוהז תדועת</b>'),
+    ('<b>תעודת זהות:</b> _______________', '<b>_______________ :תוהז תדועת</b>'),
+    ('<b>שם התלמיד:</b> ', '<b> :דימלתה םש</b>'),
+    ('<b>הוראות:</b>', '<b> :תוארוה</b>'),
+    ('ענו על כל השאלות', 'תולאשה לכ לע ונע'),
+    ('<b>שאלה 1</b> (10 נקודות)', '<b>(תודוקנ 10) 1 הלאש</b>'),
+    ('מה אמר רבא בסוגיה?', '?היגוסב אבר רמא המ'),
+    ('    1. אפשרות א', 'א תורשפא .1    '),
+    ('תשובה: _______', '_______ :הבושת'),
+    ('<b>סה"כ נקודות במבחן: 100</b>', '<b>100 :ןחבמב תודוקנ כ"הס</b>'),
+    ('<b>ציון שהתקבל: ______ / 100</b>', '<b>______ / 100 :לבקתהש ןויצ</b>'),
+    ('Hello world', 'Hello world'),
+    ('שאלה: מה דעת רש"י: בדף ב\'', '\'ב ףדב :י"שר תעד המ :הלאש'),
+    ('', ''),
+    (None, None),
+    ('abc 123 אבג', 'abc 123 גבא'),
+]
+
+
+def test_pinned_output():
+    """הפלט זהה להתנהגות הקודמת - כולל תגיות, נקודתיים וטקסט ריק"""
+    for text, expected in PINNED_CASES:
+        assert bidi_text.prepare_hebrew_text(text) == expected, text
+
+
+def test_generator_delegates():
+    """ExamPDFGenerator.prepare_hebrew_text מחזיר אותו פלט"""
+    generator = ExamPDFGenerator()
+    for text, expected in PINNED_CASES:
+        assert generator.prepare_hebrew_text(text) == expected, text
+
+
+def test_repeated_labels_hit_cache():
+    """תוויות שחוזרות מגיעות מהמטמון"""
+    bidi_text.clear_cache()
+    for _ in range(100):
+        bidi_text.prepare_hebrew_text("תשובה: _______")
+
+    info = bidi_text.cache_info()['texts']
+    assert info['misses'] == 1
+    assert info['hits'] == 99
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת הכנת טקסט עברי")
+    print("=" * 60)
+
+    test_pinned_output()
+    print("[V] פלט זהה להתנהגות הקודמת")
+
+    test_generator_delegates()
+    print("[V] ExamPDFGenerator משתמש באותה שכבה")
+
+    test_repeated_labels_hit_cache()
+    print("[V] המטמון עובד")
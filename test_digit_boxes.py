@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת קריאת הציון מריבועי הספרות
+כל ספרה מסווגת לבד במסווג התבניות, וקריאה חשודה מסומנת לבדיקה ידנית
+"""
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+from services.digit_classifier import get_classifier
+from services.ocr_service import ExamOCRService
+from services.pdf_generator import ExamPDFGenerator
+
+EXAM = {'id': 3, 'title': 'מבחן', 'subject': 'גמרא'}
+QUESTIONS = [{'question_number': 1, 'question_text': 'שאלה', 'points': 100, 'question_type': 'multiple_choice',
+              'options': ['א', 'ב']}]
+
+# גופן נטוי שלא נמצא בתבניות של המסווג
+HANDWRITING = cv2.FONT_HERSHEY_PLAIN | cv2.FONT_ITALIC
+
+
+def digit_cell(digit, size=80):
+    """ריבוע באפור עם ספרה אחת (או ריק), על נייר לא לבן לגמרי"""
+    cell = np.full((size, size), 235, dtype=np.uint8)
+    if digit is not None:
+        cv2.putText(cell, str(digit), (size // 4, size * 4 // 5), HANDWRITING, size / 18, 20, 4, cv2.LINE_AA)
+    return cell
+
+
+def scanned_page(written):
+    """
+    עמוד מבחן ב-200 DPI עם ספרות בריבועי הציון
+
+    Args:
+        written: מחרוזת באורך מספר הריבועים - ספרה או רווח לכל ריבוע
+    """
+    generator = ExamPDFGenerator()
+    template = generator.get_exam_template(EXAM, QUESTIONS)
+    layout = generator.layout_manifest(template)
+    pdf_bytes = generator.stamp_student_pdf(template, EXAM, {'id': 1, 'name': 'בדיקה'})
+
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+        pix = doc[0].get_pixmap(dpi=200, colorspace=fitz.csGRAY)
+        page = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width).copy()
+
+    boxes = layout['regions']['grade_boxes']
+    h, w = page.shape
+    box = (boxes['y1'] - boxes['y0']) * h
+    gap = ((boxes['x1'] - boxes['x0']) * w - boxes['digits'] * box) / (boxes['digits'] - 1)
+    for i, char in enumerate(written):
+        if char != ' ':
+            origin = (int(boxes['x0'] * w + i * (box + gap) + box * 0.25), int(boxes['y0'] * h + box * 0.8))
+            cv2.putText(page, char, origin, HANDWRITING, box / 26, 0, 3, cv2.LINE_AA)
+    return page, layout
+
+
+def test_classifier():
+    """כל הספרות מזוהות, וריבוע ריק הוא None"""
+    results = get_classifier().classify([digit_cell(d) for d in range(10)] + [digit_cell(None)])
+
+    assert [digit for digit, _ in results] == list(range(10)) + [None]
+    assert all(0 < confidence <= 1 for _, confidence in results)
+
+
+def test_template_has_digit_boxes():
+    """מפת האזורים של התבנית כוללת את הריבועים - ריבוע לכל ספרה של הציון המקסימלי"""
+    _, layout = scanned_page('')
+    boxes = layout['regions']['grade_boxes']
+
+    assert boxes['digits'] == 3 and boxes['max_score'] == 100
+    assert boxes['page'] == layout['regions']['grade']['page']
+
+
+def test_read_boxes():
+    """ציון בשני הריבועים האחרונים - נקרא בלי טסרקט ולא מסומן לבדיקה"""
+    page, layout = scanned_page(' 87')
+    grade = ExamOCRService().read_digit_boxes(page, layout)
+
+    assert grade['score'] == 87 and grade['total'] == 100
+    assert grade['digits'] == [None, 8, 7]
+    assert not grade['needs_review']
+
+
+def test_suspicious_reads_flagged():
+    """ציון מעל המקסימום, ריבוע ריק באמצע וריבועים ריקים - לבדיקה ידנית"""
+    ocr = ExamOCRService()
+
+    assert ocr.read_digit_boxes(*scanned_page('150'))['needs_review']
+    assert ocr.read_digit_boxes(*scanned_page('8 5'))['needs_review']
+
+    empty = ocr.read_digit_boxes(*scanned_page('   '))
+    assert empty['score'] is None and empty['needs_review']
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת קריאת הציון מריבועי הספרות")
+    print("=" * 60)
+
+    test_classifier()
+    print("[V] סיווג ספרות")
+
+    test_template_has_digit_boxes()
+    print("[V] ריבועים במפת התבנית")
+
+    test_read_boxes()
+    print("[V] קריאת הציון מהריבועים")
+
+    test_suspicious_reads_flagged()
+    print("[V] קריאה חשודה מסומנת לבדיקה")
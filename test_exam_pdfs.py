@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת יצירת מבחנים מתבנית
+גוף המבחן נבנה פעם אחת לכל גרסה, ועל כל עותק מוטבעים השם, ת.ז. וה-QR של התלמיד
+"""
+
+import json
+import os
+import tempfile
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from services import pdf_generator, pdf_store
+from services.database import ExamDatabase
+from services.ocr_service import ExamOCRService
+from services.pdf_generator import ExamPDFGenerator, generate_exam_pdf_for_student, load_batch_data, \
+    publish_exam_layouts
+
+EXAM = {'id': 7, 'title': 'מבחן', 'subject': 'גמרא'}
+QUESTIONS = [{'question_number': 1, 'question_text': 'שאלה', 'points': 100, 'question_type': 'essay'}]
+STUDENTS = [
+    {'id': 3, 'name': 'כהן ראובן', 'id_number': '123456789', 'version': 'A'},
+    {'id': 4, 'name': 'לוי שמעון', 'id_number': '987654321', 'version': 'B'},
+]
+
+
+def _crashing_render(exam_data, questions, student):
+    """במקום _render_student_pdf - תהליך ה-worker מת על התלמיד 5, כמו קריסה של ReportLab"""
+    if student['id'] == 5:
+        os._exit(1)
+    return pdf_generator._render_student_pdf(exam_data, questions, student)
+
+
+def read_page(doc, page_num):
+    """הטקסט של העמוד וה-QR שנקרא מהתמונה שלו"""
+    pix = doc[page_num].get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+    image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+    return doc[page_num].get_text(), ExamOCRService().read_qr_code(image)
+
+
+def test_stamped_header_per_student():
+    """כל עותק נושא את הכותרת וה-QR של התלמיד שלו ושל הגרסה שלו - לא של התלמיד הקודם בתבנית"""
+    generator = ExamPDFGenerator()
+
+    for student in STUDENTS:
+        template = generator.get_exam_template(EXAM, QUESTIONS, student['version'])
+        pdf_bytes = generator.stamp_student_pdf(template, EXAM, student)
+
+        with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+            text, qr_data = read_page(doc, 0)
+            assert doc.metadata['author'] == student['name']
+
+        assert student['id_number'] in text and student['name'] in text
+        other = STUDENTS[1 - STUDENTS.index(student)]
+        assert other['id_number'] not in text
+        assert (qr_data['student_id'], qr_data['exam_id'], qr_data['version']) == \
+            (student['id'], EXAM['id'], student['version'])
+
+
+def test_metadata_embedded_at_build():
+    """ה-PDF נבנה במעבר אחד עם /YeshivaData ב-/Info - והסורק קורא אותו בחזרה"""
+    student = dict(STUDENTS[1])
+    path = os.path.join(tempfile.mkdtemp(), 'exam.pdf')
+
+    assert ExamPDFGenerator().create_exam_pdf(EXAM, QUESTIONS, student, output_path=path) is None
+
+    data = ExamOCRService().read_pdf_metadata(path)
+    assert (data['student_id'], data['student_name'], data['exam_id'], data['version']) == \
+        (student['id'], student['name'], EXAM['id'], 'B')
+    with fitz.open(path) as doc:
+        assert (doc.metadata['title'], doc.metadata['author'], doc.metadata['subject']) == \
+            (EXAM['title'], student['name'], EXAM['subject'])
+
+
+def test_template_cached_per_version():
+    """אותה גרסה - אותה תבנית מהמטמון; גרסה אחרת - תבנית נפרדת"""
+    generator = ExamPDFGenerator()
+    template_a = generator.get_exam_template(EXAM, QUESTIONS, 'A')
+
+    assert generator.get_exam_template(EXAM, QUESTIONS, 'A') is template_a
+    assert generator.get_exam_template(EXAM, QUESTIONS, 'B')['key'] != template_a['key']
+
+
+def test_batch_in_order_with_failure():
+    """אצווה בתהליכים - התוצאות חוזרות לפי סדר הרשימה, ותלמיד שנכשל לא עוצר את השאר"""
+    # מזהה הקצאה לא מספרי - הטוקן ב-QR לא נוצר והתלמיד נכשל בתוך תהליך ה-worker
+    broken = {'id': 5, 'name': 'שבור', 'student_exam_id': 'x'}
+    students = [STUDENTS[0], broken] + [dict(STUDENTS[1], id=10 + i) for i in range(4)]
+
+    results = list(ExamPDFGenerator().iter_batch_exams(EXAM, QUESTIONS, students, workers=2))
+
+    assert [student['id'] for student, _, _ in results] == [student['id'] for student in students]
+    for student, pdf_bytes, error in results:
+        if student is broken:
+            assert pdf_bytes is None and error
+        else:
+            assert error is None
+            with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+                assert read_page(doc, 0)[1]['student_id'] == student['id']
+
+
+def test_crashed_pool_replaced():
+    """תהליך worker שקרס - התלמידים שבדרך נכשלים, המאגר מוחלף, והאצווה הבאה רצה על מאגר חדש"""
+    students = [STUDENTS[0], {'id': 5, 'name': 'קורס'}, STUDENTS[1]]
+    first = pdf_generator._get_pdf_pool(2)
+    other = pdf_generator._get_pdf_pool(3)
+
+    original = pdf_generator._render_student_pdf
+    pdf_generator._render_student_pdf = _crashing_render
+    try:
+        results = list(ExamPDFGenerator().iter_batch_exams(EXAM, QUESTIONS, students, workers=2))
+    finally:
+        pdf_generator._render_student_pdf = original
+
+    assert [student['id'] for student, _, _ in results] == [3, 5, 4]
+    assert results[1][1] is None and results[1][2]
+    assert pdf_generator._get_pdf_pool(2) is not first
+
+    results = list(ExamPDFGenerator().iter_batch_exams(EXAM, QUESTIONS, STUDENTS, workers=2))
+    assert all(error is None for _, _, error in results)
+    # מאגר בגודל אחר לא נסגר בגלל האצווה הזו
+    assert pdf_generator._get_pdf_pool(3) is other
+    assert other.submit(len, 'abc').result() == 3
+
+
+def test_merged_pdf():
+    """PDF אחד לכיתה - טווח עמודים וסימניה לכל תלמיד, ותלמיד שנכשל לא משאיר עמודים בלי כותרת"""
+    generator = ExamPDFGenerator()
+    pages_per_exam = len(fitz.open(stream=generator.get_exam_template(EXAM, QUESTIONS)['pdf_bytes'], filetype='pdf'))
+    # נכשל בהטבעת הכותרת - אחרי שעמודי התבנית כבר הוכנסו למסמך
+    broken = {'id': 5, 'name': 'שבור', 'student_exam_id': 'x'}
+
+    pdf_bytes = generator.create_merged_exam_pdf(EXAM, QUESTIONS, [STUDENTS[0], broken, STUDENTS[1]])
+
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+        sections = json.loads(doc.xref_get_key(int(doc.xref_get_key(-1, 'Info')[1].split()[0]), 'YeshivaPages')[1])
+        toc = doc.get_toc()
+
+        assert len(doc) == 2 * pages_per_exam
+        assert [(s['student_id'], s['first_page'], s['last_page'], s['version']) for s in sections] == \
+            [(3, 1, pages_per_exam, 'A'), (4, pages_per_exam + 1, 2 * pages_per_exam, 'B')]
+        assert toc == [[1, STUDENTS[0]['name'], 1], [1, STUDENTS[1]['name'], pages_per_exam + 1]]
+
+        # העמוד הראשון של כל טווח - הכותרת וה-QR של התלמיד שלו
+        for section, student in zip(sections, STUDENTS):
+            text, qr_data = read_page(doc, section['first_page'] - 1)
+            assert student['id_number'] in text
+            assert qr_data['student_id'] == student['id']
+
+
+def test_assigned_version_used():
+    """כל תלמיד מקבל את הגרסה שהוקצתה לו, ומפת האזורים מתפרסמת לכל גרסה שבשימוש"""
+    # התלמידים נטענים ממסד הנתונים שבברירת המחדל - בתיקיית נתונים זמנית
+    data_dir, store_dir = os.environ.get('DATA_DIR'), pdf_store.STORE_DIR
+    os.environ['DATA_DIR'] = tempfile.mkdtemp()
+    pdf_store.STORE_DIR = os.path.join(os.environ['DATA_DIR'], 'generated_pdfs')
+    try:
+        db = ExamDatabase()
+        first, second = [db.add_student({'first_name': name, 'last_name': 'בדיקה'}) for name in ('ראובן', 'שמעון')]
+        exam_id = db.create_exam({'title': 'מבחן', 'subject': 'גמרא', 'total_points': 100}, [])
+        db.assign_exam_to_students(exam_id, [first], '2026-01-01', version_code='A')
+        db.assign_exam_to_students(exam_id, [second], '2026-01-01', version_code='B')
+
+        exam_data, questions, students = load_batch_data(exam_id, [first, second], db)
+        assert [student['version'] for student in students] == ['A', 'B']
+
+        publish_exam_layouts(exam_data, questions, students, db, ExamPDFGenerator())
+        assert db.get_exam_layout(exam_id, 'A')['version'] == 'A'
+        assert db.get_exam_layout(exam_id, 'B')['version'] == 'B'
+
+        # העזר הישן מחזיר את אותו קובץ מוטבע שמסלול ההורדה מגיש מהמאגר
+        pdf_bytes = generate_exam_pdf_for_student(exam_id, second, db)
+        store_path = pdf_store.get_student_pdf_path(exam_id, second, db)
+        with open(store_path, 'rb') as f:
+            assert f.read() == pdf_bytes
+        assert ExamOCRService().read_pdf_metadata(store_path)['version'] == 'B'
+    finally:
+        pdf_store.STORE_DIR = store_dir
+        if data_dir is None:
+            os.environ.pop('DATA_DIR')
+        else:
+            os.environ['DATA_DIR'] = data_dir
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת יצירת מבחנים מתבנית")
+    print("=" * 60)
+
+    test_stamped_header_per_student()
+    print("[V] כותרת ו-QR לכל תלמיד")
+
+    test_metadata_embedded_at_build()
+    print("[V] metadata בזמן הבנייה")
+
+    test_template_cached_per_version()
+    print("[V] תבנית לכל גרסה")
+
+    test_batch_in_order_with_failure()
+    print("[V] אצווה בתהליכים")
+
+    test_crashed_pool_replaced()
+    print("[V] החלפת מאגר שקרס")
+
+    test_merged_pdf()
+    print("[V] PDF מאוחד לכיתה")
+
+    test_assigned_version_used()
+    print("[V] גרסה לפי ההקצאה")
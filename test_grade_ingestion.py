@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת שמירת ציונים מסריקה
+כל הסריקה נשמרת בטרנזקציה אחת, ושמירה חוזרת של אותה סריקה לא משכפלת ציונים
+"""
+
+import os
+import sqlite3
+import tempfile
+
+from services.database import ExamDatabase
+from services.ocr_service import save_grades_to_database
+
+
+def setup_exam(students=3):
+    """מבחן של 50 נקודות ששובץ לכמה תלמידים"""
+    db = ExamDatabase(os.path.join(tempfile.mkdtemp(), 'grades.db'))
+    student_ids = [db.add_student({'first_name': f'תלמיד {i}', 'last_name': 'בדיקה'}) for i in range(students)]
+    exam_id = db.create_exam({'title': 'מבחן', 'subject': 'גמרא', 'total_points': 50}, [])
+    db.assign_exam_to_students(exam_id, student_ids, '2026-01-01')
+    return db, exam_id, student_ids
+
+
+def result(student_id, exam_id, score, confidence=0.9, page=1):
+    return {
+        'page_number': page,
+        'qr_data': {'student_id': student_id, 'exam_id': exam_id},
+        'grade': {'score': score, 'total': 50},
+        'ocr_text': f'{score}/50',
+        'confidence': confidence,
+        'errors': []
+    }
+
+
+def grade_rows(db):
+    conn = sqlite3.connect(db.db_name)
+    rows = conn.execute('''
+        SELECT se.student_id, eg.total_score, eg.grade_percent, se.status
+        FROM exam_grades eg JOIN student_exams se ON eg.student_exam_id = se.id
+        ORDER BY se.student_id
+    ''').fetchall()
+    conn.close()
+    return rows
+
+
+def test_bulk_save():
+    """כל הציונים נשמרים, עם אחוז לפי הניקוד של המבחן וסטטוס 'graded'"""
+    db, exam_id, (a, b, c) = setup_exam()
+
+    stats = save_grades_to_database([result(a, exam_id, 40), result(b, exam_id, 45), result(c, exam_id, 50)], db)
+
+    assert stats['saved'] == 3 and stats['failed'] == 0
+    assert grade_rows(db) == [(a, 40, 80.0, 'graded'), (b, 45, 90.0, 'graded'), (c, 50, 100.0, 'graded')]
+
+
+def test_resave_is_idempotent():
+    """שמירה חוזרת (עם ציון מתוקן) מעדכנת את אותה שורה"""
+    db, exam_id, (a, b, _) = setup_exam()
+    save_grades_to_database([result(a, exam_id, 40), result(b, exam_id, 45)], db)
+
+    stats = save_grades_to_database([result(a, exam_id, 42), result(b, exam_id, 45)], db)
+
+    assert stats['updated'] == 2
+    assert [(row[0], row[1]) for row in grade_rows(db)] == [(a, 42), (b, 45)]
+
+
+def test_failures_reported():
+    """תלמיד שלא שובץ, ציון חסר וכמה עמודים של אותו מבחן"""
+    db, exam_id, (a, _, _) = setup_exam()
+
+    stats = save_grades_to_database([
+        result(a, exam_id, 30, confidence=0.5, page=1),
+        result(a, exam_id, 35, confidence=0.95, page=2),
+        result(999, exam_id, 40, page=3),
+        dict(result(a, exam_id, 0, page=4), grade=None),
+    ], db)
+
+    assert stats['saved'] == 1 and stats['duplicates'] == 1 and stats['failed'] == 2
+    assert [(row[0], row[1]) for row in grade_rows(db)] == [(a, 35)]
+
+
+def needs_review_flags(db):
+    conn = sqlite3.connect(db.db_name)
+    flags = [row[0] for row in conn.execute('SELECT needs_review FROM exam_grades ORDER BY id')]
+    conn.close()
+    return flags
+
+
+def test_needs_review_saved():
+    """ציון שהסורק סימן לבדיקה נשמר מסומן - אלא אם תוקן ידנית במסך הסריקה"""
+    db, exam_id, (a, b, _) = setup_exam()
+
+    stats = save_grades_to_database([
+        dict(result(a, exam_id, 40), needs_review=True),
+        dict(result(b, exam_id, 45), needs_review=True, manually_edited=True),
+    ], db)
+
+    assert stats['needs_review'] == 1
+    assert needs_review_flags(db) == [1, 0]
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת שמירת ציונים מסריקה")
+    print("=" * 60)
+
+    test_bulk_save()
+    print("[V] שמירה בטרנזקציה אחת")
+
+    test_resave_is_idempotent()
+    print("[V] שמירה חוזרת לא משכפלת")
+
+    test_failures_reported()
+    print("[V] שגיאות מדווחות")
+
+    test_needs_review_saved()
+    print("[V] ציונים לבדיקה מסומנים")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת זרם האירועים של משימות רקע (Server-Sent Events)
+תוצאות חלקיות נשלחות בזמן שהמשימה רצה, וחיבור מחדש ממשיך מהאירוע האחרון
+"""
+
+import os
+import json
+import tempfile
+
+from services import job_queue
+from services.database import YeshivaDatabase
+
+
+def setup_queue():
+    """תור משימות על מסד נתונים זמני, עם משימה אחת שרצה"""
+    db = YeshivaDatabase(os.path.join(tempfile.mkdtemp(), 'jobs.db'))
+    job_queue._db = db
+    job_queue.STREAM_POLL_INTERVAL = 0.01
+    job_id = db.create_job('scan_upload', {'files': []})
+    return db, job_id
+
+
+def parse(stream):
+    """פירוק הזרם לרשימת (id, event, data)"""
+    messages = []
+    for chunk in stream:
+        fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n') if ': ' in line and line[0] != ':')
+        if 'event' in fields:
+            messages.append((fields.get('id'), fields['event'], json.loads(fields['data'])))
+    return messages
+
+
+def test_events_then_end():
+    """האירועים לפי הסדר, ו-'end' עם התוצאה כשהמשימה מסתיימת"""
+    db, job_id = setup_queue()
+    db.add_job_event(job_id, 'page_result', {'page_number': 1})
+    db.add_job_event(job_id, 'page_result', {'page_number': 2})
+    db.complete_job(job_id, {'results': [1, 2]})
+
+    messages = parse(job_queue.stream_events(job_id))
+    events = [event for _, event, _ in messages]
+
+    assert events == ['page_result', 'page_result', 'progress', 'end']
+    assert [data['page_number'] for _, event, data in messages if event == 'page_result'] == [1, 2]
+    assert messages[-1][2]['result'] == {'results': [1, 2]}
+
+
+def test_resume_after_reconnect():
+    """חיבור מחדש עם Last-Event-ID - רק האירועים שלא התקבלו"""
+    db, job_id = setup_queue()
+    first = db.add_job_event(job_id, 'page_result', {'page_number': 1})
+    db.add_job_event(job_id, 'page_result', {'page_number': 2})
+    db.complete_job(job_id, {'results': []})
+
+    messages = parse(job_queue.stream_events(job_id, last_event_id=first))
+    assert [data['page_number'] for _, event, data in messages if event == 'page_result'] == [2]
+
+
+def test_missing_job():
+    """משימה שלא קיימת - 'end' מיד"""
+    setup_queue()
+    messages = parse(job_queue.stream_events(999))
+    assert [event for _, event, _ in messages] == ['end']
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת זרם האירועים של משימות רקע")
+    print("=" * 60)
+
+    test_events_then_end()
+    print("[V] אירועים ואז סיום")
+
+    test_resume_after_reconnect()
+    print("[V] חיבור מחדש ממשיך מהאירוע האחרון")
+
+    test_missing_job()
+    print("[V] משימה שלא קיימת")
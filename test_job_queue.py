@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת תור משימות הרקע
+לקיחה מקבילית, ניסיונות חוזרים, ביטול, שחזור אחרי קריסה וניקוי קבצים - בלי תהליכוני העבודה עצמם
+"""
+
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from services import job_queue
+from services.database import YeshivaDatabase
+
+calls = []
+
+
+@job_queue.job_handler('test_flaky', max_attempts=3)
+def run_flaky(job):
+    """נכשלת תמיד בשגיאה זמנית"""
+    calls.append(job.attempt)
+    raise RuntimeError('זמני')
+
+
+@job_queue.job_handler('test_invalid', max_attempts=3)
+def run_invalid(job):
+    """נתונים לא תקינים - אין טעם לנסות שוב"""
+    calls.append(job.attempt)
+    raise ValueError('מבחן לא קיים')
+
+
+@job_queue.job_handler('test_progress')
+def run_progress(job):
+    """מדווחת התקדמות - שם נבדקת בקשת ביטול"""
+    for done in range(3):
+        job.progress(done, 3)
+    return {'ok': True}
+
+
+@job_queue.job_handler('test_slow')
+def run_slow(job):
+    """קריאה ארוכה אחת בלי דיווח התקדמות - הדופק צריך להתעדכן בכל זאת"""
+    db = job.db
+    age_heartbeat(db, job.id)
+    time.sleep(job_queue.HEARTBEAT_SECONDS * 4)
+    return {'requeued': db.requeue_stale_jobs(60)}
+
+
+def setup_queue():
+    """תור משימות על מסד נתונים זמני"""
+    db = YeshivaDatabase(os.path.join(tempfile.mkdtemp(), 'jobs.db'))
+    job_queue._db = db
+    calls.clear()
+    return db
+
+
+def age_heartbeat(db, job_id, seconds=3600):
+    """דופק ישן - כמו משימה שהתהליך שלה קרס"""
+    conn = sqlite3.connect(db.db_name)
+    conn.execute("UPDATE jobs SET heartbeat_at = datetime('now', ?) WHERE id = ?", (f'-{seconds} seconds', job_id))
+    conn.commit()
+    conn.close()
+
+
+def run_until_settled(db, worker_id='test:1:0'):
+    """הרצת המשימות בתור ברצף, עד שהתור ריק - כמו תהליכון עבודה אחד"""
+    while True:
+        job = db.claim_next_job(worker_id)
+        if job is None:
+            return
+        job_queue._run_job(db, job)
+
+
+def test_concurrent_claims():
+    """כמה תהליכונים לוקחים מהתור במקביל - כל משימה נלקחת פעם אחת בדיוק"""
+    db = setup_queue()
+    job_ids = [db.create_job('test_progress', {}) for _ in range(30)]
+    claimed = []
+    lock = threading.Lock()
+
+    def worker(index):
+        while True:
+            job = db.claim_next_job(f'test:1:{index}')
+            if job is None:
+                return
+            with lock:
+                claimed.append(job['id'])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == job_ids
+    assert all(db.get_job(job_id)['attempts'] == 1 for job_id in job_ids)
+
+
+def test_retry_until_max_attempts():
+    """שגיאה זמנית - חוזרת לתור עד max_attempts ואז נכשלת; קבצי הקלט נמחקים רק בסוף"""
+    db = setup_queue()
+    upload = tempfile.NamedTemporaryFile(delete=False).name
+    job_id = db.create_job('test_flaky', {'cleanup_paths': [upload]}, max_attempts=3)
+
+    job_queue._run_job(db, db.claim_next_job('test:1:0'))
+    assert db.get_job(job_id)['status'] == 'queued' and os.path.exists(upload)
+
+    run_until_settled(db)
+    job = db.get_job(job_id)
+
+    assert calls == [1, 2, 3]
+    assert (job['status'], job['attempts'], job['error']) == ('failed', 3, 'זמני')
+    assert not os.path.exists(upload)
+
+
+def test_invalid_input_not_retried():
+    """ValueError - נכשלת מיד, בלי ניסיון נוסף"""
+    db = setup_queue()
+    job_id = db.create_job('test_invalid', {}, max_attempts=3)
+
+    run_until_settled(db)
+
+    assert calls == [1]
+    assert db.get_job(job_id)['status'] == 'failed'
+
+
+def test_cancel_queued():
+    """משימה בתור מתבטלת מיד, לא נלקחת, וקבצי הקלט שלה נמחקים"""
+    db = setup_queue()
+    upload = tempfile.NamedTemporaryFile(delete=False).name
+    job_id = db.create_job('test_progress', {'cleanup_paths': [upload]})
+
+    assert job_queue.cancel_job(job_id) == 'cancelled'
+    assert db.claim_next_job('test:1:0') is None
+    assert not os.path.exists(upload)
+
+
+def test_cancel_running():
+    """משימה שרצה עוצרת בדיווח ההתקדמות הבא ומסומנת כמבוטלת"""
+    db = setup_queue()
+    job_id = db.create_job('test_progress', {})
+    job = db.claim_next_job('test:1:0')
+
+    assert job_queue.cancel_job(job_id) == 'running'
+    job_queue._run_job(db, job)
+
+    assert db.get_job(job_id)['status'] == 'cancelled'
+    assert db.get_job(job_id)['result'] is None
+
+
+def test_stale_requeue():
+    """משימה שהדופק שלה ישן חוזרת לתור, ומשימה שנגמרו לה הניסיונות נכשלת"""
+    db = setup_queue()
+    fresh = db.create_job('test_progress', {})
+    stale = db.create_job('test_progress', {})
+    exhausted = db.create_job('test_progress', {}, max_attempts=1)
+    for _ in range(3):
+        db.claim_next_job('other-host:1:0')
+    age_heartbeat(db, stale)
+    age_heartbeat(db, exhausted)
+
+    assert sorted(db.requeue_stale_jobs(job_queue.STALE_SECONDS)) == [stale, exhausted]
+    assert [db.get_job(job_id)['status'] for job_id in (fresh, stale, exhausted)] == ['running', 'queued', 'failed']
+
+
+def test_heartbeat_during_long_call():
+    """קריאה ארוכה בלי דיווח התקדמות - הדופק מתעדכן, כך שהמשימה לא חוזרת לתור באמצע"""
+    db = setup_queue()
+    original = job_queue.HEARTBEAT_SECONDS
+    job_queue.HEARTBEAT_SECONDS = 0.05
+    try:
+        job_id = db.create_job('test_slow', {})
+        run_until_settled(db)
+    finally:
+        job_queue.HEARTBEAT_SECONDS = original
+
+    job = db.get_job(job_id)
+    assert job['status'] == 'done' and job['result'] == {'requeued': []}
+
+
+def test_dead_worker_requeued_on_startup():
+    """משימה של תהליך שמת במחשב הזה חוזרת לתור מיד, בלי לחכות שהדופק יתיישן"""
+    db = setup_queue()
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    host = socket.gethostname()
+
+    crashed = db.create_job('test_progress', {})
+    db.claim_next_job(f'{host}:{dead.pid}:0')
+    alive = db.create_job('test_progress', {})
+    db.claim_next_job(f'{host}:{os.getppid()}:0')
+    remote = db.create_job('test_progress', {})
+    db.claim_next_job(f'other-host:{dead.pid}:0')
+
+    job_queue._recover()
+
+    assert [db.get_job(job_id)['status'] for job_id in (crashed, alive, remote)] == ['queued', 'running', 'running']
+
+
+def test_finished_jobs_cleanup():
+    """משימות ישנות שהסתיימו נמחקות יחד עם קובץ התוצאה והאירועים שלהן"""
+    db = setup_queue()
+    result_file = tempfile.NamedTemporaryFile(delete=False).name
+    old = db.create_job('test_progress', {})
+    recent = db.create_job('test_progress', {})
+    db.claim_next_job('test:1:0')
+    db.claim_next_job('test:1:0')
+    db.complete_job(old, {'file': result_file, 'download_name': 'x.pdf', 'mimetype': 'application/pdf'})
+    db.complete_job(recent, {'ok': True})
+    db.add_job_event(old, 'page_result', {})
+
+    conn = sqlite3.connect(db.db_name)
+    conn.execute("UPDATE jobs SET finished_at = datetime('now', '-30 days') WHERE id = ?", (old,))
+    conn.commit()
+    conn.close()
+
+    job_queue._recover()
+
+    assert db.get_job(old) is None and not os.path.exists(result_file)
+    assert db.get_job_events(old) == []
+    assert db.get_job(recent)['status'] == 'done'
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת תור משימות הרקע")
+    print("=" * 60)
+
+    test_concurrent_claims()
+    print("[V] לקיחה מקבילית")
+
+    test_retry_until_max_attempts()
+    print("[V] ניסיונות חוזרים")
+
+    test_invalid_input_not_retried()
+    print("[V] נתונים לא תקינים בלי ניסיון חוזר")
+
+    test_cancel_queued()
+    print("[V] ביטול משימה בתור")
+
+    test_cancel_running()
+    print("[V] ביטול משימה שרצה")
+
+    test_stale_requeue()
+    print("[V] החזרה לתור לפי דופק")
+
+    test_heartbeat_during_long_call()
+    print("[V] דופק בזמן קריאה ארוכה")
+
+    test_dead_worker_requeued_on_startup()
+    print("[V] שחזור משימות של תהליך שמת")
+
+    test_finished_jobs_cleanup()
+    print("[V] ניקוי משימות ישנות")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת חיתוך אזורים לפי מפת התבנית
+האזור נחתך לפי הקואורדינטות היחסיות, וה-QR שזוהה מתקן הזזה של הדף בסורק
+"""
+
+import cv2
+import numpy as np
+
+from services import ocr_engine
+from services.ocr_service import ExamOCRService
+
+LAYOUT = {
+    'template_key': 'test',
+    'version': 'A',
+    'page_size': [595.2756, 841.8898],
+    'regions': {
+        'qr': {'page': 0, 'x0': 0.6, 'y0': 0.05, 'x1': 0.8, 'y1': 0.15},
+        'grade': {'page': 0, 'x0': 0.1, 'y0': 0.8, 'x1': 0.9, 'y1': 0.85}
+    }
+}
+
+
+def scanner():
+    """סורק בלי טסרקט ובלי מסד נתונים - רק פונקציות החיתוך"""
+    return ExamOCRService.__new__(ExamOCRService)
+
+
+def page_with_mark(shift_x=0, shift_y=0, width=1000, height=1000):
+    """עמוד לבן עם סימן שחור באמצע אזור הציון, מוזז כמו דף שנסרק עקום"""
+    image = np.full((height, width), 255, dtype=np.uint8)
+    image[820 + shift_y:830 + shift_y, 495 + shift_x:505 + shift_x] = 0
+    return image
+
+
+def test_crop_without_anchor():
+    """בלי QR - חותכים בדיוק לפי המפה"""
+    crop = scanner().crop_layout_region(page_with_mark(), LAYOUT, 'grade')
+    assert crop.shape == (50, 800)
+    assert crop.min() == 0
+
+
+def test_crop_follows_qr_shift():
+    """דף שזז 40 פיקסלים ימינה ו-30 למטה - ה-QR שזוהה מזיז את החיתוך איתו"""
+    image = page_with_mark(shift_x=40, shift_y=30)
+    qr_rect = (600 + 40, 50 + 30, 200, 100)
+
+    crop = scanner().crop_layout_region(image, LAYOUT, 'grade', qr_rect=qr_rect)
+    assert crop.shape == (50, 800)
+    ys, xs = np.where(crop == 0)
+    assert (ys.min(), xs.min()) == (20, 395)
+
+
+def test_crop_clamped_to_page():
+    """הזזה גדולה לא חותכת מחוץ לתמונה"""
+    qr_rect = (600, 50 + 180, 200, 100)
+    crop = scanner().crop_layout_region(page_with_mark(), LAYOUT, 'grade', qr_rect=qr_rect)
+    assert crop.shape[0] == 1000 - 980
+
+
+def test_missing_region():
+    """אזור שלא קיים במפה או בעמוד אחר מה-QR - אין חיתוך"""
+    layout = {'regions': {'qr': LAYOUT['regions']['qr'],
+                          'grade': dict(LAYOUT['regions']['grade'], page=1)}}
+    assert scanner().crop_layout_region(page_with_mark(), layout, 'grade') is None
+    assert scanner().crop_layout_region(page_with_mark(), LAYOUT, 'bubbles') is None
+
+
+def test_crop_corrects_skew():
+    """דף שנסרק בהטיה של 3 מעלות סביב ה-QR - רק האזור מסובב, והסימן חוזר למקום שלו"""
+    qr_center = (700, 100)
+    skewed = cv2.warpAffine(page_with_mark(), cv2.getRotationMatrix2D(qr_center, 3, 1.0), (1000, 1000),
+                            borderValue=255)
+    qr_rect = (600, 50, 200, 100)
+
+    # בלי תיקון הסימן כבר לא במקום
+    plain = scanner().crop_layout_region(skewed, LAYOUT, 'grade', qr_rect=qr_rect)
+    ys, xs = np.where(plain < 128)
+    assert abs(xs.min() - 395) > 5 or abs(ys.min() - 20) > 5
+
+    crop = scanner().crop_layout_region(skewed, LAYOUT, 'grade', qr_rect=qr_rect, angle=-3)
+    assert crop.shape == (50, 800)
+    ys, xs = np.where(crop < 128)
+    assert abs(xs.min() - 395) <= 2 and abs(ys.min() - 20) <= 2
+
+
+def test_estimate_skew():
+    """הזווית מוערכת על תמונה מוקטנת; הטיה זניחה לא מסובבת את העמוד"""
+    page = np.full((3508, 2480), 255, dtype=np.uint8)
+    for line in range(30):
+        cv2.putText(page, "12345 67890 exam grade line", (150, 250 + line * 100), cv2.FONT_HERSHEY_SIMPLEX, 2, 0, 4)
+    skewed = cv2.warpAffine(page, cv2.getRotationMatrix2D((1240, 1754), 2.5, 1.0), (2480, 3508), borderValue=255)
+
+    assert abs(scanner().estimate_skew(skewed) + 2.5) <= 0.2
+    assert abs(scanner().estimate_skew(page)) < scanner().SKEW_THRESHOLD_DEG
+    assert scanner().deskew_image(page, angle=0.1) is page
+
+
+def test_layout_cache_refreshed():
+    """מבחן בלי מפה לא נשמר במטמון, ומפה שפורסמה מחדש נקראת בסריקה הבאה - גם בתהליך עבודה שחי הרבה זמן"""
+    layouts = {}
+    service = ExamOCRService(layout_lookup=lambda exam_id, version: layouts.get((exam_id, version)))
+    qr_data = {'exam_id': 5, 'version': 'A'}
+
+    assert service.get_layout(qr_data) is None
+    layouts[(5, 'A')] = LAYOUT
+    assert service.get_layout(qr_data) is LAYOUT
+
+    republished = dict(LAYOUT, template_key='new')
+    layouts[(5, 'A')] = republished
+    assert service.get_layout(qr_data) is LAYOUT
+
+    original = ocr_engine._service, ocr_engine._scan_id
+    ocr_engine._service = service
+    try:
+        ocr_engine._begin_scan(1)
+        assert service.get_layout(qr_data) is republished
+        # עמוד נוסף מאותה סריקה - המטמון נשאר
+        layouts[(5, 'A')] = LAYOUT
+        ocr_engine._begin_scan(1)
+        assert service.get_layout(qr_data) is republished
+    finally:
+        ocr_engine._service, ocr_engine._scan_id = original
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת חיתוך אזורים לפי מפת התבנית")
+    print("=" * 60)
+
+    test_crop_without_anchor()
+    print("[V] חיתוך לפי המפה")
+
+    test_crop_follows_qr_shift()
+    print("[V] החיתוך עוקב אחרי הזזת ה-QR")
+
+    test_crop_clamped_to_page()
+    print("[V] החיתוך נשאר בתוך העמוד")
+
+    test_missing_region()
+    print("[V] אזור חסר - אין חיתוך")
+
+    test_crop_corrects_skew()
+    print("[V] תיקון הטיה רק באזור שנחתך")
+
+    test_estimate_skew()
+    print("[V] הערכת הטיה על תמונה מוקטנת")
+
+    test_layout_cache_refreshed()
+    print("[V] מטמון מפות האזורים מתרענן בכל סריקה")
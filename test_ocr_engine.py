@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת מאגר תהליכי ה-OCR
+מספר העמודים בזיכרון המשותף מוגבל, כל בלוק משוחרר - גם כשתהליך עבודה קורס - ומאגר שבור נבנה מחדש
+"""
+
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from services import ocr_engine
+from services.ocr_service import ExamOCRService
+
+PROCESSES = 2
+PAGES = 10
+
+
+def _slow_page(shm_name, shape, pdf_path, page_num, page_dpi, scan_id=None):
+    """במקום _process_shared_page - קורא את התמונה מהזיכרון המשותף ומחכה, כדי שעמודים יצטברו"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        ink = int(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf).min())
+    finally:
+        shm.close()
+    time.sleep(0.1)
+    return {'page_number': page_num + 1, 'ink': ink, 'errors': []}
+
+
+def _crashing_page(shm_name, shape, pdf_path, page_num, page_dpi, scan_id=None):
+    """תהליך העבודה מת באמצע העמוד השלישי - כמו קריסה של Tesseract"""
+    if page_num == 2:
+        os._exit(1)
+    return _slow_page(shm_name, shape, pdf_path, page_num, page_dpi)
+
+
+def make_pdf(pages=PAGES):
+    """PDF קטן עם ריבוע שחור בכל עמוד"""
+    path = os.path.join(tempfile.mkdtemp(), 'scan.pdf')
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=72, height=72)
+        page.draw_rect(fitz.Rect(20, 20, 50, 50), fill=(0, 0, 0))
+    doc.save(path)
+    doc.close()
+    return path
+
+
+class BlockTracker:
+    """עוקב אחרי בלוקי הזיכרון המשותף שהמנוע יוצר ומשחרר"""
+
+    def __init__(self, engine):
+        self.names = []
+        self.live = 0
+        self.max_live = 0
+        self.lock = threading.Lock()
+        render = engine._render_to_shared_memory
+        release = engine._release_page
+
+        def tracked_render(doc, page_num):
+            shm, shape = render(doc, page_num)
+            with self.lock:
+                self.names.append(shm.name)
+                self.live += 1
+                self.max_live = max(self.max_live, self.live)
+            return shm, shape
+
+        def tracked_release(shm, in_flight, future):
+            with self.lock:
+                self.live -= 1
+            release(shm, in_flight, future)
+
+        engine._render_to_shared_memory = tracked_render
+        engine._release_page = tracked_release
+
+    def leaked(self):
+        """בלוקים שעדיין קיימים במערכת"""
+        leaked = []
+        for name in self.names:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                continue
+            shm.close()
+            leaked.append(name)
+        return leaked
+
+
+def run_engine(worker_function):
+    """סריקת PDF במנוע אמיתי, כשתהליכי העבודה מריצים את worker_function במקום ה-OCR"""
+    original = ocr_engine._process_shared_page
+    ocr_engine._process_shared_page = worker_function
+    engine = ocr_engine.OCRProcessEngine(PROCESSES)
+    tracker = BlockTracker(engine)
+    try:
+        results = engine.process_pdf_pages(make_pdf())
+    except BrokenProcessPool:
+        # הקריסה התגלתה בשליחת העמוד הבא - הסריקה כולה נכשלת ותנוסה שוב על מאגר חדש
+        results = None
+    finally:
+        ocr_engine._process_shared_page = original
+        engine.shutdown()
+    return engine, tracker, results
+
+
+def test_in_flight_bound_and_unlink():
+    """לכל היותר processes + PAGE_QUEUE_SIZE עמודים בזיכרון, וכל הבלוקים נמחקים בסוף"""
+    engine, tracker, results = run_engine(_slow_page)
+
+    assert [r['page_number'] for r in results] == list(range(1, PAGES + 1))
+    assert all(r['ink'] == 0 for r in results)
+    assert len(tracker.names) == PAGES
+    assert 1 < tracker.max_live <= PROCESSES + ExamOCRService.PAGE_QUEUE_SIZE
+    assert tracker.live == 0 and tracker.leaked() == []
+    assert not engine.broken
+
+
+def test_worker_crash_releases_blocks():
+    """תהליך עבודה שקרס - הבלוקים של כל העמודים שבדרך נמחקים והמנוע מסומן כשבור"""
+    engine, tracker, results = run_engine(_crashing_page)
+
+    if results is not None:
+        assert [r['page_number'] for r in results] == list(range(1, PAGES + 1))
+        assert any('OCR worker crashed' in ' '.join(r['errors']) for r in results)
+    assert tracker.live == 0 and tracker.leaked() == []
+    assert engine.broken
+
+
+def test_broken_engine_rebuilt():
+    """get_engine מחליף מאגר שסומן כשבור במאגר חדש, ומחזיר את אותו מאגר כל עוד הוא תקין"""
+    original = ocr_engine.OCR_PROCESSES, ocr_engine._engine
+    ocr_engine.OCR_PROCESSES = PROCESSES
+    ocr_engine._engine = None
+    try:
+        first = ocr_engine.get_engine()
+        assert ocr_engine.get_engine() is first
+
+        first.broken = True
+        second = ocr_engine.get_engine()
+        assert second is not first and not second.broken
+        assert first._executor._shutdown_thread
+        second.shutdown()
+    finally:
+        ocr_engine.OCR_PROCESSES, ocr_engine._engine = original
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת מאגר תהליכי ה-OCR")
+    print("=" * 60)
+
+    test_in_flight_bound_and_unlink()
+    print("[V] הגבלת עמודים בזיכרון ושחרור בלוקים")
+
+    test_worker_crash_releases_blocks()
+    print("[V] שחרור בלוקים אחרי קריסת תהליך")
+
+    test_broken_engine_rebuilt()
+    print("[V] בנייה מחדש של מאגר שבור")
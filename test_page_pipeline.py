@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת צינור העמודים של סריקת PDF
+עמוד מומר לתמונה רק כשיש לו מקום, כך שמספר העמודים בזיכרון מוגבל - ועמוד שלא הומר לא מפיל את הסריקה
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+import fitz  # PyMuPDF
+
+from services import ocr_service
+from services.ocr_service import ExamOCRService
+
+PAGES = 12
+MAX_WORKERS = 2
+
+
+def make_pdf(pages=PAGES):
+    """PDF סרוק קטן - עמוד ריק לכל עמוד"""
+    path = os.path.join(tempfile.mkdtemp(), 'scan.pdf')
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page(width=72, height=72)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+class PageTracker:
+    """סופר עמודים שהומרו לתמונה ועוד לא סיימו את העיבוד"""
+
+    def __init__(self, service, fail_page=None):
+        self.live = 0
+        self.max_live = 0
+        self.lock = threading.Lock()
+        render = service._render_pdf_page
+
+        def tracked_render(doc, page_num, dpi, render_lock):
+            if page_num == fail_page:
+                raise RuntimeError('cannot render')
+            img = render(doc, page_num, dpi, render_lock)
+            with self.lock:
+                self.live += 1
+                self.max_live = max(self.max_live, self.live)
+            return img
+
+        def slow_page(img, dpi=None, render_page=None):
+            # עיבוד איטי - כדי שעמודים יצטברו מאחוריו אם אין הגבלה
+            time.sleep(0.05)
+            with self.lock:
+                self.live -= 1
+            return {'qr_data': None, 'grade': None, 'errors': []}
+
+        service._render_pdf_page = tracked_render
+        service.process_single_page = slow_page
+
+
+def test_pages_in_memory_bounded():
+    """לכל היותר max_workers + PAGE_QUEUE_SIZE עמודים בזיכרון, גם כשהמאגר גדול יותר והעיבוד איטי"""
+    service = ExamOCRService()
+    tracker = PageTracker(service)
+
+    results = service._process_pdf_pages(make_pdf(), MAX_WORKERS)
+
+    assert [r['page_number'] for r in results] == list(range(1, PAGES + 1))
+    assert all(r['errors'] == [] for r in results)
+    assert ocr_service.PAGE_THREADS > MAX_WORKERS
+    assert MAX_WORKERS < tracker.max_live <= MAX_WORKERS + ExamOCRService.PAGE_QUEUE_SIZE
+    assert tracker.live == 0
+
+
+def test_render_failure_is_page_error():
+    """עמוד שלא הומר לתמונה - תוצאת שגיאה לעמוד הזה, ושאר העמודים נסרקים כרגיל"""
+    service = ExamOCRService()
+    tracker = PageTracker(service, fail_page=3)
+
+    results = service._process_pdf_pages(make_pdf(), MAX_WORKERS)
+
+    assert [r['page_number'] for r in results] == list(range(1, PAGES + 1))
+    failed = results[3]
+    assert failed['qr_data'] is None and len(failed['errors']) == 1
+    assert failed['errors'][0].startswith('Page rendering failed: cannot render')
+    assert all(r['errors'] == [] for r in results if r is not failed)
+    assert tracker.live == 0
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת צינור העמודים של סריקת PDF")
+    print("=" * 60)
+
+    test_pages_in_memory_bounded()
+    print("[V] הגבלת עמודים בזיכרון")
+
+    test_render_failure_is_page_error()
+    print("[V] שגיאה לעמוד שלא הומר")
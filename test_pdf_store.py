@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת מאגר ה-PDFs שנוצרו מראש
+המפתח של כל קובץ נגזר מהתוכן - כל שינוי במבחן, בשאלות, בתלמיד או בעיצוב נותן קובץ חדש
+"""
+
+import copy
+
+from services import pdf_store
+
+EXAM = {'id': 7, 'title': 'מבחן', 'subject': 'גמרא', 'description': ''}
+QUESTIONS = [{'question_number': 1, 'question_text': 'שאלה', 'points': 100, 'question_type': 'essay'}]
+STUDENT = {'id': 3, 'name': 'כהן ראובן', 'id_number': '123456789', 'version': 'A', 'student_exam_id': 12}
+
+
+def key_with(exam=None, questions=None, student=None):
+    """מפתח אחרי שינוי - על עותקים, כדי שהקבועים לא ישתנו בין הבדיקות"""
+    exam_data, question_list, student_data = copy.deepcopy((EXAM, QUESTIONS, STUDENT))
+    if exam:
+        exam_data.update(exam)
+    if questions:
+        question_list[0].update(questions)
+    if student:
+        student_data.update(student)
+    return pdf_store.pdf_key(exam_data, question_list, student_data)
+
+
+def test_key_stable():
+    """אותו תוכן - אותו מפתח, גם בסדר מפתחות אחר ועם שדות תלמיד שלא מודפסים"""
+    reordered = dict(reversed(list(STUDENT.items())), last_login='2026-01-01')
+
+    assert pdf_store.pdf_key(EXAM, QUESTIONS, STUDENT) == pdf_store.pdf_key(EXAM, QUESTIONS, reordered)
+
+
+def test_key_changes_with_content():
+    """שינוי במבחן, בשאלה או בכל אחד מפרטי התלמיד שמודפסים - מפתח חדש"""
+    base = key_with()
+    changed = [
+        key_with(exam={'title': 'מבחן אחר'}),
+        key_with(questions={'points': 50}),
+        key_with(questions={'question_text': 'שאלה אחרת'}),
+        key_with(student={'name': 'לוי שמעון'}),
+        key_with(student={'id_number': '987654321'}),
+        key_with(student={'version': 'B'}),
+        key_with(student={'student_exam_id': 13}),
+    ]
+
+    assert base not in changed
+    assert len(set(changed)) == len(changed)
+
+
+def test_key_changes_with_render_version():
+    """העלאת RENDER_VERSION מוציאה את כל הקבצים הישנים מהמטמון"""
+    base = key_with()
+    original = pdf_store.RENDER_VERSION
+    pdf_store.RENDER_VERSION = original + 1
+    try:
+        assert key_with() != base
+    finally:
+        pdf_store.RENDER_VERSION = original
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת מאגר ה-PDFs")
+    print("=" * 60)
+
+    test_key_stable()
+    print("[V] מפתח יציב")
+
+    test_key_changes_with_content()
+    print("[V] מפתח משתנה עם התוכן")
+
+    test_key_changes_with_render_version()
+    print("[V] מפתח משתנה עם RENDER_VERSION")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת זיהוי QR ברזולוציה מדורגת
+מתחילים ב-DPI נמוך, עולים רק כשצריך, ורזולוציית ההתחלה מסתגלת לסורק
+"""
+
+import numpy as np
+
+from services import ocr_service
+from services.ocr_service import ExamOCRService, QRResolutionStats, QR_DPI_LADDER
+
+
+class FakeScanner(ExamOCRService):
+    """סורק שה-QR שלו נקרא רק מרוחב תמונה מסוים - בלי pyzbar אמיתי"""
+
+    def __init__(self, min_width):
+        self.min_width = min_width
+        self.attempted_widths = []
+
+    def read_qr_code(self, image, with_rect=False):
+        width = image.shape[1]
+        self.attempted_widths.append(width)
+        qr_data = {'student_id': 1, 'exam_id': 2} if width >= self.min_width else None
+        return (qr_data, None) if with_rect else qr_data
+
+
+def page_at(dpi):
+    """עמוד A4 ריק ברזולוציה נתונה"""
+    return np.zeros((int(11.69 * dpi), int(8.27 * dpi), 3), dtype=np.uint8)
+
+
+def run_page(scanner, min_dpi, page_dpi=300):
+    """עמוד אחד - מחזיר את ה-DPI שבו זוהה ואת רשימת ה-DPI שהומרו מחדש מה-PDF"""
+    rendered = []
+
+    def render_page(dpi):
+        rendered.append(dpi)
+        return page_at(dpi)
+
+    scanner.min_width = int(8.27 * min_dpi)
+    _, dpi, _ = scanner.read_qr_code_adaptive(page_at(page_dpi), page_dpi, render_page)
+    return dpi, rendered
+
+
+def test_escalates_only_when_needed():
+    """QR שנקרא ב-150 לא גורם להמרה נוספת; QR קטן עולה בסולם עד שמזוהה"""
+    ocr_service.qr_resolution_stats = QRResolutionStats()
+    scanner = FakeScanner(0)
+
+    dpi, rendered = run_page(scanner, 150)
+    assert dpi == 150
+    assert rendered == []
+
+    dpi, rendered = run_page(scanner, 450)
+    assert dpi == 450
+    assert rendered == [450]
+
+
+def test_start_dpi_adapts_to_scanner():
+    """סורק שתמיד צריך 300 DPI - אחרי כמה עמודים מתחילים ישר מ-300"""
+    stats = QRResolutionStats(probe_every=1000)
+    ocr_service.qr_resolution_stats = stats
+    scanner = FakeScanner(0)
+
+    for _ in range(5):
+        run_page(scanner, 300)
+
+    scanner.attempted_widths = []
+    dpi, _ = run_page(scanner, 300)
+    assert dpi == 300
+    assert len(scanner.attempted_widths) == 1
+    assert stats.summary()['successes_by_dpi'][300] == 6
+
+
+def test_periodic_probe_starts_low():
+    """כל probe_every עמודים מתחילים שוב מהרזולוציה הנמוכה - למקרה שהסורק השתפר"""
+    stats = QRResolutionStats(probe_every=3)
+    for _ in range(10):
+        stats.record(450)
+
+    starts = [QR_DPI_LADDER[stats.start_index()] for _ in range(6)]
+    assert starts == [450, 450, 150, 450, 450, 150]
+
+
+def test_failure_recorded():
+    """עמוד בלי QR עובר את כל הסולם ונרשם ככשלון"""
+    ocr_service.qr_resolution_stats = QRResolutionStats()
+    scanner = FakeScanner(0)
+
+    dpi, rendered = run_page(scanner, 10000)
+    assert dpi is None
+    assert rendered == [450, 720]
+    assert ocr_service.qr_resolution_stats.summary()['failures'] == 1
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת זיהוי QR ברזולוציה מדורגת")
+    print("=" * 60)
+
+    test_escalates_only_when_needed()
+    print("[V] עולים ברזולוציה רק כשה-QR לא זוהה")
+
+    test_start_dpi_adapts_to_scanner()
+    print("[V] רזולוציית ההתחלה מסתגלת לסורק")
+
+    test_periodic_probe_starts_low()
+    print("[V] בדיקה תקופתית מהרזולוציה הנמוכה")
+
+    test_failure_recorded()
+    print("[V] כשלון נרשם")
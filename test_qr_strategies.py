@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת מפל שיטות זיהוי ה-QR
+עיבוד מקדים מחושב רק כשמגיעים אליו, והשיטות מסודרות לפי ההצלחה שנמדדה
+"""
+
+import numpy as np
+
+from services import ocr_service
+from services.ocr_service import ExamOCRService, QRStrategyStats
+
+
+class FakeCode:
+    data = b'{"student_id": 1, "exam_id": 2}'
+    type = 'QRCODE'
+    quality = 1
+
+    class rect:
+        left, top, width, height = 10, 10, 50, 50
+
+
+class FakeScanner(ExamOCRService):
+    """סורק שמזהה קוד רק בשיטה אחת - בלי pyzbar אמיתי"""
+
+    def __init__(self, working_strategy):
+        self.working_strategy = working_strategy
+        self.computed = []
+
+    def preprocess_for_qr(self, image, method, cache):
+        self._method = method
+        if method not in cache:
+            self.computed.append(method)
+        return super().preprocess_for_qr(image, method, cache)
+
+    def _decode_codes(self, decoder, image):
+        return [FakeCode()] if f"{decoder}:{self._method}" == self.working_strategy else []
+
+
+class FakeStore:
+    """מסד נתונים בזיכרון עם אותו ממשק כמו ExamDatabase"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def add_qr_strategy_stats(self, deltas):
+        for strategy, delta in deltas.items():
+            row = self.rows.setdefault(strategy, {'attempts': 0, 'hits': 0, 'total_ms': 0.0})
+            for key in row:
+                row[key] += delta[key]
+
+    def get_qr_strategy_stats(self):
+        return {strategy: dict(row) for strategy, row in self.rows.items()}
+
+
+def page():
+    return np.full((200, 200, 3), 255, dtype=np.uint8)
+
+
+def test_stops_at_first_success():
+    """הצלחה בתמונה המקורית - אף עיבוד מקדים לא מחושב"""
+    ocr_service.qr_strategy_stats = QRStrategyStats(store=None)
+    scanner = FakeScanner('pyzbar:original')
+
+    assert scanner.read_qr_code(page()) == {'student_id': 1, 'exam_id': 2}
+    assert scanner.computed == ['original']
+
+
+def test_variants_computed_lazily():
+    """הצלחה ב-otsu - מחושבים רק העיבודים שלפניו, לא כולם מראש"""
+    ocr_service.qr_strategy_stats = QRStrategyStats(store=None)
+    scanner = FakeScanner('pyzbar:otsu')
+
+    scanner.read_qr_code(page())
+    assert scanner.computed == ['original', 'adaptive_threshold', 'otsu']
+
+
+def test_order_follows_success():
+    """שיטה שמצליחה בסורק הזה עולה לראש הסדר"""
+    stats = QRStrategyStats(store=None)
+    for _ in range(10):
+        stats.record('pyzbar:original', False, 30.0)
+        stats.record('pyzbar:clahe', True, 40.0)
+
+    assert stats.order()[0] == 'pyzbar:clahe'
+    summary = stats.summary()
+    assert summary['strategies']['pyzbar:clahe']['hit_rate'] == 1.0
+    assert summary['strategies']['pyzbar:original']['mean_ms'] == 30.0
+
+
+def test_stats_persisted():
+    """המונים נכתבים למסד הנתונים ונטענים בתהליך חדש"""
+    store = FakeStore()
+    stats = QRStrategyStats(flush_every=5, store=lambda: store)
+    stats.order()
+    for _ in range(5):
+        stats.record('pyzbar:otsu', True, 10.0)
+    assert store.rows['pyzbar:otsu']['hits'] == 5
+
+    restarted = QRStrategyStats(store=lambda: store)
+    assert restarted.order()[0] == 'pyzbar:otsu'
+
+
+def test_store_injected():
+    """בלי חיבור מפורש המונים לא נכתבים לשום מסד נתונים; set_store מחבר וטוען את מה שכבר נשמר"""
+    stats = QRStrategyStats(flush_every=1)
+    stats.record('pyzbar:otsu', True, 10.0)
+    stats.flush()
+    assert stats._store is None
+
+    store = FakeStore()
+    store.add_qr_strategy_stats({'pyzbar:clahe': {'attempts': 10, 'hits': 10, 'total_ms': 100.0}})
+    stats.set_store(lambda: store)
+    assert stats.order()[0] == 'pyzbar:clahe'
+
+    stats.record('pyzbar:clahe', True, 10.0)
+    assert store.rows['pyzbar:clahe']['attempts'] == 11
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת מפל שיטות זיהוי ה-QR")
+    print("=" * 60)
+
+    test_stops_at_first_success()
+    print("[V] עצירה בהצלחה הראשונה")
+
+    test_variants_computed_lazily()
+    print("[V] עיבוד מקדים מחושב רק כשצריך")
+
+    test_order_follows_success()
+    print("[V] הסדר לפי ההצלחה שנמדדה")
+
+    test_stats_persisted()
+    print("[V] המונים נשמרים")
+
+    test_store_injected()
+    print("[V] מסד הנתונים מחובר רק במפורש")
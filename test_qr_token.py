@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת הטוקן המספרי ב-QR
+QR קטן עם מזהה ההקצאה וספרות ביקורת, שהסורק משלים מבסיס הנתונים - והפורמטים הישנים עדיין נקראים
+"""
+
+import io
+import os
+import tempfile
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from reportlab.lib.units import cm
+from reportlab.pdfgen.canvas import Canvas
+
+from services.database import ExamDatabase
+from services.ocr_service import ExamOCRService
+from services.pdf_generator import ExamPDFGenerator, VectorQRCode
+from services.qr_token import encode_token, decode_token
+
+
+def setup_assignment():
+    """מבחן שהוקצה לתלמיד אחד"""
+    db = ExamDatabase(os.path.join(tempfile.mkdtemp(), 'token.db'))
+    student_id = db.add_student({'first_name': 'ראובן', 'last_name': 'בדיקה'})
+    exam_id = db.create_exam({'title': 'מבחן', 'subject': 'גמרא', 'total_points': 100}, [])
+    (student_exam_id,) = db.assign_exam_to_students(exam_id, [student_id], '2026-01-01', 'B')
+    return db, student_id, exam_id, student_exam_id
+
+
+def test_round_trip_and_check_digits():
+    """פענוח מחזיר את המזהה, וכל טעות בספרה אחת או החלפת ספרות סמוכות נדחית"""
+    for student_exam_id in (1, 42, 98765):
+        token = encode_token(student_exam_id)
+        assert token.isdigit() and decode_token(token) == student_exam_id
+
+        for i in range(len(token)):
+            for digit in '0123456789':
+                if digit != token[i]:
+                    assert decode_token(token[:i] + digit + token[i + 1:]) is None
+        for i in range(len(token) - 1):
+            swapped = token[:i] + token[i + 1] + token[i] + token[i + 2:]
+            if swapped != token:
+                assert decode_token(swapped) is None
+
+
+def test_small_qr():
+    """הטוקן נכנס ב-QR גרסה 1 (21x21) גם עם תיקון שגיאות H - ה-JSON הישן דרש גרסה גבוהה בהרבה"""
+    qr = VectorQRCode(encode_token(123456), 100, 100, border=0)
+    assert len(qr.matrix) == 21
+
+
+def test_vector_qr_at_72_dpi():
+    """ה-QR הווקטורי בגודל שבכותרת - בלי תמונה מוטמעת, ונקרא גם מסריקה ב-72 DPI (גם ה-JSON הישן והגדול)"""
+    generator = ExamPDFGenerator()
+    payloads = [
+        (encode_token(123456), {'student_exam_id': 123456}),
+        ({'student_id': 3, 'exam_id': 7, 'student_name': 'כהן ראובן', 'exam_title': 'מבחן', 'date': '2026-01-01'},
+         {'student_id': 3, 'exam_id': 7, 'date': '2026-01-01', 'student_name': 'כהן ראובן',
+          'exam_title': 'מבחן', 'version': 'A'}),
+    ]
+
+    for data, expected in payloads:
+        qr = generator.generate_barcode(data, width=generator.qr_size, height=generator.qr_size)
+        buffer = io.BytesIO()
+        canvas = Canvas(buffer, pagesize=(6 * cm, 6 * cm))
+        qr.drawOn(canvas, cm, cm)
+        canvas.save()
+
+        with fitz.open(stream=buffer.getvalue(), filetype='pdf') as doc:
+            assert doc[0].get_images() == []
+            pix = doc[0].get_pixmap(dpi=72, colorspace=fitz.csGRAY)
+            image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+
+        # עמוד עם QR בלבד - כמה KB, לא עשרות כמו PNG מוטמע
+        assert len(buffer.getvalue()) < 10 * 1024
+        assert ExamOCRService().read_qr_code(image) == expected
+
+
+def test_scan_resolves_from_database():
+    """PDF של תלמיד שהוקצה לו מבחן - ה-QR מכיל טוקן, והסורק משלים את הפרטים מבסיס הנתונים"""
+    db, student_id, exam_id, student_exam_id = setup_assignment()
+
+    pdf_bytes = ExamPDFGenerator().create_exam_pdf(
+        {'id': exam_id, 'title': 'מבחן', 'subject': 'גמרא'}, [],
+        {'id': student_id, 'name': 'בדיקה ראובן', 'student_exam_id': student_exam_id}
+    )
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+        pix = doc[0].get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+        image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+
+    ocr = ExamOCRService(qr_lookup=db.get_student_exam_identity)
+    qr_data = ocr.read_qr_code(image)
+
+    assert qr_data == {'student_exam_id': student_exam_id, 'student_id': student_id,
+                       'exam_id': exam_id, 'version': 'B', 'date': '2026-01-01'}
+
+
+def test_reassignment_keeps_id():
+    """הקצאה חוזרת לא מחליפה את המזהה - QR שכבר הודפס ממשיך להיות תקף"""
+    db, student_id, exam_id, student_exam_id = setup_assignment()
+    assert db.assign_exam_to_students(exam_id, [student_id], '2026-02-01') == [student_exam_id]
+    assert db.get_student_exam_identity(student_exam_id)['date'] == '2026-02-01'
+
+
+def test_old_formats():
+    """JSON ו-StudentID-ExamID-Date ממבחנים שהודפסו לפני הטוקן"""
+    ocr = ExamOCRService()
+    assert ocr._parse_code_data('{"student_id": 3, "exam_id": 7, "version": "A"}') == \
+        {'student_id': 3, 'exam_id': 7, 'version': 'A'}
+    assert ocr._parse_code_data('3-7-20260101') == {'student_id': 3, 'exam_id': 7, 'date': '2026-01-01'}
+
+    # טוקן בלי בסיס נתונים - רק המזהה, בלי student_id שאפשר לשמור לפיו
+    assert ocr._parse_code_data(encode_token(5)) == {'student_exam_id': 5}
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת הטוקן המספרי ב-QR")
+    print("=" * 60)
+
+    test_round_trip_and_check_digits()
+    print("[V] ספרות ביקורת")
+
+    test_small_qr()
+    print("[V] QR בגרסה 1")
+
+    test_vector_qr_at_72_dpi()
+    print("[V] QR וקטורי נקרא ב-72 DPI")
+
+    test_scan_resolves_from_database()
+    print("[V] הסורק משלים מבסיס הנתונים")
+
+    test_reassignment_keeps_id()
+    print("[V] הקצאה חוזרת שומרת על המזהה")
+
+    test_old_formats()
+    print("[V] פורמטים ישנים")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת מטמון תוצאות הסריקה
+העלאה חוזרת של אותו קובץ לא נסרקת שוב, ואחרי תיקון עמוד אחד נסרק רק העמוד הזה
+"""
+
+import os
+import tempfile
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from services.database import ExamDatabase
+from services.ocr_service import ExamOCRService
+
+
+class CountingScanner(ExamOCRService):
+    """סורק שמתעד אילו עמודים נשלחו ל-OCR ומחזיר תוצאה מזויפת - בלי טסרקט"""
+
+    def __init__(self, result_cache, after_read=None, **kwargs):
+        super().__init__(result_cache=result_cache, **kwargs)
+        self.scanned_pages = []
+        self.after_read = after_read
+
+    def _process_pdf_pages(self, pdf_path, max_workers, page_numbers=None, on_result=None):
+        self.scanned_pages += list(page_numbers)
+        results = []
+        for page_num in page_numbers:
+            # עם qr_lookup - טוקן מספרי (מזהה ההקצאה = מספר העמוד), כמו ב-QR החדש
+            qr_data = self._resolve_token(page_num + 1) if self.qr_lookup else {'student_id': page_num + 1, 'exam_id': 5}
+            results.append({
+                'page_number': page_num + 1,
+                'qr_data': qr_data,
+                'grade': {'score': 90, 'total': 100, 'confidence': 0.9},
+                'ocr_text': '90/100',
+                'confidence': 0.9,
+                'errors': [],
+                # כמו process_single_page - המפה שלפיה העמוד נקרא
+                'layout_key': self.layout_hash(self.get_layout(qr_data))
+            })
+        if self.after_read:
+            self.after_read()
+        return results
+
+
+def scanned_pdf(path, seeds):
+    """PDF שכל עמוד בו הוא תמונה (כמו מסורק) - seed שונה = עמוד שנסרק מחדש"""
+    doc = fitz.open()
+    for seed in seeds:
+        pixels = np.random.default_rng(seed).integers(0, 255, (200, 140, 3), dtype=np.uint8)
+        pix = fitz.Pixmap(fitz.csRGB, 140, 200, pixels.tobytes(), False)
+        page = doc.new_page()
+        page.insert_image(page.rect, pixmap=pix)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def database():
+    return ExamDatabase(os.path.join(tempfile.mkdtemp(), 'cache.db'))
+
+
+def test_same_file_not_rescanned():
+    """אותו קובץ פעמיים - בפעם השנייה אף עמוד לא נסרק, והתוצאות זהות"""
+    db = database()
+    path = scanned_pdf(os.path.join(tempfile.mkdtemp(), 'a.pdf'), [1, 2, 3])
+
+    first = CountingScanner(db).process_pdf(path)
+
+    scanner = CountingScanner(db)
+    second = scanner.process_pdf(path)
+
+    assert scanner.scanned_pages == []
+    assert all(r['cached'] for r in second)
+    assert [r['qr_data'] for r in second] == [r['qr_data'] for r in first]
+
+
+def test_only_changed_page_rescanned():
+    """קובץ חדש שבו רק העמוד השני הוחלף - רק הוא נסרק, והשאר במקומם מהמטמון"""
+    db = database()
+    directory = tempfile.mkdtemp()
+    CountingScanner(db).process_pdf(scanned_pdf(os.path.join(directory, 'a.pdf'), [1, 2, 3]))
+
+    scanner = CountingScanner(db)
+    results = scanner.process_pdf(scanned_pdf(os.path.join(directory, 'b.pdf'), [1, 99, 3]))
+
+    assert scanner.scanned_pages == [1]
+    assert [r['page_number'] for r in results] == [1, 2, 3]
+    assert [bool(r.get('cached')) for r in results] == [True, False, True]
+
+
+def test_layout_change_rescans():
+    """תבנית שפורסמה מחדש (מפת אזורים אחרת) - התוצאות מהמטמון נקראו לפי המפה הישנה ונסרקות שוב"""
+    db = database()
+    path = scanned_pdf(os.path.join(tempfile.mkdtemp(), 'a.pdf'), [1, 2])
+    layouts = {(5, 'A'): {'template_key': 'old', 'regions': {'grade': {'page': 0, 'y0': 0.2}}}}
+    layout_lookup = lambda exam_id, version: layouts.get((exam_id, version))
+
+    CountingScanner(db, layout_lookup=layout_lookup).process_pdf(path)
+    same = CountingScanner(db, layout_lookup=layout_lookup)
+    same.process_pdf(path)
+    assert same.scanned_pages == []
+
+    layouts[(5, 'A')] = {'template_key': 'new', 'regions': {'grade': {'page': 0, 'y0': 0.3}}}
+    changed = CountingScanner(db, layout_lookup=layout_lookup)
+    results = changed.process_pdf(path)
+
+    assert changed.scanned_pages == [0, 1]
+    assert not any(r.get('cached') for r in results)
+    assert all('layout_key' not in r for r in results)
+
+
+def test_layout_published_during_scan():
+    """מפה שפורסמה אחרי שהעמוד נקרא - התוצאה נשמרת עם המפה שלפיה נקראה, ונסרקת שוב בהעלאה הבאה"""
+    db = database()
+    path = scanned_pdf(os.path.join(tempfile.mkdtemp(), 'a.pdf'), [1])
+    layouts = {}
+    layout_lookup = lambda exam_id, version: layouts.get((exam_id, version))
+
+    def publish():
+        layouts[(5, 'A')] = {'regions': {'grade': {'y0': 0.2}}}
+
+    CountingScanner(db, after_read=publish, layout_lookup=layout_lookup).process_pdf(path)
+    scanner = CountingScanner(db, layout_lookup=layout_lookup)
+    scanner.process_pdf(path)
+
+    assert scanner.scanned_pages == [0]
+
+
+def test_identity_resolved_after_lookup():
+    """פרטי התלמיד של טוקן נקראים מחדש בכל שליפה; הקצאה שעברה לגרסה עם תבנית אחרת - נסרקת שוב"""
+    db = database()
+    path = scanned_pdf(os.path.join(tempfile.mkdtemp(), 'a.pdf'), [1])
+    assignments = {1: {'student_exam_id': 1, 'student_id': 11, 'exam_id': 5, 'version': 'A'}}
+    layouts = {(5, 'A'): {'regions': {'grade': {'y0': 0.2}}}, (5, 'B'): {'regions': {'grade': {'y0': 0.6}}}}
+    lookups = {'qr_lookup': assignments.get, 'layout_lookup': lambda exam_id, version: layouts.get((exam_id, version))}
+
+    CountingScanner(db, **lookups).process_pdf(path)
+
+    # ההקצאה הועברה לתלמיד אחר - אותה תבנית, התוצאה מהמטמון עם פרטי התלמיד העדכניים
+    assignments[1] = dict(assignments[1], student_id=12)
+    scanner = CountingScanner(db, **lookups)
+    results = scanner.process_pdf(path)
+    assert scanner.scanned_pages == []
+    assert results[0]['cached'] and results[0]['qr_data']['student_id'] == 12
+
+    # ההקצאה עברה לגרסה B - הציון נקרא לפי האזורים של A, אז העמוד נסרק מחדש
+    assignments[1] = dict(assignments[1], version='B')
+    scanner = CountingScanner(db, **lookups)
+    results = scanner.process_pdf(path)
+    assert scanner.scanned_pages == [0]
+    assert results[0]['qr_data']['version'] == 'B'
+
+
+def test_expired_entries_ignored():
+    """תוצאה שפג תוקפה לא נשלפת"""
+    db = database()
+    db.put_scan_cache({'page:x': {'errors': []}}, max_age_hours=1)
+
+    assert 'page:x' in db.get_scan_cache(['page:x'], max_age_hours=1)
+    assert db.get_scan_cache(['page:x'], max_age_hours=0) == {}
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת מטמון תוצאות הסריקה")
+    print("=" * 60)
+
+    test_same_file_not_rescanned()
+    print("[V] אותו קובץ לא נסרק שוב")
+
+    test_only_changed_page_rescanned()
+    print("[V] רק העמוד שהשתנה נסרק")
+
+    test_layout_change_rescans()
+    print("[V] תבנית חדשה - סריקה מחדש")
+
+    test_layout_published_during_scan()
+    print("[V] מפה שפורסמה באמצע הסריקה")
+
+    test_identity_resolved_after_lookup()
+    print("[V] פרטי התלמיד נקראים מחדש")
+
+    test_expired_entries_ignored()
+    print("[V] תוקף המטמון נשמר")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת שמירת עמודים לאבחון
+כבוי - שום כתיבה לדיסק; פעיל - רק עמודים שנכשלו או נדגמו, מוקטנים ובתוך המכסה
+"""
+
+import os
+import json
+import tempfile
+
+import cv2
+import numpy as np
+
+from services import scan_diagnostics
+
+
+def page():
+    """עמוד A4 ב-300 DPI עם קצת תוכן"""
+    image = np.full((3508, 2480, 3), 255, dtype=np.uint8)
+    cv2.putText(image, "87", (1200, 2800), cv2.FONT_HERSHEY_SIMPLEX, 8, (0, 0, 0), 20)
+    return image
+
+
+def configure(enabled, sample_rate=0.0, quota_mb=200):
+    directory = tempfile.mkdtemp()
+    scan_diagnostics.SCAN_DIAGNOSTICS = enabled
+    scan_diagnostics.SAMPLE_RATE = sample_rate
+    scan_diagnostics.QUOTA_MB = quota_mb
+    scan_diagnostics.DIAGNOSTICS_DIR = os.path.join(directory, 'scan_diagnostics')
+    return scan_diagnostics.DIAGNOSTICS_DIR
+
+
+def test_disabled_writes_nothing():
+    """ברירת מחדל - גם עמוד שנכשל לא נשמר"""
+    directory = configure(enabled=False)
+    assert scan_diagnostics.capture_page(page(), {'errors': ['No QR code found']}) is None
+    assert not os.path.exists(directory)
+
+
+def test_failed_page_captured_downscaled():
+    """עמוד שנכשל נשמר מוקטן, עם קובץ JSON של התוצאה; עמוד תקין לא נדגם"""
+    configure(enabled=True, sample_rate=0.0)
+
+    assert scan_diagnostics.capture_page(page(), {'errors': []}) is None
+
+    path = scan_diagnostics.capture_page(page(), {'errors': ['No QR code found'], 'qr_dpi': None})
+    saved = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    assert saved.shape[1] == scan_diagnostics.MAX_WIDTH
+
+    with open(path[:-len('.jpg')] + '.json', encoding='utf-8') as f:
+        info = json.load(f)
+    assert info['reason'] == 'failed'
+    assert info['original_size'] == [2480, 3508]
+
+
+def test_quota_removes_oldest():
+    """כשהמכסה מתמלאת - הקבצים הישנים נמחקים"""
+    directory = configure(enabled=True, quota_mb=0.1)
+
+    paths = [scan_diagnostics.capture_page(page(), {'errors': ['x']}) for _ in range(10)]
+    total = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    assert total <= 0.1 * 1024 * 1024
+    assert os.path.exists(paths[-1])
+    assert not os.path.exists(paths[0])
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת שמירת עמודים לאבחון")
+    print("=" * 60)
+
+    test_disabled_writes_nothing()
+    print("[V] כבוי - אין כתיבה לדיסק")
+
+    test_failed_page_captured_downscaled()
+    print("[V] עמוד שנכשל נשמר מוקטן")
+
+    test_quota_removes_oldest()
+    print("[V] המכסה נשמרת")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת מנוע ה-Tesseract הקבוע
+כל thread שומר מנוע טעון אחד, וה-threads של עיבוד העמודים נשארים חיים בין סריקות - כך שהמנוע לא נטען מחדש
+"""
+
+import os
+import tempfile
+import threading
+
+import fitz  # PyMuPDF
+import numpy as np
+import pytesseract
+
+from services import ocr_service, tesseract_backend
+from services.ocr_service import ExamOCRService
+
+
+def make_pdf(pages):
+    """PDF סרוק קטן - עמוד ריק לכל עמוד"""
+    path = os.path.join(tempfile.mkdtemp(), 'scan.pdf')
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page(width=72, height=72)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def scan_workers(service, pdf_path, max_workers=2):
+    """סריקה בנתיב ה-threads - מחזירה לכל עמוד את ה-thread שעיבד אותו ואת מנוע ה-Tesseract שלו"""
+    seen = {}
+    lock = threading.Lock()
+
+    def fake_page(img, dpi=None, render_page=None):
+        # מנוע אחד לכל thread - אותה קריאה ש-image_to_string עושה (None - tesserocr לא עולה כאן)
+        api = tesseract_backend._get_api('eng', None, ())
+        with lock:
+            seen[threading.get_ident()] = api
+        return {'qr_data': None, 'grade': None, 'errors': []}
+
+    service.process_single_page = fake_page
+    results = service._process_pdf_pages(pdf_path, max_workers)
+    assert [r['page_number'] for r in results] == list(range(1, len(results) + 1))
+    return seen
+
+
+def test_workers_survive_between_scans():
+    """סריקה שנייה רצה על אותם threads של הראשונה - ומקבלת את אותם מנועים, בלי לטעון אותם מחדש"""
+    service = ExamOCRService()
+    pdf_path = make_pdf(6)
+
+    first = scan_workers(service, pdf_path)
+    second = scan_workers(service, pdf_path)
+    scan_workers(service, make_pdf(1))
+    third = scan_workers(service, pdf_path)
+
+    assert set(second) <= set(first) and set(third) <= set(first)
+    for ident in set(second) | set(third):
+        engine = second.get(ident, third.get(ident))
+        assert engine is first[ident]
+    assert threading.get_ident() not in first
+
+
+def test_api_per_thread():
+    """אותו thread - אותו מנוע לכל ההגדרות האלה; thread אחר - מנוע משלו"""
+    api = tesseract_backend._get_api('eng', 7, ())
+    if api is None:
+        # tesserocr לא מותקן או שהמנוע לא עולה בסביבה הזו - אין מנוע קבוע לבדוק
+        return
+    other = []
+    thread = threading.Thread(target=lambda: other.append(tesseract_backend._get_api('eng', 7, ())))
+    thread.start()
+    thread.join()
+
+    assert tesseract_backend._get_api('eng', 7, ()) is api
+    assert tesseract_backend._get_api('eng', 6, ()) is not api
+    assert other[0] is not api
+
+
+def test_fallback_when_engine_fails():
+    """tesserocr מותקן אבל המנוע לא עולה (אין tessdata) - הזיהוי עובר ל-pytesseract ולא נכשל"""
+    original = tesseract_backend.tesserocr, tesseract_backend._init_failed, pytesseract.image_to_string
+    calls = []
+
+    class BrokenTesserocr:
+        @staticmethod
+        def PyTessBaseAPI(**kwargs):
+            raise RuntimeError('Failed to init API, possibly an invalid tessdata path')
+
+    tesseract_backend.tesserocr = BrokenTesserocr
+    tesseract_backend._init_failed = False
+    pytesseract.image_to_string = lambda image, lang, config: calls.append(lang) or '42'
+    try:
+        # lang שלא נטען עדיין ב-thread הזה - כדי שהאתחול באמת יקרה
+        assert tesseract_backend.image_to_string(np.zeros((10, 10), dtype=np.uint8), lang='fallback-test') == '42'
+        assert calls == ['fallback-test']
+        assert not tesseract_backend.is_resident()
+    finally:
+        tesseract_backend.tesserocr, tesseract_backend._init_failed, pytesseract.image_to_string = original
+
+
+def test_concurrent_scans_share_pool():
+    """שתי סריקות במקביל - שתיהן רצות על אותו מאגר קבוע, ואף אחת לא מחכה לסיום השנייה"""
+    service = ExamOCRService()
+    pdf_path = make_pdf(4)
+    running = []
+    overlap = threading.Event()
+    lock = threading.Lock()
+
+    def fake_page(img, dpi=None, render_page=None):
+        with lock:
+            running.append(threading.current_thread().name)
+            if len(running) > 1:
+                overlap.set()
+        # עמוד של סריקה אחת מחכה שגם עמוד של הסריקה השנייה יתחיל
+        overlap.wait(timeout=5)
+        return {'qr_data': None, 'grade': None, 'errors': []}
+
+    service.process_single_page = fake_page
+    scans = [threading.Thread(target=service._process_pdf_pages, args=(pdf_path, 1)) for _ in range(2)]
+    for scan in scans:
+        scan.start()
+    for scan in scans:
+        scan.join()
+
+    assert overlap.is_set()
+    assert all(name.startswith('pdf-page-worker') for name in running)
+    assert ocr_service.get_page_pool() is ocr_service.get_page_pool()
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת מנוע ה-Tesseract הקבוע")
+    print("=" * 60)
+
+    test_workers_survive_between_scans()
+    print("[V] threads העיבוד נשארים בין סריקות")
+
+    test_api_per_thread()
+    print("[V] מנוע לכל thread")
+
+    test_fallback_when_engine_fails()
+    print("[V] מעבר ל-pytesseract כשהמנוע לא עולה")
+
+    test_concurrent_scans_share_pool()
+    print("[V] סריקות במקביל על מאגר משותף")
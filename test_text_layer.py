@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת קריאת PDF דיגיטלי משכבת הטקסט
+עמוד שנוצר דיגיטלית נקרא בלי המרה ל-300 DPI ובלי OCR - QR וקטורי וציון שהוקלד
+"""
+
+import os
+import tempfile
+
+import fitz  # PyMuPDF
+
+from services.pdf_generator import ExamPDFGenerator
+from services.ocr_service import ExamOCRService
+
+EXAM = {'id': 7, 'title': 'מבחן בדיקה', 'subject': 'גמרא', 'grade': "ט'"}
+QUESTIONS = [{'question_number': 1, 'question_text': 'שאלה ראשונה', 'points': 100, 'question_type': 'open'}]
+STUDENTS = [{'id': 11, 'name': 'ראובן', 'id_number': '111'}, {'id': 12, 'name': 'שמעון', 'id_number': '222'}]
+
+
+def digital_class_pdf(grades):
+    """
+    PDF כיתתי כמו שמורה ממלא במחשב - בלי metadata (כמו אחרי שמירה מחדש בעורך),
+    עם הציון כהערת טקסט באזור הציון
+
+    Returns:
+        (נתיב ה-PDF, מפת האזורים של התבנית)
+    """
+    generator = ExamPDFGenerator()
+    template = generator.get_exam_template(EXAM, QUESTIONS)
+    layout = generator.layout_manifest(template)
+    region = layout['regions']['grade']
+
+    merged = fitz.open()
+    for student, grade in zip(STUDENTS, grades):
+        with fitz.open(stream=generator.stamp_student_pdf(template, EXAM, student), filetype='pdf') as single:
+            first = len(merged)
+            merged.insert_pdf(single)
+
+        if grade is not None:
+            page = merged[first + region['page']]
+            width, height = page.rect.width, page.rect.height
+            rect = fitz.Rect(region['x0'] * width, region['y0'] * height,
+                             region['x0'] * width + 80, region['y1'] * height)
+            page.add_freetext_annot(rect, grade, fontsize=11)
+
+    merged.set_metadata({})
+    path = os.path.join(tempfile.mkdtemp(), 'class.pdf')
+    merged.save(path)
+    merged.close()
+    return path, layout
+
+
+def test_digital_page_not_scanned():
+    """עמוד דיגיטלי לא מסווג כסרוק; עמוד שכולו תמונה - כן"""
+    path, _ = digital_class_pdf([None, None])
+    scanner = ExamOCRService()
+
+    with fitz.open(path) as doc:
+        assert not scanner.is_scanned_page(doc[0])
+
+        scanned = fitz.open()
+        page = scanned.new_page()
+        pix = doc[0].get_pixmap(dpi=50)
+        page.insert_image(page.rect, pixmap=pix)
+        assert scanner.is_scanned_page(page)
+
+
+def test_scanned_page_in_strips():
+    """עמוד סרוק שנשמר כרצועות - הכיסוי הוא איחוד הרצועות; אותה רצועה פעמיים לא נספרת פעמיים"""
+    scanner = ExamOCRService()
+    pix = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 20, 20), False)
+    pix.clear_with(200)
+
+    strips = fitz.open().new_page()
+    width, height = strips.rect.width, strips.rect.height
+    for i in range(4):
+        strips.insert_image(fitz.Rect(0, i * height / 4, width, (i + 1) * height / 4), pixmap=pix)
+    assert scanner.is_scanned_page(strips)
+
+    # שתי תמונות של 40% מהעמוד באותו מקום - 40% בסך הכל, מתחת לסף
+    stacked = fitz.open().new_page()
+    for _ in range(2):
+        stacked.insert_image(fitz.Rect(0, 0, width, height * 0.4), pixmap=pix)
+    assert not scanner.is_scanned_page(stacked)
+
+
+def test_typed_grades_per_student():
+    """כל תלמיד מזוהה מה-QR הווקטורי, והציון נקרא מההערה שבאזור הציון"""
+    path, layout = digital_class_pdf(['87/100', '92'])
+    scanner = ExamOCRService(layout_lookup=lambda exam_id, version: layout)
+
+    results = scanner.process_pdf(path)
+
+    assert [r['qr_data']['student_id'] for r in results] == [11, 12]
+    assert [r['grade']['score'] for r in results] == [87, 92]
+    assert all(r['text_layer'] and r['confidence'] == 1.0 and not r['errors'] for r in results)
+
+
+def test_missing_grade_reported():
+    """תלמיד בלי ציון מוקלד - מזוהה, ומסומן לבדיקה"""
+    path, layout = digital_class_pdf(['87', None])
+    scanner = ExamOCRService(layout_lookup=lambda exam_id, version: layout)
+
+    results = scanner.process_pdf(path)
+
+    assert results[1]['qr_data']['student_id'] == 12
+    assert results[1]['grade'] is None
+    assert results[1]['errors'] == ['No typed grade found']
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת קריאת PDF דיגיטלי משכבת הטקסט")
+    print("=" * 60)
+
+    test_digital_page_not_scanned()
+    print("[V] סיווג עמוד דיגיטלי / סרוק")
+
+    test_scanned_page_in_strips()
+    print("[V] עמוד סרוק ברצועות")
+
+    test_typed_grades_per_student()
+    print("[V] ציון מוקלד לכל תלמיד")
+
+    test_missing_grade_reported()
+    print("[V] ציון חסר מסומן")
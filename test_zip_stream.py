@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+בדיקת ה-ZIP המוזרם
+הארכיון נכתב ליעד בלי seek, כל קובץ יוצא ברגע שהוא מוכן, ותלמיד שנכשל נרשם ב-errors.txt
+"""
+
+import io
+import zipfile
+
+from services.pdf_generator import ExamPDFGenerator, batch_pdf_filename
+from services.zip_stream import stream_zip, with_error_report
+
+EXAM = {'id': 7, 'title': 'מבחן', 'subject': 'גמרא'}
+QUESTIONS = [{'question_number': 1, 'question_text': 'שאלה', 'points': 100, 'question_type': 'essay'}]
+STUDENTS = [
+    {'id': 3, 'name': 'כהן ראובן', 'id_number': '123456789', 'version': 'A'},
+    # מזהה הקצאה לא מספרי - הטוקן ב-QR לא נוצר והתלמיד נכשל
+    {'id': 5, 'name': 'שבור', 'student_exam_id': 'x'},
+    {'id': 4, 'name': 'לוי שמעון', 'id_number': '987654321', 'version': 'B'},
+]
+
+
+class UnseekableSink:
+    """קובץ יעד שאפשר רק לכתוב אליו - כמו תשובת HTTP מוזרמת"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+
+def batch_results():
+    """(שם קובץ, PDF, שגיאה) לכל תלמיד - כמו iter_batch_pdfs"""
+    for student, pdf_bytes, error in ExamPDFGenerator().iter_batch_exams(EXAM, QUESTIONS, STUDENTS, workers=1):
+        yield batch_pdf_filename(EXAM, student), pdf_bytes, error
+
+
+def test_zip_with_failed_student():
+    """ה-ZIP נפתח מחדש - הקבצים שמורים בלי דחיסה, ותלמיד שנכשל מופיע ב-errors.txt במקום PDF"""
+    results = list(batch_results())
+    progress = []
+    sink = UnseekableSink()
+
+    for chunk in stream_zip(with_error_report(iter(results), lambda done, name: progress.append(done))):
+        sink.write(chunk)
+
+    with zipfile.ZipFile(io.BytesIO(b''.join(sink.chunks))) as archive:
+        assert archive.testzip() is None
+        infos = archive.infolist()
+        assert [info.filename for info in infos] == [results[0][0], results[2][0], 'errors.txt']
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in infos)
+        assert archive.read(results[0][0]) == results[0][1]
+        assert archive.read(results[2][0]) == results[2][1]
+
+        errors = archive.read('errors.txt').decode('utf-8')
+        assert errors.startswith(results[1][0] + ': ') and results[1][2] in errors
+
+    assert progress == [1, 2, 3]
+
+
+def test_entries_streamed_as_ready():
+    """כל קובץ יוצא כחלק לפני שהקובץ הבא מתבקש - הארכיון לא נצבר בזיכרון"""
+    requested = []
+
+    def entries():
+        for i in range(3):
+            requested.append(i)
+            yield f'{i}.pdf', b'%PDF' * 100
+
+    chunks = stream_zip(entries())
+    first = next(chunks)
+
+    assert requested == [0]
+    assert b'0.pdf' in first and len(first) >= 400
+    rest = list(chunks)
+    assert requested == [0, 1, 2]
+    with zipfile.ZipFile(io.BytesIO(first + b''.join(rest))) as archive:
+        assert archive.namelist() == ['0.pdf', '1.pdf', '2.pdf']
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("בדיקת ה-ZIP המוזרם")
+    print("=" * 60)
+
+    test_zip_with_failed_student()
+    print("[V] ZIP עם תלמיד שנכשל")
+
+    test_entries_streamed_as_ready()
+    print("[V] הזרמה קובץ אחר קובץ")